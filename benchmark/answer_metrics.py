@@ -0,0 +1,265 @@
+"""Vectorized scoring of results over one flat array per answer field.
+
+`AnswerTable` flattens a results tree (or a Parquet file from results_columnar)
+once into arrays with one entry per answer, with answers of a chain kept
+contiguous and in their stored order. `ChainTotals` then applies the score
+thresholds to the whole table at once and sums embedding, coherence and answer
+counts per (model, temperature, question) under the two rules used in plot.py:
+
+- `all_passing`: every answer that clears both thresholds counts.
+- `until_failure`: answers count only up to a chain's first failing answer,
+  found with a cumulative sum of failures within each chain.
+
+Every per-model, per-temperature, per-cluster and per-question aggregate is a
+sum or max over those (model, temperature, question) totals.
+
+`ThresholdGrid` precomputes thresholds.py's per-model `count_answers` for every
+integer threshold pair, so moving its sliders is a lookup.
+"""
+import numpy as np
+
+
+class AnswerTable:
+    """Per-answer arrays for a whole results set."""
+
+    def __init__(self, models: list, pairs: list, questions: list, chain_pair: np.ndarray,
+                 chain_question: np.ndarray, chain_starts: np.ndarray,
+                 embedding: np.ndarray, coherence: np.ndarray):
+        self.models = models                  # model names in first-seen order, with or without answers
+        self.pairs = pairs                    # (model, temperature) in first-seen order
+        self.questions = questions            # question strings in first-seen order
+        self.chain_pair = chain_pair          # index into pairs, per chain
+        self.chain_question = chain_question  # index into questions, per chain
+        self.chain_starts = chain_starts      # first answer row of each chain
+        self.embedding = embedding
+        self.coherence = coherence
+        self._totals = {}
+
+    @classmethod
+    def from_results(cls, results: dict) -> 'AnswerTable':
+        builder = _TableBuilder()
+        for model, temps in results['models'].items():
+            builder.register_model(model)
+            for temperature, questions in temps.items():
+                builder.register_pair(model, temperature)
+                for question, answers in questions.items():
+                    builder.add_chain(model, temperature, question, answers)
+        return builder.build()
+
+    @classmethod
+    def from_parquet(cls, parquet_path: str) -> 'AnswerTable':
+        from results_columnar import load_arrays
+
+        arrays = load_arrays(parquet_path, columns=(
+            'model', 'temperature', 'question', 'coherence_score', 'embedding_dissimilarity_score'))
+        keys = np.stack([arrays['model'], arrays['temperature'], arrays['question']], axis=1)
+        # Chains are stored contiguously, so a new chain starts wherever the key changes
+        starts = np.flatnonzero(np.r_[len(keys) > 0, np.any(keys[1:] != keys[:-1], axis=1)])
+
+        builder = _TableBuilder()
+        models, temps, questions = (arrays['model_categories'], arrays['temperature_categories'],
+                                    arrays['question_categories'])
+        for m, t, q in keys[starts]:
+            builder.register_chain(models[m], temps[t], questions[q])
+        builder.embedding = arrays['embedding_dissimilarity_score']
+        builder.coherence = arrays['coherence_score']
+        builder.starts = starts
+        return builder.build()
+
+    @property
+    def num_chains(self) -> int:
+        return len(self.chain_starts)
+
+    def pair_models(self) -> np.ndarray:
+        """Index into `self.models` of each (model, temperature) pair."""
+        index = {model: i for i, model in enumerate(self.models)}
+        return np.array([index[model] for model, _ in self.pairs], dtype=np.int64)
+
+    def chain_ids(self) -> np.ndarray:
+        """Chain index of every answer row."""
+        lengths = np.diff(np.r_[self.chain_starts, len(self.embedding)])
+        return np.repeat(np.arange(self.num_chains), lengths)
+
+    def chain_min_coherence(self) -> np.ndarray:
+        """Lowest coherence score in each chain (inf for a chain with no answers)."""
+        minimum = np.full(self.num_chains, np.inf)
+        np.minimum.at(minimum, self.chain_ids(), self.coherence)
+        return minimum
+
+    def question_mask(self, questions) -> np.ndarray:
+        """Boolean mask over `self.questions` selecting those in `questions`."""
+        wanted = set(questions)
+        return np.array([q in wanted for q in self.questions], dtype=bool)
+
+    def totals(self, min_embedding_threshold: float = 0.15,
+               min_coherence_threshold: float = 15.0) -> 'ChainTotals':
+        """Totals for one pair of thresholds, computed once per pair."""
+        key = (min_embedding_threshold, min_coherence_threshold)
+        if key not in self._totals:
+            self._totals[key] = ChainTotals(self, *key)
+        return self._totals[key]
+
+
+class ChainTotals:
+    """Scores summed per chain for one pair of thresholds, under both counting rules.
+
+    Each rule maps to a dict of arrays shaped (len(pairs), len(questions)):
+    'embedding' (sum of embedding scores), 'coherence' (sum of coherence / 100)
+    and 'answers' (count). Pairs that never asked a question have zeros there.
+    """
+
+    def __init__(self, table: AnswerTable, min_embedding_threshold: float, min_coherence_threshold: float):
+        self.table = table
+        passing = ((table.embedding >= min_embedding_threshold) &
+                   (table.coherence >= min_coherence_threshold))
+
+        # Failures up to and including each row, then restarted at every chain start
+        failures = np.cumsum(~passing)
+        failures_before = np.r_[0, failures][table.chain_starts]
+        chain_ids = table.chain_ids()
+        until_failure = (failures - failures_before[chain_ids]) == 0
+
+        self.all_passing = self._sum(passing, chain_ids)
+        self.until_failure = self._sum(passing & until_failure, chain_ids)
+
+    def _sum(self, mask: np.ndarray, chain_ids: np.ndarray) -> dict:
+        table = self.table
+        cell = table.chain_pair * len(table.questions) + table.chain_question
+        shape = (len(table.pairs), len(table.questions))
+        rows = cell[chain_ids[mask]]
+        size = shape[0] * shape[1]
+        return {
+            'embedding': np.bincount(rows, weights=table.embedding[mask], minlength=size).reshape(shape),
+            'coherence': np.bincount(rows, weights=table.coherence[mask] / 100, minlength=size).reshape(shape),
+            'answers': np.bincount(rows, minlength=size).reshape(shape),
+        }
+
+
+class _TableBuilder:
+    def __init__(self):
+        self.models, self.pairs, self.questions = [], [], []
+        self._model_index, self._pair_index, self._question_index = {}, {}, {}
+        self.chain_pair, self.chain_question = [], []
+        self.starts, self.embedding, self.coherence = [], [], []
+        self._rows = 0
+
+    def register_model(self, model: str) -> int:
+        if model not in self._model_index:
+            self._model_index[model] = len(self.models)
+            self.models.append(model)
+        return self._model_index[model]
+
+    def register_pair(self, model: str, temperature: str) -> int:
+        self.register_model(model)
+        pair = (model, temperature)
+        if pair not in self._pair_index:
+            self._pair_index[pair] = len(self.pairs)
+            self.pairs.append(pair)
+        return self._pair_index[pair]
+
+    def register_chain(self, model: str, temperature: str, question: str) -> None:
+        pair = self.register_pair(model, temperature)
+        if question not in self._question_index:
+            self._question_index[question] = len(self.questions)
+            self.questions.append(question)
+        self.chain_pair.append(pair)
+        self.chain_question.append(self._question_index[question])
+
+    def add_chain(self, model: str, temperature: str, question: str, answers: list) -> None:
+        self.register_chain(model, temperature, question)
+        self.starts.append(self._rows)
+        self._rows += len(answers)
+        self.embedding.extend(answer['embedding_dissimilarity_score'] for answer in answers)
+        self.coherence.extend(answer['coherence_score'] for answer in answers)
+
+    def build(self) -> AnswerTable:
+        return AnswerTable(
+            self.models, self.pairs, self.questions,
+            np.asarray(self.chain_pair, dtype=np.int64),
+            np.asarray(self.chain_question, dtype=np.int64),
+            np.asarray(self.starts, dtype=np.int64),
+            np.asarray(self.embedding, dtype=np.float64),
+            np.asarray(self.coherence, dtype=np.float64),
+        )
+
+
+def count_answers(data, coherence_threshold=80, dissimilarity_threshold=80):
+    """
+    For each model and each question, count answers sequentially until an answer
+    fails either the coherence or dissimilarity threshold.
+    
+    Parameters:
+      - coherence_threshold: minimum coherence_score required.
+      - dissimilarity_threshold: minimum (embedding_dissimilarity_score*100) required.
+    
+    Returns:
+      A dict mapping model names to total valid answer counts.
+    """
+    counts = {}
+    for model, threshold_groups in data.get('models', {}).items():
+        total_count = 0
+        for group_key, questions in threshold_groups.items():
+            for question, answers in questions.items():
+                # Ensure answers are processed in order
+                answers_sorted = sorted(answers, key=lambda a: a.get('answer_num', 0))
+                for ans in answers_sorted:
+                    if (ans.get('coherence_score', 0) < coherence_threshold or 
+                        ans.get('embedding_dissimilarity_score', 0) * 100 < dissimilarity_threshold):
+                        # Stop counting further answers for this question.
+                        break
+                    total_count += 1
+        counts[model] = total_count
+    return counts
+
+
+class ThresholdGrid:
+    """
+    Precomputed `count_answers` results for every integer threshold pair in 0-100.
+
+    An answer is counted exactly when the running minimum of coherence and of
+    dissimilarity*100 along its chain (in answer_num order) both clear the thresholds.
+    Each answer is bucketed by the floor of those two running minima, and a reverse
+    2-D cumulative sum of the buckets gives the count for every threshold pair,
+    so a lookup no longer depends on the size of the data.
+    """
+    SIZE = 101  # thresholds 0..100
+
+    def __init__(self, data):
+        self.models = list(data.get('models', {}))
+        coherence, dissimilarity, chain_ids, answer_models = [], [], [], []
+        num_chains = 0
+        for model_index, threshold_groups in enumerate(data.get('models', {}).values()):
+            for questions in threshold_groups.values():
+                for answers in questions.values():
+                    for ans in sorted(answers, key=lambda a: a.get('answer_num', 0)):
+                        coherence.append(ans.get('coherence_score', 0))
+                        dissimilarity.append(ans.get('embedding_dissimilarity_score', 0) * 100)
+                        chain_ids.append(num_chains)
+                        answer_models.append(model_index)
+                    num_chains += 1
+
+        chain_ids = np.asarray(chain_ids, dtype=np.int64)
+        coherence_bins = self._running_min_bins(np.asarray(coherence, dtype=np.float64), chain_ids)
+        dissimilarity_bins = self._running_min_bins(np.asarray(dissimilarity, dtype=np.float64), chain_ids)
+
+        # Bin -1 holds answers below every threshold; they never count
+        keep = (coherence_bins >= 0) & (dissimilarity_bins >= 0)
+        cells = ((np.asarray(answer_models, dtype=np.int64)[keep] * self.SIZE + coherence_bins[keep]) * self.SIZE
+                 + dissimilarity_bins[keep])
+        histogram = np.bincount(cells, minlength=len(self.models) * self.SIZE ** 2)
+        histogram = histogram.reshape(len(self.models), self.SIZE, self.SIZE)
+        # grid[m, c, d] = answers of model m whose running minima are >= (c, d)
+        self.grid = histogram[:, ::-1, ::-1].cumsum(axis=1).cumsum(axis=2)[:, ::-1, ::-1]
+
+    def _running_min_bins(self, values, chain_ids):
+        """Floor of the running minimum within each chain, clipped to -1..100."""
+        bins = np.clip(np.floor(values), -1, self.SIZE - 1).astype(np.int64)
+        # Shift each chain below all earlier ones so one global running minimum restarts per chain
+        offset = (self.SIZE + 1) * chain_ids
+        return np.minimum.accumulate(bins - offset) + offset if len(bins) else bins
+
+    def counts(self, coherence_threshold, dissimilarity_threshold):
+        """Same result as `count_answers` for thresholds in 0-100."""
+        c = int(np.clip(np.ceil(coherence_threshold), 0, self.SIZE - 1))
+        d = int(np.clip(np.ceil(dissimilarity_threshold), 0, self.SIZE - 1))
+        return {model: int(count) for model, count in zip(self.models, self.grid[:, c, d])}
@@ -1,9 +1,25 @@
 from prompts import *
+import asyncio
+import os
+import random
 import time
 import concurrent.futures
 import numpy as np
 from colorama import Fore, Style
-from models import embed
+from models import embed, aembed, EMBEDDING_DTYPE
+from prompt_builder import AnswerPromptBuilder
+from context_budget import CONTEXT_STOP_REASON, prompt_budget
+from telemetry import CallTelemetry, arun, bind, reset_telemetry, use_telemetry
+from novelty import NoveltyMatrix, build_novelty_index, index_memory_stats
+from llm_prefilter import select_candidates, prefilter_stats
+
+# Pairwise LLM similarity judging for every chain shares one bounded pool, and each
+# chain keeps at most SIMILARITY_JUDGE_WINDOW comparisons queued at a time.
+SIMILARITY_JUDGE_WORKERS = int(os.environ.get("SIMILARITY_JUDGE_WORKERS", 32))
+SIMILARITY_JUDGE_WINDOW = int(os.environ.get("SIMILARITY_JUDGE_WINDOW", 8))
+_similarity_judge_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=SIMILARITY_JUDGE_WORKERS, thread_name_prefix='similarity-judge')
+_NO_MORE_ANSWERS = object()
 
 
 def benchmark_question(
@@ -13,78 +29,301 @@ def benchmark_question(
     previous_answers: list,
     chain_of_thought: bool = False,
     use_llm: bool = False,
-    thresholds: dict = None
+    thresholds: dict = None,
+    pipeline: bool = False,
+    speculative: bool = False,
+    on_answer=None,
+    llm_prefilter: dict = None,
+    novelty_backend: str = 'exact',
+    embedding_dimensions: int = None,
+    context_policy: str = 'stop',
+    max_context_tokens: int = None
 ):
+    """Generate and score answers for one question until the chain terminates.
+
+    With `pipeline`, the coherence judge and embedding calls for each answer run
+    concurrently. With `speculative` as well, answer k+1 is generated while answer k
+    is being judged and is discarded if answer k turns out to end the chain.
+    `on_answer`, if given, is called with each answer record as soon as it is scored.
+    `llm_prefilter` ({'top_k', 'min_cosine', 'audit_rate'}) limits LLM similarity
+    judging to the previous answers nearest in embedding space; see llm_prefilter.py.
+    `novelty_backend` picks the embedding novelty index ('exact', 'ivf' or 'verify');
+    see novelty.py. `embedding_dimensions` shortens the novelty embeddings.
+    `context_policy` ('stop' or 'compress') decides what happens once the answer
+    prompt outgrows the model's context budget; see context_budget.py. The answer
+    that ends the chain carries the reason in its 'stop_reason' field.
+    Each answer record stores the telemetry of the calls made for it; see telemetry.py.
+    """
     start_time = time.time()
     answer_num = len(previous_answers) + 1
-    total_novelty_score = 0.0
-    total_coherence_score = 0.0
     new_answers_data = []
+    token_budget = prompt_budget(model_name, max_context_tokens)
+    prompt_builder = _chain_prompt_builder(question, chain_of_thought, context_policy, token_budget)
+    if _over_context_budget(prompt_builder, previous_answers, context_policy, token_budget):
+        print(f"{Fore.YELLOW}Previous answers already exceed the context budget for {model_name}; "
+              f"not continuing this chain.{Style.RESET_ALL}")
+        return new_answers_data
+    novelty_matrix = build_novelty_index(
+        (embed(answer, embedding_dimensions) for answer in previous_answers),
+        novelty_backend, _embedding_stop_novelty(thresholds), EMBEDDING_DTYPE)
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=3) if pipeline else None
+    next_answer_future = None
+    next_answer_telemetry = None
+    # Each iteration points this thread's telemetry at the answer being produced
+    telemetry_token = use_telemetry(None)
+
+    try:
+        while True:
+            try:
+                answer_telemetry = next_answer_telemetry or CallTelemetry()
+                next_answer_telemetry = None
+                use_telemetry(answer_telemetry)
+                if next_answer_future is not None:
+                    new_answer = next_answer_future.result()
+                    next_answer_future = None
+                else:
+                    new_answer = gen_answer(
+                        question,
+                        previous_answers,
+                        model_name,
+                        chain_of_thought,
+                        prompt_builder
+                    )
+
+                if pipeline:
+                    coherence_future = executor.submit(
+                        bind(judge_answer), question, new_answer, model_name='o1-mini')
+                    embedding_future = executor.submit(bind(embed), new_answer, embedding_dimensions)
+                    if speculative and not _over_context_budget(
+                            prompt_builder, previous_answers + [new_answer], context_policy, token_budget):
+                        next_answer_telemetry = CallTelemetry()
+                        next_answer_future = executor.submit(
+                            bind(gen_answer, next_answer_telemetry), question, previous_answers + [new_answer],
+                            model_name, chain_of_thought, prompt_builder)
+                    coherence_score = coherence_future.result()
+                    new_embedding = embedding_future.result()
+                else:
+                    coherence_score = judge_answer(
+                        question, new_answer, model_name='o1-mini'
+                    )
+                    new_embedding = embed(new_answer, embedding_dimensions)
+
+                novelty_scores = _check_similarity(
+                    question, new_answer, new_embedding, previous_answers,
+                    novelty_matrix, use_llm, thresholds, llm_prefilter
+                )
 
-    while True:
-        try:
-            new_answer = gen_answer(
-                question,
-                previous_answers,
-                model_name,
-                chain_of_thought
-            )
-            coherence_score = judge_answer(
-                question, new_answer, model_name='o1-mini'
-            )
-
-            novelty_scores = _check_similarity(
-                question, new_answer, previous_answers, use_llm
-            )
-            embedding_novelty_score = novelty_scores['embedding_novelty_score']
-            total_novelty_score += embedding_novelty_score
-
-            if use_llm:
-                llm_novelty_score = novelty_scores['llm_novelty_score']
-
-            total_coherence_score += coherence_score
-
-            answer_data = {
-                'answer_num': answer_num,
-                'answer': new_answer,
-                'embedding_dissimilarity_score': embedding_novelty_score,
-                'coherence_score': coherence_score,
-                'processing_time': time.time() - start_time
-            }
-
-            if use_llm:
-                answer_data['llm_dissimilarity_score'] = llm_novelty_score
-
-            new_answers_data.append(answer_data)
-            previous_answers.append(new_answer)
-
-            print(
-                f"Using {model_name} with temperature {temperature}\n"
-                f"{Fore.CYAN}Question: {question}{Style.RESET_ALL}\n"
-                f"{Fore.GREEN}Answer #{answer_num}: {new_answer}{Style.RESET_ALL}\n"
-                f"{Fore.MAGENTA}Coherence Score: {coherence_score}{Style.RESET_ALL}\n"
-                f"{Fore.BLUE}Embedding Dissimilarity Score: {embedding_novelty_score:.2f}{Style.RESET_ALL}\n"
-                f"{f'{Fore.BLUE}LLM Dissimilarity Score: {llm_novelty_score:.2f}{Style.RESET_ALL}' if use_llm else ''}\n"
-            )
-
-            answer_num += 1
-
-            if (coherence_score <= thresholds['coherence_score'] or 
-                embedding_novelty_score < thresholds['embedding_dissimilarity_score'] or
-                (use_llm and llm_novelty_score < thresholds['llm_dissimilarity_score'])):
-                print(f"Breaking after {answer_num} answers.")
+                answer_data = _build_answer_data(
+                    answer_num, new_answer, coherence_score, novelty_scores, start_time, use_llm)
+                answer_data['telemetry'] = answer_telemetry.summary()
+                previous_answers.append(new_answer)
+                novelty_matrix.add(new_embedding)
+                stop_reason = _stop_reason(answer_data, use_llm, thresholds)
+                if stop_reason is None and _over_context_budget(
+                        prompt_builder, previous_answers, context_policy, token_budget):
+                    stop_reason = CONTEXT_STOP_REASON
+                if stop_reason is not None:
+                    answer_data['stop_reason'] = stop_reason
+                new_answers_data.append(answer_data)
+                if on_answer is not None:
+                    on_answer(answer_data)
+
+                _print_answer(question, model_name, temperature, answer_data, use_llm)
+                answer_num += 1
+
+                if stop_reason is not None:
+                    print(f"Breaking after {answer_num} answers ({stop_reason}).")
+                    break
+
+            except Exception as e:
+                print(f"{Fore.RED}Error processing question: {str(e)}{Style.RESET_ALL}")
                 break
+    finally:
+        reset_telemetry(telemetry_token)
+        index_memory_stats.record(novelty_matrix.nbytes())
+        if executor is not None:
+            # Drop any speculative answer still being generated for a finished chain
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    return new_answers_data
 
-        except Exception as e:
-            print(f"{Fore.RED}Error processing question: {str(e)}{Style.RESET_ALL}")
-            break
+
+async def abenchmark_question(
+    question: str,
+    model_name: str,
+    temperature: float,
+    previous_answers: list,
+    chain_of_thought: bool = False,
+    use_llm: bool = False,
+    thresholds: dict = None,
+    pipeline: bool = False,
+    speculative: bool = False,
+    on_answer=None,
+    llm_prefilter: dict = None,
+    novelty_backend: str = 'exact',
+    embedding_dimensions: int = None,
+    context_policy: str = 'stop',
+    max_context_tokens: int = None
+):
+    """Async counterpart of benchmark_question with identical chain semantics."""
+    start_time = time.time()
+    answer_num = len(previous_answers) + 1
+    new_answers_data = []
+    token_budget = prompt_budget(model_name, max_context_tokens)
+    prompt_builder = _chain_prompt_builder(question, chain_of_thought, context_policy, token_budget)
+    if _over_context_budget(prompt_builder, previous_answers, context_policy, token_budget):
+        print(f"{Fore.YELLOW}Previous answers already exceed the context budget for {model_name}; "
+              f"not continuing this chain.{Style.RESET_ALL}")
+        return new_answers_data
+    novelty_matrix = build_novelty_index(
+        await asyncio.gather(*(aembed(answer, embedding_dimensions) for answer in previous_answers)),
+        novelty_backend, _embedding_stop_novelty(thresholds), EMBEDDING_DTYPE)
+    next_answer_task = None
+    next_answer_telemetry = None
+    telemetry_token = use_telemetry(None)
+
+    try:
+        while True:
+            try:
+                answer_telemetry = next_answer_telemetry or CallTelemetry()
+                next_answer_telemetry = None
+                use_telemetry(answer_telemetry)
+                if next_answer_task is not None:
+                    new_answer = await next_answer_task
+                    next_answer_task = None
+                else:
+                    new_answer = await agen_answer(
+                        question,
+                        previous_answers,
+                        model_name,
+                        chain_of_thought,
+                        prompt_builder
+                    )
+
+                if pipeline:
+                    if speculative and not _over_context_budget(
+                            prompt_builder, previous_answers + [new_answer], context_policy, token_budget):
+                        next_answer_telemetry = CallTelemetry()
+                        next_answer_task = asyncio.ensure_future(arun(next_answer_telemetry, agen_answer(
+                            question, previous_answers + [new_answer],
+                            model_name, chain_of_thought, prompt_builder)))
+                    coherence_score, new_embedding = await asyncio.gather(
+                        ajudge_answer(question, new_answer, model_name='o1-mini'),
+                        aembed(new_answer, embedding_dimensions)
+                    )
+                else:
+                    coherence_score = await ajudge_answer(
+                        question, new_answer, model_name='o1-mini'
+                    )
+                    new_embedding = await aembed(new_answer, embedding_dimensions)
+
+                novelty_scores = await _acheck_similarity(
+                    question, new_answer, new_embedding, previous_answers,
+                    novelty_matrix, use_llm, thresholds, llm_prefilter
+                )
+
+                answer_data = _build_answer_data(
+                    answer_num, new_answer, coherence_score, novelty_scores, start_time, use_llm)
+                answer_data['telemetry'] = answer_telemetry.summary()
+                previous_answers.append(new_answer)
+                novelty_matrix.add(new_embedding)
+                stop_reason = _stop_reason(answer_data, use_llm, thresholds)
+                if stop_reason is None and _over_context_budget(
+                        prompt_builder, previous_answers, context_policy, token_budget):
+                    stop_reason = CONTEXT_STOP_REASON
+                if stop_reason is not None:
+                    answer_data['stop_reason'] = stop_reason
+                new_answers_data.append(answer_data)
+                if on_answer is not None:
+                    on_answer(answer_data)
+
+                _print_answer(question, model_name, temperature, answer_data, use_llm)
+                answer_num += 1
+
+                if stop_reason is not None:
+                    print(f"Breaking after {answer_num} answers ({stop_reason}).")
+                    break
+
+            except Exception as e:
+                print(f"{Fore.RED}Error processing question: {str(e)}{Style.RESET_ALL}")
+                break
+    finally:
+        reset_telemetry(telemetry_token)
+        index_memory_stats.record(novelty_matrix.nbytes())
+        if next_answer_task is not None:
+            next_answer_task.cancel()
 
     return new_answers_data
 
 # Private helper functions
 
 
-def _check_similarity(question: str, new_answer: str, previous_answers: list, use_llm: bool) -> dict:
+def _build_answer_data(answer_num: int, new_answer: str, coherence_score: int,
+                       novelty_scores: dict, start_time: float, use_llm: bool) -> dict:
+    answer_data = {
+        'answer_num': answer_num,
+        'answer': new_answer,
+        'embedding_dissimilarity_score': novelty_scores['embedding_novelty_score'],
+        'coherence_score': coherence_score,
+        'processing_time': time.time() - start_time
+    }
+
+    if use_llm:
+        answer_data['llm_dissimilarity_score'] = novelty_scores['llm_novelty_score']
+
+    return answer_data
+
+
+def _print_answer(question: str, model_name: str, temperature: float, answer_data: dict, use_llm: bool) -> None:
+    llm_novelty_line = (
+        f"{Fore.BLUE}LLM Dissimilarity Score: {answer_data['llm_dissimilarity_score']:.2f}{Style.RESET_ALL}"
+        if use_llm else ''
+    )
+    print(
+        f"Using {model_name} with temperature {temperature}\n"
+        f"{Fore.CYAN}Question: {question}{Style.RESET_ALL}\n"
+        f"{Fore.GREEN}Answer #{answer_data['answer_num']}: {answer_data['answer']}{Style.RESET_ALL}\n"
+        f"{Fore.MAGENTA}Coherence Score: {answer_data['coherence_score']}{Style.RESET_ALL}\n"
+        f"{Fore.BLUE}Embedding Dissimilarity Score: {answer_data['embedding_dissimilarity_score']:.2f}{Style.RESET_ALL}\n"
+        f"{llm_novelty_line}\n"
+    )
+
+
+def _stop_reason(answer_data: dict, use_llm: bool, thresholds: dict) -> str | None:
+    """Which score, if any, ends the chain at this answer."""
+    if answer_data['coherence_score'] <= thresholds['coherence_score']:
+        return 'coherence'
+    if answer_data['embedding_dissimilarity_score'] < thresholds['embedding_dissimilarity_score']:
+        return 'embedding_novelty'
+    if use_llm and answer_data['llm_dissimilarity_score'] < thresholds['llm_dissimilarity_score']:
+        return 'llm_novelty'
+    return None
+
+
+def context_budget_exhausted(question: str, model_name: str, previous_answers: list,
+                             chain_of_thought: bool = False, context_policy: str = 'stop',
+                             max_context_tokens: int = None) -> bool:
+    """Whether a chain's stored answers already leave no room for another answer under the 'stop' policy."""
+    token_budget = prompt_budget(model_name, max_context_tokens)
+    prompt_builder = _chain_prompt_builder(question, chain_of_thought, context_policy, token_budget)
+    return _over_context_budget(prompt_builder, previous_answers, context_policy, token_budget)
+
+
+def _chain_prompt_builder(question: str, chain_of_thought: bool, context_policy: str,
+                          token_budget: int) -> AnswerPromptBuilder:
+    return AnswerPromptBuilder(
+        question, chain_of_thought, token_budget if context_policy == 'compress' else None)
+
+
+def _over_context_budget(prompt_builder: AnswerPromptBuilder, answers: list, context_policy: str,
+                         token_budget: int) -> bool:
+    """Whether the prompt after `answers` is too large to send under the 'stop' policy."""
+    return context_policy == 'stop' and prompt_builder.prompt_tokens(answers) > token_budget
+
+
+def _check_similarity(question: str, new_answer: str, new_embedding, previous_answers: list,
+                      novelty_matrix: NoveltyMatrix, use_llm: bool, thresholds: dict = None,
+                      llm_prefilter: dict = None) -> dict:
     similarity_scores = {}
 
     if not previous_answers:
@@ -93,30 +332,161 @@ def _check_similarity(question: str, new_answer: str, previous_answers: list, us
             similarity_scores['llm_novelty_score'] = 1.0
         return similarity_scores
 
-    embedding_novelty_score = _get_novelty_score(new_answer, previous_answers)
+    embedding_novelty_score, embedding_similarities = _get_novelty_score(new_embedding, novelty_matrix)
     similarity_scores['embedding_novelty_score'] = embedding_novelty_score
 
     if use_llm:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=len(previous_answers)) as executor:
-            similarities = list(executor.map(
-                lambda prev_answer: judge_similarity(
-                    question, new_answer, prev_answer, judge_model='o1-mini'),
-                previous_answers
-            ))
-        llm_novelty_score = 1 - max(similarities)
+        stop_similarity = _llm_stop_similarity(thresholds)
+        candidates = _llm_candidates(new_embedding, novelty_matrix, llm_prefilter, embedding_similarities)
+        similarities = _judge_similarities(
+            question, new_answer, [previous_answers[i] for i in candidates], stop_similarity)
+        llm_novelty_score = _llm_novelty(similarities)
         similarity_scores['llm_novelty_score'] = llm_novelty_score
 
+        if llm_prefilter and random.random() < llm_prefilter.get('audit_rate', 0.0):
+            full_similarities = _judge_similarities(question, new_answer, previous_answers)
+            _record_prefilter_audit(candidates, full_similarities, llm_novelty_score, thresholds)
+
     return similarity_scores
 
 
-def _get_novelty_score(new_answer: str, previous_answers: list) -> float:
-    new_embedding = embed(new_answer)
-    previous_embeddings = [embed(answer) for answer in previous_answers]
+async def _acheck_similarity(question: str, new_answer: str, new_embedding, previous_answers: list,
+                             novelty_matrix: NoveltyMatrix, use_llm: bool, thresholds: dict = None,
+                             llm_prefilter: dict = None) -> dict:
+    similarity_scores = {}
+
+    if not previous_answers:
+        similarity_scores['embedding_novelty_score'] = 1.0
+        if use_llm:
+            similarity_scores['llm_novelty_score'] = 1.0
+        return similarity_scores
+
+    embedding_novelty_score, embedding_similarities = _get_novelty_score(new_embedding, novelty_matrix)
+    similarity_scores['embedding_novelty_score'] = embedding_novelty_score
+
+    if use_llm:
+        stop_similarity = _llm_stop_similarity(thresholds)
+        candidates = _llm_candidates(new_embedding, novelty_matrix, llm_prefilter, embedding_similarities)
+        similarities = await _ajudge_similarities(
+            question, new_answer, [previous_answers[i] for i in candidates], stop_similarity)
+        llm_novelty_score = _llm_novelty(similarities)
+        similarity_scores['llm_novelty_score'] = llm_novelty_score
+
+        if llm_prefilter and random.random() < llm_prefilter.get('audit_rate', 0.0):
+            full_similarities = await _ajudge_similarities(question, new_answer, previous_answers)
+            _record_prefilter_audit(candidates, full_similarities, llm_novelty_score, thresholds)
+
+    return similarity_scores
+
+
+def _embedding_stop_novelty(thresholds: dict):
+    return thresholds['embedding_dissimilarity_score'] if thresholds else None
+
+
+def _llm_stop_similarity(thresholds: dict):
+    # Any pairwise similarity above this already ends the chain on LLM novelty
+    if not thresholds:
+        return None
+    return 1 - thresholds['llm_dissimilarity_score']
+
+
+def _llm_candidates(new_embedding, novelty_matrix: NoveltyMatrix, llm_prefilter: dict,
+                    similarities=None) -> list[int]:
+    """Previous answers to judge, nearest first in embedding space.
+
+    `similarities` is the new answer's cosine against every previous one, if the
+    novelty check already computed it.
+    """
+    if similarities is None:
+        similarities = novelty_matrix.similarities(new_embedding)
+    candidates = select_candidates(
+        similarities,
+        top_k=llm_prefilter.get('top_k') if llm_prefilter else None,
+        min_cosine=llm_prefilter.get('min_cosine') if llm_prefilter else None
+    )
+    if llm_prefilter:
+        prefilter_stats.record(len(candidates), len(novelty_matrix))
+    return candidates
+
+
+def _llm_novelty(similarities: dict) -> float:
+    # With a prefilter, no candidates means nothing was close enough to be judged similar
+    return 1 - max(similarities.values(), default=0.0)
+
+
+def _record_prefilter_audit(candidates: list[int], full_similarities: dict,
+                            llm_novelty_score: float, thresholds: dict) -> None:
+    full_max = max(full_similarities.values())
+    most_similar = {i for i, similarity in full_similarities.items() if similarity == full_max}
+    threshold = thresholds['llm_dissimilarity_score'] if thresholds else 0.0
+    prefilter_stats.record_audit(
+        recalled=bool(most_similar & set(candidates)),
+        decision_matched=(1 - full_max < threshold) == (llm_novelty_score < threshold)
+    )
+
+
+def _judge_similarities(question: str, new_answer: str, previous_answers: list,
+                        stop_similarity: float = None) -> dict:
+    """Judge `new_answer` against previous answers on the shared pool.
+
+    Returns {position in previous_answers: similarity}. Returns early, cancelling
+    the comparisons that haven't started, as soon as one similarity exceeds
+    `stop_similarity`; the resulting novelty is then already below the threshold,
+    so the chain ends exactly as it would with every comparison.
+    """
+    remaining = enumerate(previous_answers)
+    pending = {}
+    similarities = {}
+    try:
+        while True:
+            while len(pending) < SIMILARITY_JUDGE_WINDOW:
+                index, prev_answer = next(remaining, (None, _NO_MORE_ANSWERS))
+                if prev_answer is _NO_MORE_ANSWERS:
+                    break
+                future = _similarity_judge_executor.submit(
+                    bind(judge_similarity), question, new_answer, prev_answer, model_name='o1-mini')
+                pending[future] = index
+            if not pending:
+                return similarities
+
+            done, _ = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                similarities[pending.pop(future)] = future.result()
+            if stop_similarity is not None and max(similarities.values()) > stop_similarity:
+                return similarities
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+async def _ajudge_similarities(question: str, new_answer: str, previous_answers: list,
+                               stop_similarity: float = None) -> dict:
+    remaining = enumerate(previous_answers)
+    pending = {}
+    similarities = {}
+    try:
+        while True:
+            while len(pending) < SIMILARITY_JUDGE_WINDOW:
+                index, prev_answer = next(remaining, (None, _NO_MORE_ANSWERS))
+                if prev_answer is _NO_MORE_ANSWERS:
+                    break
+                task = asyncio.ensure_future(
+                    ajudge_similarity(question, new_answer, prev_answer, model_name='o1-mini'))
+                pending[task] = index
+            if not pending:
+                return similarities
+
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                similarities[pending.pop(task)] = task.result()
+            if stop_similarity is not None and max(similarities.values()) > stop_similarity:
+                return similarities
+    finally:
+        for task in pending:
+            task.cancel()
 
-    similarities = [
-        np.dot(new_embedding, prev_embedding) /
-        (np.linalg.norm(new_embedding) * np.linalg.norm(prev_embedding))
-        for prev_embedding in previous_embeddings
-    ]
 
-    return 1 - max(similarities)
+def _get_novelty_score(new_embedding, novelty_matrix: NoveltyMatrix) -> tuple[float, np.ndarray]:
+    """Embedding novelty, and the similarities behind it when the backend computed all of them (else None)."""
+    return novelty_matrix.score(new_embedding)
@@ -1,11 +1,10 @@
-import json
 from colorama import Fore, Style
 from benchmark.model_list import models
+from benchmark.results_stream import load_scores
 
 
 def load_results(file_path='results.json'):
-    with open(file_path, 'r') as f:
-        return json.load(f)
+    return load_scores(file_path)
 
 
 def visualize_progress(results, thresholds):
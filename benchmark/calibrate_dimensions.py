@@ -0,0 +1,116 @@
+"""Measure how shortened embeddings would change chain-termination decisions.
+
+Replays every chain in a results file: each chain's answers are embedded at full
+size in batches (through the embedding cache, so previously scored answers cost
+nothing), then their embedding novelty is recomputed with the vectors truncated
+to each candidate size. Truncation only stands in for a shortened request on
+Matryoshka models, so the backend must be one (text-embedding-3). An answer's stop decision combines that novelty with its recorded
+coherence (and LLM novelty, if present) exactly as the benchmark does.
+
+Only recorded answers can be replayed, so a decision that would have stopped a
+chain earlier is counted, but answers a longer chain would have produced are not.
+
+Usage:
+    python benchmark/calibrate_dimensions.py results.json --dimensions 256 512 1024
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+from get_args import DEFAULT_THRESHOLDS
+from models import embed_many, get_embedding_backend
+from novelty import NoveltyMatrix, truncate_embedding
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
+except ImportError:
+    pass
+
+
+def calibrate(results: dict, dimensions: list[int], thresholds: dict, max_chains: int = None) -> dict:
+    """Per-size counts of answers and chains whose stop decision differs from full size."""
+    backend = get_embedding_backend()
+    if not backend.matryoshka:
+        raise ValueError(f"Truncating {backend.name} embeddings does not match shortened ones; "
+                         "calibration needs a Matryoshka model such as text-embedding-3-large")
+    report = {d: {'answers': 0, 'decisions_changed': 0, 'chains': 0, 'chains_changed': 0,
+                  'novelty_error_sum': 0.0, 'novelty_error_max': 0.0}
+              for d in dimensions}
+
+    for num_chains, answers in enumerate(_chains(results)):
+        if max_chains is not None and num_chains >= max_chains:
+            break
+        embeddings = embed_many([answer['answer'] for answer in answers])
+        full_novelty = _chain_novelty(embeddings)
+        full_stops = _stop_decisions(answers, full_novelty, thresholds)
+
+        for d in dimensions:
+            novelty = _chain_novelty([truncate_embedding(e, d) for e in embeddings])
+            stops = _stop_decisions(answers, novelty, thresholds)
+            errors = np.abs(novelty - full_novelty)
+            counts = report[d]
+            counts['answers'] += len(answers)
+            counts['decisions_changed'] += int(np.sum(stops != full_stops))
+            counts['chains'] += 1
+            counts['chains_changed'] += _first_stop(stops) != _first_stop(full_stops)
+            counts['novelty_error_sum'] += float(errors.sum())
+            counts['novelty_error_max'] = max(counts['novelty_error_max'], float(errors.max()))
+
+    for counts in report.values():
+        counts['novelty_error_mean'] = (counts.pop('novelty_error_sum') / counts['answers']
+                                        if counts['answers'] else 0.0)
+    return report
+
+
+def _chains(results: dict):
+    for temps in results.get('models', {}).values():
+        for questions in temps.values():
+            for answers in questions.values():
+                if answers:
+                    yield sorted(answers, key=lambda a: a['answer_num'])
+
+
+def _chain_novelty(embeddings: list) -> np.ndarray:
+    """Novelty of each answer against the answers before it in the chain."""
+    matrix = NoveltyMatrix()
+    novelty = np.empty(len(embeddings))
+    for i, embedding in enumerate(embeddings):
+        novelty[i] = matrix.novelty(embedding)
+        matrix.add(embedding)
+    return novelty
+
+
+def _stop_decisions(answers: list[dict], embedding_novelty: np.ndarray, thresholds: dict) -> np.ndarray:
+    coherence = np.array([a.get('coherence_score', 100) for a in answers])
+    llm_novelty = np.array([a.get('llm_dissimilarity_score', 1.0) for a in answers])
+    return ((coherence <= thresholds['coherence_score']) |
+            (embedding_novelty < thresholds['embedding_dissimilarity_score']) |
+            (llm_novelty < thresholds['llm_dissimilarity_score']))
+
+
+def _first_stop(stops: np.ndarray) -> int:
+    return int(np.argmax(stops)) if stops.any() else len(stops)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('results_file')
+    parser.add_argument('--dimensions', type=int, nargs='+', default=[256, 512, 1024])
+    parser.add_argument('--embedding-threshold', type=float,
+                        default=DEFAULT_THRESHOLDS['embedding_dissimilarity_score'])
+    parser.add_argument('--max-chains', type=int, default=None)
+    args = parser.parse_args()
+
+    with open(args.results_file, 'r') as f:
+        results = json.load(f)
+    thresholds = dict(DEFAULT_THRESHOLDS, embedding_dissimilarity_score=args.embedding_threshold)
+
+    report = calibrate(results, args.dimensions, thresholds, args.max_chains)
+    for d, counts in report.items():
+        print(
+            f"{d:>5} dims: {counts['decisions_changed']}/{counts['answers']} stop decisions changed, "
+            f"{counts['chains_changed']}/{counts['chains']} chains would end elsewhere, "
+            f"novelty error mean {counts['novelty_error_mean']:.4f} max {counts['novelty_error_max']:.4f}")
@@ -0,0 +1,43 @@
+"""Context-window budget for answer prompts.
+
+Each chain's answer prompt grows by one previous answer per call. The budget is
+the model's context window (from `model_list.context_windows`, optionally capped
+with `--max-context-tokens`), minus room for the completion and a safety margin
+for token-count error. What happens when a prompt outgrows it is set by the
+context policy:
+
+- 'stop': the chain ends at the last answer whose successor prompt would not
+  fit, and that answer is recorded with stop_reason 'context_budget'.
+- 'compress': the oldest previous answers are left out of the prompt (novelty is
+  still scored against all of them) until it fits again.
+"""
+import os
+
+from model_list import context_windows
+
+CONTEXT_POLICIES = ('stop', 'compress')
+CONTEXT_STOP_REASON = 'context_budget'
+DEFAULT_CONTEXT_WINDOW = int(os.environ.get("DEFAULT_CONTEXT_WINDOW", 128000))
+# Matches chat_with_model's default max_tokens for the answer
+COMPLETION_RESERVE = 4000
+# Fraction of the window held back for tokenizer mismatch between tiktoken and the
+# provider's own tokenizer. It is sized for tiktoken counts (in requirements.txt); the
+# len/4 fallback can undercount by more than this, so install tiktoken.
+CONTEXT_SAFETY_MARGIN = float(os.environ.get("CONTEXT_SAFETY_MARGIN", 0.1))
+
+_context_windows = {entry['model']: entry['context_window'] for entry in context_windows}
+
+
+def context_window(model: str) -> int:
+    """Context window of `model` in tokens; variants like 'x:thinking' fall back to 'x'."""
+    if model in _context_windows:
+        return _context_windows[model]
+    return _context_windows.get(model.split(':')[0], DEFAULT_CONTEXT_WINDOW)
+
+
+def prompt_budget(model: str, max_context_tokens: int = None) -> int:
+    """Largest answer prompt, in tokens, to send to `model`."""
+    window = context_window(model)
+    if max_context_tokens is not None:
+        window = min(window, max_context_tokens)
+    return max(0, int(window * (1 - CONTEXT_SAFETY_MARGIN)) - COMPLETION_RESERVE)
@@ -0,0 +1,128 @@
+"""Embedding backends behind `models.embed`.
+
+A backend has a `name`, which also keys its vectors in the embedding cache, and
+an `embed_batch(texts, dimensions=None)` method returning one float32 array per
+text. `supports_dimensions` says whether `dimensions` may be passed at all, and
+`matryoshka` whether the first `dimensions` components of a full-size vector
+(re-normalized) equal what a direct request for `dimensions` returns, so that
+cached full-size vectors can be shortened locally. Backends are chosen with a
+spec string:
+
+    openai                         text-embedding-3-large over the API (default)
+    sentence-transformers[:MODEL]  local CPU model, loaded once (optional dependency)
+    hashing[:DIM]                  deterministic feature hashing, for tests and dry runs
+"""
+import hashlib
+import re
+import threading
+
+import numpy as np
+
+from novelty import normalize
+
+try:
+    from sentence_transformers import SentenceTransformer
+    SENTENCE_TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    SENTENCE_TRANSFORMERS_AVAILABLE = False
+
+
+DEFAULT_OPENAI_MODEL = 'text-embedding-3-large'
+DEFAULT_SENTENCE_TRANSFORMER = 'all-MiniLM-L6-v2'
+DEFAULT_HASHING_DIM = 1024
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class OpenAIEmbeddingBackend:
+    """Embeddings from the OpenAI API; `get_client` returns the shared OpenAI client."""
+
+    supports_dimensions = True
+
+    def __init__(self, get_client, model: str = DEFAULT_OPENAI_MODEL):
+        self.get_client = get_client
+        self.model = model
+        self.name = model
+        # Only the text-embedding-3 models are trained for truncation
+        self.matryoshka = model.startswith('text-embedding-3')
+
+    def embed_batch(self, texts: list[str], dimensions: int = None) -> list[np.ndarray]:
+        kwargs = {'dimensions': dimensions} if dimensions is not None else {}
+        response = self.get_client().embeddings.create(model=self.model, input=texts, **kwargs)
+        # Contiguous float32 arrays instead of lists of boxed Python floats
+        return [np.asarray(item.embedding, dtype=np.float32)
+                for item in sorted(response.data, key=lambda item: item.index)]
+
+
+class SentenceTransformerBackend:
+    """Local sentence-transformers model run on CPU (or `device`), loaded on first use.
+
+    Models are not assumed to be Matryoshka-trained, so shortened vectors are not offered.
+    """
+
+    supports_dimensions = False
+    matryoshka = False
+
+    def __init__(self, model: str = DEFAULT_SENTENCE_TRANSFORMER, device: str = 'cpu',
+                 batch_size: int = 64):
+        if not SENTENCE_TRANSFORMERS_AVAILABLE:
+            raise ImportError(
+                "The sentence-transformers backend needs the sentence-transformers package.\n"
+                "Install it with: pip install sentence-transformers")
+        self.model = model
+        self.device = device
+        self.batch_size = batch_size
+        self.name = f"sentence-transformers/{model}"
+        self._encoder = None
+        self._lock = threading.Lock()
+
+    def embed_batch(self, texts: list[str], dimensions: int = None) -> list[np.ndarray]:
+        if dimensions is not None:
+            raise ValueError(f"{self.name} does not support shortened embeddings")
+        with self._lock:
+            if self._encoder is None:
+                self._encoder = SentenceTransformer(self.model, device=self.device)
+            vectors = self._encoder.encode(
+                texts, batch_size=self.batch_size, convert_to_numpy=True,
+                normalize_embeddings=True, show_progress_bar=False)
+        return list(vectors.astype(np.float32))
+
+
+class HashingEmbeddingBackend:
+    """Signed feature hashing of word unigrams and bigrams.
+
+    Deterministic across processes and machines with no model to load, so
+    identical texts embed identically and texts sharing words score as similar.
+    Useful for tests and for exercising the pipeline offline; not a substitute
+    for a semantic model when scoring real runs. With `dimensions`, features are
+    hashed into that many buckets instead of truncating a full-size vector.
+    """
+
+    supports_dimensions = True
+    matryoshka = False
+
+    def __init__(self, dim: int = DEFAULT_HASHING_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def embed_batch(self, texts: list[str], dimensions: int = None) -> list[np.ndarray]:
+        return [self._embed(text, min(dimensions or self.dim, self.dim)) for text in texts]
+
+    def _embed(self, text: str, dim: int) -> np.ndarray:
+        tokens = _TOKEN_PATTERN.findall(text.lower())
+        vector = np.zeros(dim, dtype=np.float32)
+        for feature in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+            digest = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+            vector[digest % dim] += 1.0 if digest >> 63 else -1.0
+        return normalize(vector)
+
+
+def create_backend(spec: str, get_openai_client=None):
+    """Build the backend described by `spec` (see the module docstring)."""
+    kind, _, option = spec.partition(':')
+    if kind == 'openai':
+        return OpenAIEmbeddingBackend(get_openai_client, option or DEFAULT_OPENAI_MODEL)
+    if kind == 'sentence-transformers':
+        return SentenceTransformerBackend(option or DEFAULT_SENTENCE_TRANSFORMER)
+    if kind == 'hashing':
+        return HashingEmbeddingBackend(int(option) if option else DEFAULT_HASHING_DIM)
+    raise ValueError(f"Unknown embedding backend: {spec}")
@@ -0,0 +1,96 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+DEFAULT_MAX_BATCH_SIZE = 32
+DEFAULT_MAX_WAIT = 0.005
+
+
+class EmbeddingBatcher:
+    """Micro-batches embedding requests from many threads into single API calls.
+
+    Callers `submit` a text and get back a Future. A background thread takes the
+    first pending text, keeps collecting for up to `max_wait` seconds or until
+    `max_batch_size` texts are queued, sends them with one `embed_batch` call and
+    resolves each caller's future with its own vector.
+    """
+
+    def __init__(self, embed_batch, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_wait: float = DEFAULT_MAX_WAIT):
+        self.embed_batch = embed_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.items = 0
+        self._stats_lock = threading.Lock()
+        self._pending = queue.Queue()
+        self._worker = threading.Thread(
+            target=self._run, name='embedding-batcher', daemon=True)
+        self._worker.start()
+
+    def submit(self, text: str) -> Future:
+        future = Future()
+        self._pending.put((text, future))
+        return future
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            batches, items = self.batches, self.items
+        return {
+            'batches': batches,
+            'items': items,
+            'mean_batch_size': items / batches if batches else 0.0,
+            'fill_ratio': items / (batches * self.max_batch_size) if batches else 0.0,
+        }
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._pending.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._send(batch)
+            except Exception as e:
+                # This thread serves every caller, so one bad batch must not end it
+                _fail(batch, e)
+
+    def _send(self, batch: list) -> None:
+        # Claim each future so it can no longer be cancelled; drop those already cancelled
+        batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        # Identical texts queued by different chains share one slot in the request
+        unique_texts = list(dict.fromkeys(text for text, _ in batch))
+        sent_at = time.monotonic()
+        for _, future in batch:
+            # Lets callers tell time spent queued from time spent in the request
+            future.sent_at = sent_at
+        try:
+            vectors = list(self.embed_batch(unique_texts))
+            if len(vectors) != len(unique_texts):
+                raise ValueError(f"Embedding backend returned {len(vectors)} vectors for {len(unique_texts)} texts")
+        except Exception as e:
+            _fail(batch, e)
+            return
+        embeddings = dict(zip(unique_texts, vectors))
+
+        with self._stats_lock:
+            self.batches += 1
+            self.items += len(batch)
+        for text, future in batch:
+            future.set_result(embeddings[text])
+
+
+def _fail(batch: list, e: Exception) -> None:
+    for _, future in batch:
+        if not future.done():
+            future.set_exception(e)
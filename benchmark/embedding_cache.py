@@ -0,0 +1,121 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from quantization import EMBEDDING_DTYPES, encode, decode
+
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(__file__), '..', 'embedding_cache.sqlite3')
+DEFAULT_MAX_ENTRIES = 50000
+
+
+class EmbeddingCache:
+    """Persistent, content-addressed embedding store keyed by (embedding model, text hash).
+
+    Vectors are stored in SQLite as blobs in `dtype` ('float32', 'float16' or
+    'int8'; see quantization.py), tagged per row so a cache written with one
+    format stays readable after switching to another. The cache is bounded to
+    `max_entries` rows; when it grows past that the least recently used rows
+    are evicted. A single connection guarded by a lock is shared by all worker
+    threads, and WAL mode lets separate processes read while one writes.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 dtype: str = 'float32'):
+        if dtype not in EMBEDDING_DTYPES:
+            raise ValueError(f"Unknown embedding dtype: {dtype}")
+        self.path = path
+        self.max_entries = max_entries
+        self.dtype = dtype
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, "
+            "text_hash TEXT NOT NULL, "
+            "vector BLOB NOT NULL, "
+            "last_used REAL NOT NULL, "
+            "dtype TEXT NOT NULL DEFAULT 'float32', "
+            "PRIMARY KEY (model, text_hash))"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(embeddings)")}
+        if 'dtype' not in columns:
+            # Caches created before compact storage hold only float32 blobs
+            self._conn.execute(
+                "ALTER TABLE embeddings ADD COLUMN dtype TEXT NOT NULL DEFAULT 'float32'")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get(self, model: str, text: str):
+        key = (model, _text_hash(text))
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT vector, dtype FROM embeddings WHERE model = ? AND text_hash = ?", key
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                (time.time(), *key))
+            self._conn.commit()
+        return decode(row[0], row[1])
+
+    def put(self, model: str, text: str, embedding) -> None:
+        self.put_many(model, [(text, embedding)])
+
+    def put_many(self, model: str, items) -> None:
+        """Insert (text, embedding) pairs in a single transaction."""
+        now = time.time()
+        rows = [(model, _text_hash(text), encode(embedding, self.dtype), now, self.dtype)
+                for text, embedding in items]
+        with self._lock:
+            inserted = 0
+            for row in rows:
+                inserted += self._conn.execute(
+                    "INSERT OR IGNORE INTO embeddings (model, text_hash, vector, last_used, dtype) "
+                    "VALUES (?, ?, ?, ?, ?)", row
+                ).rowcount
+            self._size += inserted
+            if self._size > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'entries': self._size,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _evict(self) -> None:
+        # Evict down to 90% of capacity so eviction isn't triggered on every insert
+        excess = self._size - int(self.max_entries * 0.9)
+        deleted = self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN "
+            "(SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,)
+        ).rowcount
+        self._size -= deleted
+        self.evictions += deleted
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
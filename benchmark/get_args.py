@@ -1,6 +1,9 @@
 from colorama import Fore, Style
+import argparse
 import os
 from model_list import models, model_subset
+from context_budget import CONTEXT_POLICIES
+from novelty import NOVELTY_BACKENDS
 
 DEFAULT_THRESHOLDS = {
     'coherence_score': 15,
@@ -15,7 +18,59 @@ ERROR_COLOR = Fore.RED + Style.BRIGHT
 def _clear_screen():
     os.system('clear' if os.name != 'nt' else 'cls')
 
-def get_user_choices() -> dict[str, any]:
+def parse_cli_args(argv: list[str] = None) -> argparse.Namespace:
+    """Parse the non-interactive engine options for benchmark/main.py."""
+    parser = argparse.ArgumentParser(description="Run AidanBench.")
+    parser.add_argument(
+        '--engine', choices=['threads', 'async'], default='threads',
+        help="threads: ThreadPoolExecutor runner (default); async: asyncio engine")
+    parser.add_argument(
+        '--max-in-flight', type=int, default=200,
+        help="Max concurrent question chains for the async engine (default: 200)")
+    parser.add_argument(
+        '--provider-concurrency', type=int, default=50,
+        help="Ceiling on concurrent API requests per provider; the adaptive rate limiter "
+             "tunes the actual limit below it (default: 50)")
+    parser.add_argument(
+        '--pipeline', action='store_true',
+        help="Run the coherence judge and embedding calls for each answer concurrently")
+    parser.add_argument(
+        '--speculative', action='store_true',
+        help="Also generate the next answer while the current one is judged (implies --pipeline)")
+    parser.add_argument(
+        '--llm-prefilter-top-k', type=int, default=None,
+        help="Only LLM-judge similarity against the K previous answers nearest in embedding space")
+    parser.add_argument(
+        '--llm-prefilter-min-cosine', type=float, default=None,
+        help="Also LLM-judge every previous answer with embedding cosine at or above this value")
+    parser.add_argument(
+        '--llm-prefilter-audit-rate', type=float, default=0.0,
+        help="Fraction of prefiltered answers also judged against every previous answer "
+             "to measure the prefilter's recall (default: 0)")
+    parser.add_argument(
+        '--novelty-backend', choices=NOVELTY_BACKENDS, default='exact',
+        help="Embedding novelty index: exact (default), ivf (approximate, for very long chains) "
+             "or verify (exact scores, reports where ivf would have decided differently)")
+    parser.add_argument(
+        '--embedding-dimensions', type=int, default=None,
+        help="Shorten novelty embeddings to this many dimensions, e.g. 256, 512 or 1024 "
+             "(default: the model's full size); see benchmark/calibrate_dimensions.py")
+    parser.add_argument(
+        '--embedding-backend', default=None,
+        help="Embedding backend for novelty: openai (default), sentence-transformers[:MODEL] "
+             "for a local CPU model, or hashing[:DIM] for deterministic offline runs")
+    parser.add_argument(
+        '--context-policy', choices=CONTEXT_POLICIES, default='stop',
+        help="When an answer prompt outgrows the model's context budget: stop the chain and record "
+             "stop_reason 'context_budget' (default), or compress by leaving the oldest previous "
+             "answers out of the prompt")
+    parser.add_argument(
+        '--max-context-tokens', type=int, default=None,
+        help="Cap every model's context window at this many tokens (default: the model's window "
+             "from model_list.context_windows)")
+    return parser.parse_args(argv)
+
+def get_user_choices(engine: str = 'threads') -> dict[str, any]:
     choices = {}
     
     _clear_screen()
@@ -33,7 +88,9 @@ def get_user_choices() -> dict[str, any]:
     print(f"{SECTION_COLOR}=== Additional Configuration ==={Style.RESET_ALL}\n")
     choices['chain_of_thought'] = _get_yes_no(f"{PROMPT_COLOR}Use chain of thought?{Style.RESET_ALL}")
     choices['use_llm'] = _get_yes_no(f"{PROMPT_COLOR}Use LLM similarity scoring?{Style.RESET_ALL}")
-    choices['multithreaded'] = _get_yes_no(f"{PROMPT_COLOR}Enable multithreading?{Style.RESET_ALL}")
+    # The async engine always runs chains concurrently
+    choices['multithreaded'] = engine == 'async' or _get_yes_no(
+        f"{PROMPT_COLOR}Enable multithreading?{Style.RESET_ALL}")
     choices['num_questions'] = _get_num_questions()
     choices['results_file'] = _get_results_file()
     
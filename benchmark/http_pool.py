@@ -0,0 +1,103 @@
+import os
+import threading
+
+import httpx
+from openai import DefaultHttpxClient, DefaultAsyncHttpxClient
+
+try:
+    import h2  # noqa: F401 - only needed to enable HTTP/2 in httpx
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+DEFAULT_POOL_SIZE = 100
+DEFAULT_KEEPALIVE_EXPIRY = 60.0
+DEFAULT_CONNECT_TIMEOUT = 10.0
+# Reasoning models can think for many minutes before the first byte
+DEFAULT_READ_TIMEOUT = 600.0
+
+
+class ConnectionStats:
+    """Counts completed requests and connections opened on one pooled client.
+
+    Uses httpcore's trace extension: a TCP connect is only traced when the pool
+    has no idle keep-alive connection to hand out, so responses minus connections
+    opened is the number of requests that reused a connection.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+        self._lock = threading.Lock()
+
+    def on_request(self, request: httpx.Request) -> None:
+        request.extensions['trace'] = self.trace
+
+    def on_response(self, response: httpx.Response) -> None:
+        with self._lock:
+            self.requests += 1
+
+    async def aon_request(self, request: httpx.Request) -> None:
+        request.extensions['trace'] = self.atrace
+
+    async def aon_response(self, response: httpx.Response) -> None:
+        self.on_response(response)
+
+    def trace(self, event_name: str, info: dict) -> None:
+        with self._lock:
+            if event_name == 'connection.connect_tcp.complete':
+                self.connections_opened += 1
+            elif event_name == 'connection.start_tls.complete':
+                self.tls_handshakes += 1
+
+    async def atrace(self, event_name: str, info: dict) -> None:
+        self.trace(event_name, info)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'connections_opened': self.connections_opened,
+                'connections_reused': max(0, self.requests - self.connections_opened),
+                'tls_handshakes': self.tls_handshakes,
+            }
+
+
+# Stats for every client built by this module, keyed by client name
+connection_stats = {}
+
+
+def build_http_client(name: str, is_async: bool = False):
+    """Pooled httpx client for an OpenAI-compatible SDK client.
+
+    Pool size, keep-alive expiry, HTTP/2 and timeouts come from HTTP_POOL_SIZE,
+    HTTP_KEEPALIVE_EXPIRY, HTTP2 ("0" to disable), HTTP_CONNECT_TIMEOUT and
+    HTTP_READ_TIMEOUT. HTTP/2 is only used when the optional `h2` package is installed.
+    """
+    pool_size = int(os.environ.get("HTTP_POOL_SIZE", DEFAULT_POOL_SIZE))
+    limits = httpx.Limits(
+        max_connections=pool_size,
+        max_keepalive_connections=pool_size,
+        keepalive_expiry=float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", DEFAULT_KEEPALIVE_EXPIRY))
+    )
+    timeout = httpx.Timeout(
+        float(os.environ.get("HTTP_READ_TIMEOUT", DEFAULT_READ_TIMEOUT)),
+        connect=float(os.environ.get("HTTP_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT))
+    )
+    http2 = HTTP2_AVAILABLE and os.environ.get("HTTP2", "1") != "0"
+
+    stats = ConnectionStats()
+    connection_stats[name] = stats
+    if is_async:
+        return DefaultAsyncHttpxClient(
+            limits=limits, timeout=timeout, http2=http2,
+            event_hooks={'request': [stats.aon_request], 'response': [stats.aon_response]})
+    return DefaultHttpxClient(
+        limits=limits, timeout=timeout, http2=http2,
+        event_hooks={'request': [stats.on_request], 'response': [stats.on_response]})
+
+
+def get_connection_stats() -> dict:
+    return {name: stats.stats() for name, stats in connection_stats.items()}
@@ -0,0 +1,65 @@
+import threading
+
+import numpy as np
+
+
+def select_candidates(similarities: np.ndarray, top_k: int = None, min_cosine: float = None) -> list[int]:
+    """Indices of previous answers worth sending to the LLM similarity judge.
+
+    Keeps the `top_k` nearest answers by embedding cosine plus every answer at or
+    above `min_cosine`, ordered most similar first so early termination in the
+    judge loop triggers as soon as possible. With neither option set, every
+    previous answer is a candidate.
+    """
+    order = np.argsort(-similarities, kind='stable')
+    if top_k is None and min_cosine is None:
+        return order.tolist()
+
+    keep = np.zeros(len(similarities), dtype=bool)
+    if top_k is not None:
+        keep[order[:top_k]] = True
+    if min_cosine is not None:
+        keep |= similarities >= min_cosine
+    return [int(i) for i in order if keep[i]]
+
+
+class PrefilterStats:
+    """Recall of the embedding prefilter, measured on audited answers.
+
+    For an audited answer every previous answer is judged; the filter "recalls" it
+    when the previous answer the LLM found most similar was among the candidates.
+    """
+
+    def __init__(self):
+        self.judged = 0
+        self.candidates = 0
+        self.previous_answers = 0
+        self.audited = 0
+        self.recalled = 0
+        self.decisions_matched = 0
+        self._lock = threading.Lock()
+
+    def record(self, num_candidates: int, num_previous: int) -> None:
+        with self._lock:
+            self.judged += 1
+            self.candidates += num_candidates
+            self.previous_answers += num_previous
+
+    def record_audit(self, recalled: bool, decision_matched: bool) -> None:
+        with self._lock:
+            self.audited += 1
+            self.recalled += recalled
+            self.decisions_matched += decision_matched
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'judged': self.judged,
+                'judge_fraction': self.candidates / self.previous_answers if self.previous_answers else 0.0,
+                'audited': self.audited,
+                'recall': self.recalled / self.audited if self.audited else None,
+                'decision_agreement': self.decisions_matched / self.audited if self.audited else None,
+            }
+
+
+prefilter_stats = PrefilterStats()
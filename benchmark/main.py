@@ -1,9 +1,23 @@
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from benchmark import benchmark_question
+from benchmark import benchmark_question, abenchmark_question, context_budget_exhausted
 from colorama import Fore, Style
 from itertools import product
 from question_list import questions
-from get_args import get_user_choices
+from get_args import get_user_choices, parse_cli_args
+from models import (get_embedding_cache, embedding_batchers, get_rate_limiter,
+                    configure_rate_limiter, reset_async_client, configure_embedding_backend,
+                    check_embedding_dimensions)
+from results_journal import ResultsJournal, journal_path, replay_journal, write_results
+from results_store import ResultsStore
+from http_pool import get_connection_stats
+from llm_prefilter import prefilter_stats
+from novelty import index_memory_stats, verification_stats
+from prompt_builder import prompt_stats
+from prompt_cache import prompt_cache_stats
+from context_budget import CONTEXT_STOP_REASON
+from telemetry import telemetry_stats
+from streaming import stream_stats
+import asyncio
 import json
 import sys
 import time
@@ -26,9 +40,25 @@ def run_benchmark(
     multithreaded: bool = True,
     num_questions: int = None,
     results_file: str = 'results.json',
-    thresholds: dict = None
+    thresholds: dict = None,
+    engine: str = 'threads',
+    max_in_flight: int = 200,
+    provider_concurrency: int = 50,
+    pipeline: bool = False,
+    speculative: bool = False,
+    llm_prefilter_top_k: int = None,
+    llm_prefilter_min_cosine: float = None,
+    llm_prefilter_audit_rate: float = 0.0,
+    novelty_backend: str = 'exact',
+    embedding_dimensions: int = None,
+    embedding_backend: str = None,
+    context_policy: str = 'stop',
+    max_context_tokens: int = None
 ) -> None:
     questions_to_use = questions[:num_questions] if num_questions else questions
+    if embedding_backend:
+        configure_embedding_backend(embedding_backend)
+    check_embedding_dimensions(embedding_dimensions)
 
     # Create results file if it doesn't exist
     if not os.path.exists(results_file):
@@ -38,8 +68,31 @@ def run_benchmark(
     with open(results_file, 'r') as f:
         results = json.load(f)
 
+    # Recover answers journaled by a run that stopped before compacting
+    recovered = replay_journal(results, journal_path(results_file))
+    if recovered:
+        print(f"Recovered {recovered} answers from {journal_path(results_file)}")
+    results = ResultsStore(results)
+    journal = ResultsJournal(journal_path(results_file))
+
     start_time = time.time()
 
+    # Extra keyword arguments forwarded to benchmark_question for every chain
+    benchmark_options = {
+        'pipeline': pipeline or speculative,
+        'speculative': speculative,
+        'novelty_backend': novelty_backend,
+        'embedding_dimensions': embedding_dimensions,
+        'context_policy': context_policy,
+        'max_context_tokens': max_context_tokens
+    }
+    if llm_prefilter_top_k is not None or llm_prefilter_min_cosine is not None:
+        benchmark_options['llm_prefilter'] = {
+            'top_k': llm_prefilter_top_k,
+            'min_cosine': llm_prefilter_min_cosine,
+            'audit_rate': llm_prefilter_audit_rate
+        }
+
     try:
         _run_benchmarks(
             questions_to_use,
@@ -49,15 +102,31 @@ def run_benchmark(
             use_llm,
             results,
             multithreaded,
-            results_file,
-            thresholds
+            journal,
+            thresholds,
+            engine,
+            max_in_flight,
+            provider_concurrency,
+            benchmark_options
         )
     except KeyboardInterrupt:
         print(
             f"\n{Fore.YELLOW}Benchmark interrupted. Saving results...{Style.RESET_ALL}")
     finally:
-        _save_results(results, results_file)
+        _compact_results(results, results_file, journal)
         print(f"Total processing time: {time.time() - start_time:.2f} seconds")
+        _print_embedding_stats()
+        _print_index_memory_stats()
+        _print_prompt_stats()
+        _print_prompt_cache_stats()
+        _print_telemetry_stats()
+        _print_stream_stats()
+        _print_rate_limiter_stats()
+        _print_connection_stats()
+        if 'llm_prefilter' in benchmark_options:
+            _print_prefilter_stats()
+        if novelty_backend == 'verify':
+            _print_novelty_verification_stats()
 
 
 def _validate_environment() -> None:
@@ -74,7 +143,9 @@ def _validate_environment() -> None:
         sys.exit(1)
 
 
-def _run_benchmarks(questions, models, temperatures, chain_of_thought, use_llm, results, multithreaded, results_file, thresholds):
+def _run_benchmarks(questions, models, temperatures, chain_of_thought, use_llm, results, multithreaded, journal, thresholds,
+                    engine='threads', max_in_flight=200, provider_concurrency=50, benchmark_options=None):
+    benchmark_options = benchmark_options or {}
     benchmark_params = list(product(questions, models, temperatures))
 
     # Group parameters by model for tracking completion
@@ -82,15 +153,21 @@ def _run_benchmarks(questions, models, temperatures, chain_of_thought, use_llm,
     for question, model, temp in benchmark_params:
         model_params.setdefault(model, []).append((question, model, temp))
 
-    if multithreaded:
+    configure_rate_limiter(provider_concurrency)
+    if engine == 'async':
+        reset_async_client()
+        asyncio.run(_run_async(model_params, chain_of_thought, use_llm,
+                               results, journal, thresholds, max_in_flight,
+                               benchmark_options))
+    elif multithreaded:
         _run_multithreaded(model_params, chain_of_thought,
-                           use_llm, results, results_file, thresholds)
+                           use_llm, results, journal, thresholds, benchmark_options)
     else:
         _run_sequential(model_params, chain_of_thought,
-                        use_llm, results, results_file, thresholds)
+                        use_llm, results, journal, thresholds, benchmark_options)
 
 
-def _run_multithreaded(model_params, chain_of_thought, use_llm, results, results_file, thresholds):
+def _run_multithreaded(model_params, chain_of_thought, use_llm, results, journal, thresholds, benchmark_options):
     with ThreadPoolExecutor(max_workers=20) as executor:
         all_futures = []
         active_models = []
@@ -107,7 +184,7 @@ def _run_multithreaded(model_params, chain_of_thought, use_llm, results, results
             active_models.append(model)
             model_futures = [
                 executor.submit(_process_question, question, model, temp,
-                                chain_of_thought, use_llm, results, thresholds)
+                                chain_of_thought, use_llm, results, journal, thresholds, benchmark_options)
                 for question, model, temp in model_tasks
             ]
             all_futures.extend(model_futures)
@@ -132,57 +209,129 @@ def _run_multithreaded(model_params, chain_of_thought, use_llm, results, results
                 print(f"{Fore.RED}Error during benchmark: {e}{Style.RESET_ALL}")
                 completed += 1
 
-            # Save results periodically
-            if completed % 50 == 0 or completed == total:
-                _save_results(results, results_file)
+
+async def _run_async(model_params, chain_of_thought, use_llm, results, journal, thresholds, max_in_flight,
+                     benchmark_options):
+    in_flight = asyncio.Semaphore(max_in_flight)
+
+    async def run_task(question, model, temp):
+        async with in_flight:
+            await _aprocess_question(question, model, temp,
+                                     chain_of_thought, use_llm, results, journal, thresholds, benchmark_options)
+
+    tasks = []
+    active_models = []
+    for model, model_tasks in model_params.items():
+        if all(_can_skip_question(results, question, model, temp, use_llm, thresholds)
+               for question, model, temp in model_tasks):
+            print(f"Skipping all questions for {model} - already completed")
+            continue
+
+        active_models.append(model)
+        tasks.extend(asyncio.ensure_future(run_task(question, model, temp))
+                     for question, model, temp in model_tasks)
+
+    completed = 0
+    total = len(tasks)
+
+    if total == 0:
+        print("No tasks to process - all models completed")
+        return
+
+    print(f"Processing {total} tasks across {len(active_models)} models "
+          f"(async engine, up to {max_in_flight} chains in flight)")
+
+    try:
+        for task in asyncio.as_completed(tasks):
+            try:
+                await task
+                completed += 1
+                if completed % 10 == 0:
+                    print(f"Completed {completed}/{total} tasks")
+            except Exception as e:
+                print(f"{Fore.RED}Error during benchmark: {e}{Style.RESET_ALL}")
+                completed += 1
+    finally:
+        for task in tasks:
+            task.cancel()
 
 
-def _run_sequential(model_params, chain_of_thought, use_llm, results, results_file, thresholds):
+def _run_sequential(model_params, chain_of_thought, use_llm, results, journal, thresholds, benchmark_options):
     for model_tasks in model_params.values():
         for question, model, temp in model_tasks:
             try:
                 _process_question(question, model, temp,
-                                  chain_of_thought, use_llm, results, thresholds)
+                                  chain_of_thought, use_llm, results, journal, thresholds, benchmark_options)
             except Exception as e:
                 print(
                     f"{Fore.RED}Error for {model} (temp={temp}): {e}{Style.RESET_ALL}")
-        # Save results after each model completes
-        _save_results(results, results_file)
 
 
-def _process_question(question, model_name, temperature, chain_of_thought, use_llm, results, thresholds):
-    # Get the model's results dict, creating nested structure if needed
-    model_results = results.setdefault('models', {}).setdefault(
-        model_name, {}).setdefault(str(temperature), {})
+def _process_question(question, model_name, temperature, chain_of_thought, use_llm, results, journal, thresholds,
+                      benchmark_options=None):
+    previous_answers = results.get_answers(model_name, temperature, question)
 
     # Skip if question is already completed successfully
-    if question in model_results:
-        previous_answers = model_results[question]
-        if _should_skip_question(previous_answers, use_llm, thresholds):
-            return
+    if _should_skip_question(previous_answers, use_llm, thresholds, question, model_name, chain_of_thought,
+                             benchmark_options):
+        return
+
+    benchmark_question(
+        question,
+        model_name,
+        temperature,
+        [a['answer'] for a in previous_answers],
+        chain_of_thought,
+        use_llm,
+        thresholds,
+        on_answer=_answer_recorder(results, journal, model_name, temperature, question),
+        **(benchmark_options or {})
+    )
+
 
-    # Get previous answers if they exist, otherwise empty list
-    previous_answers = model_results.get(question, [])
+async def _aprocess_question(question, model_name, temperature, chain_of_thought, use_llm, results, journal, thresholds,
+                             benchmark_options=None):
+    previous_answers = results.get_answers(model_name, temperature, question)
+    if _should_skip_question(previous_answers, use_llm, thresholds, question, model_name, chain_of_thought,
+                             benchmark_options):
+        return
 
-    new_answers = benchmark_question(
+    await abenchmark_question(
         question,
         model_name,
         temperature,
         [a['answer'] for a in previous_answers],
         chain_of_thought,
         use_llm,
-        thresholds
+        thresholds,
+        on_answer=_answer_recorder(results, journal, model_name, temperature, question),
+        **(benchmark_options or {})
     )
 
-    # Store results
-    model_results[question] = previous_answers + new_answers
 
+def _answer_recorder(results: ResultsStore, journal: ResultsJournal, model_name: str, temperature: float, question: str):
+    """Callback that stores each scored answer in memory and in the journal as it is produced."""
+    def record(answer_data: dict) -> None:
+        results.add_answer(model_name, temperature, question, answer_data)
+        journal.append(model_name, temperature, question, answer_data)
+    return record
 
-def _should_skip_question(previous_answers: list[dict], use_llm: bool, thresholds: dict) -> bool:
+
+def _should_skip_question(previous_answers: list[dict], use_llm: bool, thresholds: dict, question: str = None,
+                          model_name: str = None, chain_of_thought: bool = False,
+                          benchmark_options: dict = None) -> bool:
     if not previous_answers:
         return False
 
     last_answer = previous_answers[-1]
+    if last_answer.get('stop_reason') == CONTEXT_STOP_REASON:
+        return True
+    # Chains stored before the budget applied, or under a smaller one, may already be full
+    if model_name is not None and context_budget_exhausted(
+            question, model_name, [a['answer'] for a in previous_answers], chain_of_thought,
+            (benchmark_options or {}).get('context_policy', 'stop'),
+            (benchmark_options or {}).get('max_context_tokens')):
+        return True
 
     checks = [
         last_answer.get('coherence_score',
@@ -200,42 +349,129 @@ def _should_skip_question(previous_answers: list[dict], use_llm: bool, threshold
     return any(checks)
 
 
-def _save_results(results: dict, results_file: str) -> None:
-    import tempfile
-    import shutil
-    
-    #write to temp file first to prevent corruption if interrupted
-    results_dir = os.path.dirname(os.path.abspath(results_file)) or '.'
-    
-    with tempfile.NamedTemporaryFile(mode='w', dir=results_dir, delete=False, suffix='.tmp') as f:
-        json.dump(results, f, indent=2)
-        temp_file = f.name
-    
-    try:
-        #atomically replace original file
-        shutil.move(temp_file, results_file)
-    except Exception:
-        #clean up temp file on failure
-        if os.path.exists(temp_file):
-            os.remove(temp_file)
-        raise
+def _compact_results(results: ResultsStore, results_file: str, journal: ResultsJournal) -> None:
+    write_results(results.snapshot(), results_file)
+    journal.truncate()
+    journal.close()
 
 
-def _can_skip_question(results: dict, question: str, model_name: str, temperature: float, use_llm: bool, thresholds: dict) -> bool:
-    """Check if a question can be skipped before creating a thread for it"""
-    model_results = (results.get('models', {})
-                     .get(model_name, {})
-                     .get(str(temperature), {}))
+def _print_embedding_stats() -> None:
+    stats = get_embedding_cache().stats()
+    print(
+        f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses "
+        f"({stats['hit_rate']:.1%} hit rate), {stats['evictions']} evictions, "
+        f"{stats['entries']} entries")
+    for dimensions, batcher in list(embedding_batchers.items()):
+        stats = batcher.stats()
+        size = f" [{dimensions} dims]" if dimensions is not None else ""
+        print(
+            f"Embedding batches{size}: {stats['batches']} requests for {stats['items']} texts "
+            f"(mean batch size {stats['mean_batch_size']:.1f}, "
+            f"fill ratio {stats['fill_ratio']:.1%})")
+
+
+def _print_prompt_stats() -> None:
+    stats = prompt_stats.stats()
+    if not stats['calls']:
+        return
+    print(
+        f"Answer prompts: {stats['calls']} calls, mean {stats['mean_tokens']:.0f} tokens, "
+        f"max {stats['max_tokens']} tokens")
+    if stats['compressions']:
+        print(
+            f"  Compressed {stats['compressions']} prompts to fit the context budget, "
+            f"leaving out {stats['omitted_answers']} earliest answers")
+    for bucket in stats['buckets']:
+        print(
+            f"  {bucket['min_tokens']:>7}+ tokens: {bucket['calls']} calls, "
+            f"mean latency {bucket['mean_latency']:.2f}s")
+
+
+def _print_prompt_cache_stats() -> None:
+    for provider, stats in prompt_cache_stats.stats().items():
+        print(
+            f"Prompt cache [{provider}]: {stats['cached_tokens']} of {stats['prompt_tokens']} prompt tokens "
+            f"cached ({stats['cached_fraction']:.1%}) over {stats['calls']} calls")
+
+
+def _print_telemetry_stats() -> None:
+    total_cost = 0.0
+    for model, kinds in telemetry_stats.stats().items():
+        for kind, stats in kinds.items():
+            calls = stats['calls']
+            line = (f"Calls [{model} {kind}]: {calls} calls, mean {stats['wall_time'] / calls:.2f}s "
+                    f"(queue {stats['queue_wait'] / calls:.2f}s), {stats['prompt_tokens']} prompt + "
+                    f"{stats['completion_tokens']} completion tokens, ${stats['cost']:.4f}")
+            if stats['failed']:
+                line += f" ({stats['failed']} failed)"
+            if stats['unpriced_calls']:
+                line += f" ({stats['unpriced_calls']} calls unpriced)"
+            print(line)
+            total_cost += stats['cost']
+    if total_cost:
+        print(f"Total API cost: ${total_cost:.4f}")
+
+
+def _print_stream_stats() -> None:
+    stats = stream_stats.stats()
+    timeouts = stats['timeouts']
+    if stats['calls'] or any(timeouts.values()):
+        print(f"Streamed completions: {stats['calls']} finished, time to first token mean "
+              f"{stats['mean_ttft']:.2f}s (max {stats['max_ttft']:.2f}s), mean {stats['mean_time']:.2f}s; "
+              f"timed out: {timeouts['total']} total, {timeouts['idle']} idle")
+
+
+def _print_rate_limiter_stats() -> None:
+    for provider, stats in get_rate_limiter().stats().items():
+        print(
+            f"Rate limiter [{provider}]: limit {stats['limit']}, {stats['successes']} ok, "
+            f"{stats['rate_limited']} rate-limited, queue depth {stats['queue_depth']} "
+            f"(peak {stats['max_queue_depth']})")
+
+
+def _print_connection_stats() -> None:
+    for name, stats in get_connection_stats().items():
+        print(
+            f"HTTP [{name}]: {stats['requests']} requests, {stats['connections_opened']} connections opened, "
+            f"{stats['connections_reused']} reused, {stats['tls_handshakes']} TLS handshakes")
+
+
+def _print_prefilter_stats() -> None:
+    stats = prefilter_stats.stats()
+    line = (f"LLM similarity prefilter: judged {stats['judge_fraction']:.1%} of previous answers "
+            f"over {stats['judged']} answers")
+    if stats['audited']:
+        line += (f"; {stats['audited']} audited, {stats['recall']:.1%} recall, "
+                 f"{stats['decision_agreement']:.1%} stop-decision agreement")
+    print(line)
 
-    previous_answers = model_results.get(question, [])
+
+def _print_index_memory_stats() -> None:
+    stats = index_memory_stats.stats()
+    if stats['chains']:
+        print(f"Novelty index memory: {stats['mean_bytes'] / 2**20:.2f} MiB mean, "
+              f"{stats['max_bytes'] / 2**20:.2f} MiB max over {stats['chains']} chains")
+
+
+def _print_novelty_verification_stats() -> None:
+    stats = verification_stats.stats()
+    print(
+        f"Novelty verification: IVF and exact novelty disagreed on {stats['mismatches']} of "
+        f"{stats['queries']} stop decisions (max novelty error {stats['max_error']:.4f})")
+
+
+def _can_skip_question(results: ResultsStore, question: str, model_name: str, temperature: float, use_llm: bool, thresholds: dict) -> bool:
+    """Check if a question can be skipped before creating a thread for it"""
+    previous_answers = results.get_answers(model_name, temperature, question)
     return _should_skip_question(previous_answers, use_llm, thresholds) if previous_answers else False
 
 
 if __name__ == "__main__":
     try:
         _validate_environment()
-        choices = get_user_choices()
-        run_benchmark(**choices)
+        cli_args = parse_cli_args()
+        choices = get_user_choices(engine=cli_args.engine)
+        run_benchmark(**choices, **vars(cli_args))
     except KeyboardInterrupt:
         print(f"\n{Fore.YELLOW}Benchmark interrupted. Exiting...{Style.RESET_ALL}")
         sys.exit(0)
@@ -74,6 +74,73 @@ models = [
     "mistralai/devstral-small",
 ]
 
+# Context window in tokens. Variants such as ':thinking' or ':high' share their base model's entry.
+context_windows = [
+    {'model': 'openai/gpt-4o-2024-08-06', 'context_window': 128000},
+    {'model': 'openai/gpt-4o-2024-05-13', 'context_window': 128000},
+    {'model': 'openai/gpt-4o-mini-2024-07-18', 'context_window': 128000},
+    {'model': 'openai/gpt-4-1106-preview', 'context_window': 128000},
+    {'model': 'openai/gpt-4-turbo', 'context_window': 128000},
+    {'model': 'openai/gpt-4.5-preview', 'context_window': 128000},
+    {'model': 'openai/chatgpt-4o-latest', 'context_window': 128000},
+    {'model': 'openai/o1-mini', 'context_window': 128000},
+    {'model': 'openai/o1-preview', 'context_window': 128000},
+    {'model': 'openai/o1', 'context_window': 200000},
+    {'model': 'meta-llama/llama-3.1-8b-instruct', 'context_window': 131072},
+    {'model': 'meta-llama/llama-3.1-70b-instruct', 'context_window': 131072},
+    {'model': 'meta-llama/llama-3.1-405b-instruct', 'context_window': 131072},
+    {'model': 'meta-llama/llama-3.2-3b-instruct', 'context_window': 131072},
+    {'model': 'meta-llama/llama-3.2-1b-instruct', 'context_window': 131072},
+    {'model': 'meta-llama/llama-3.2-90b-vision-instruct', 'context_window': 131072},
+    {'model': 'meta-llama/llama-3.2-11b-vision-instruct', 'context_window': 131072},
+    {'model': 'meta-llama/llama-3.3-70b-instruct', 'context_window': 131072},
+    {'model': 'anthropic/claude-3-5-haiku-20241022', 'context_window': 200000},
+    {'model': 'anthropic/claude-3.7-sonnet', 'context_window': 200000},
+    {'model': 'anthropic/claude-3.5-sonnet', 'context_window': 200000},
+    {'model': 'anthropic/claude-3.5-sonnet-20240620', 'context_window': 200000},
+    {'model': 'anthropic/claude-3-sonnet', 'context_window': 200000},
+    {'model': 'anthropic/claude-3-opus', 'context_window': 200000},
+    {'model': 'anthropic/claude-3-haiku', 'context_window': 200000},
+    {'model': 'google/gemini-flash-1.5-8b', 'context_window': 1000000},
+    {'model': 'google/gemini-flash-1.5', 'context_window': 1000000},
+    {'model': 'google/gemini-pro-1.5', 'context_window': 2000000},
+    {'model': 'google/gemma-2-27b-it', 'context_window': 8192},
+    {'model': 'google/gemma-2-9b-it', 'context_window': 8192},
+    {'model': 'google/gemma-3-4b-it', 'context_window': 131072},
+    {'model': 'google/gemma-3-12b-it', 'context_window': 131072},
+    {'model': 'google/gemma-3-27b-it', 'context_window': 131072},
+    {'model': 'google/gemini-2.0-flash-exp', 'context_window': 1048576},
+    {'model': 'google/gemini-2.0-flash-thinking-exp-1219', 'context_window': 40000},
+    {'model': 'google/gemini-2.0-flash', 'context_window': 1048576},
+    {'model': 'google/gemini-2.0-flash-lite', 'context_window': 1048576},
+    {'model': 'google/gemini-2.0-pro-experimental', 'context_window': 2000000},
+    {'model': 'google/gemini-2.5-pro-preview-03-25', 'context_window': 1048576},
+    {'model': 'x-ai/grok-beta', 'context_window': 131072},
+    {'model': 'x-ai/grok-3-beta', 'context_window': 131072},
+    {'model': 'x-ai/grok-3-mini-beta', 'context_window': 131072},
+    {'model': 'mistralai/mixtral-8x22b-instruct', 'context_window': 65536},
+    {'model': 'mistralai/mistral-large-latest', 'context_window': 131072},
+    {'model': 'mistralai/mistral-7b-instruct-v0.3', 'context_window': 32768},
+    {'model': 'deepseek/deepseek-chat', 'context_window': 64000},
+    {'model': 'openai/o3-mini', 'context_window': 200000},
+    {'model': 'openai/o3', 'context_window': 200000},
+    {'model': 'openai/o3-pro', 'context_window': 200000},
+    {'model': 'openai/o4-mini', 'context_window': 200000},
+    {'model': 'openai/gpt-4.1-nano', 'context_window': 1047576},
+    {'model': 'anthropic/claude-opus-4', 'context_window': 200000},
+    {'model': 'anthropic/claude-sonnet-4', 'context_window': 200000},
+    {'model': 'google/gemini-2.5-pro', 'context_window': 1048576},
+    {'model': 'google/gemini-2.5-flash', 'context_window': 1048576},
+    {'model': 'deepseek/deepseek-r1', 'context_window': 163840},
+    {'model': 'deepseek/deepseek-r1-0528', 'context_window': 163840},
+    {'model': 'mistralai/mistral-saba-25.02', 'context_window': 32768},
+    {'model': 'mistralai/mistral-small-3.1', 'context_window': 131072},
+    {'model': 'mistralai/mistral-medium-3', 'context_window': 131072},
+    {'model': 'mistralai/magistral-small', 'context_window': 40000},
+    {'model': 'mistralai/magistral-medium', 'context_window': 40000},
+    {'model': 'mistralai/devstral-small', 'context_window': 131072}
+]
+
 model_prices = [
     {'model': 'openai/gpt-4o-2024-08-06', 'input_price': 2.5, 'output_price': 10},
     {'model': 'openai/gpt-4o-2024-05-13', 'input_price': 5, 'output_price': 15},
@@ -138,7 +205,10 @@ model_prices = [
     {'model': 'mistralai/mistral-medium-3', 'input_price': 1, 'output_price': 3},
     {'model': 'mistralai/magistral-small', 'input_price': 0.5, 'output_price': 1.5, 'reasoning_multiplier': 15.0},
     {'model': 'mistralai/magistral-medium', 'input_price': 2, 'output_price': 6, 'reasoning_multiplier': 20.0},
-    {'model': 'mistralai/devstral-small', 'input_price': 0.3, 'output_price': 0.9}
+    {'model': 'mistralai/devstral-small', 'input_price': 0.3, 'output_price': 0.9},
+    # Embedding models used for novelty scoring
+    {'model': 'openai/text-embedding-3-large', 'input_price': 0.13, 'output_price': 0},
+    {'model': 'openai/text-embedding-3-small', 'input_price': 0.02, 'output_price': 0}
 ]
 
 lmsys_scores = [
@@ -1,32 +1,75 @@
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+import asyncio
 import os
-from functools import lru_cache
+import threading
+import time
+from functools import partial
+import numpy as np
 from retry import retry
+from embedding_cache import EmbeddingCache, DEFAULT_CACHE_PATH, DEFAULT_MAX_ENTRIES
+from embedding_batcher import EmbeddingBatcher, DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_WAIT
+from rate_limiter import AdaptiveRateLimiter, is_rate_limit_error
+from http_pool import build_http_client
+from novelty import truncate_embedding
+from embedding_backends import create_backend
+from prompt_cache import message_content, prompt_cache_stats
+from streaming import (CHAT_IDLE_TIMEOUT, CHAT_TIMEOUT, STREAM_COMPLETIONS, STREAM_OPTIONS, StreamTimeout,
+                       StreamedCompletion, acollect_stream, collect_stream, request_timeout, timed_request)
+from telemetry import record_call, usage_tokens
+from token_count import count_tokens
 
 
+# Storage format for embeddings in the cache and novelty matrices: float32, float16 or int8
+EMBEDDING_DTYPE = os.environ.get("EMBEDDING_DTYPE", "float32")
+# Attempts per call when the provider answers 429; the rate limiter paces the retries
+RATE_LIMIT_RETRIES = 6
+# Attempts per call for other errors, within the same RATE_LIMIT_RETRIES budget
+ERROR_ATTEMPTS = 3
+
 # Global clients - initialized lazily
 router_client = None
 openai_client = None
+async_router_client = None
+embedding_cache = None
+embedding_backend = None
+# One batcher per requested embedding size (None is the model's full size)
+embedding_batchers = {}
+rate_limiter = AdaptiveRateLimiter()
+_embedding_cache_lock = threading.Lock()
+_embedding_batcher_lock = threading.Lock()
+_embedding_backend_lock = threading.Lock()
 
 
 def get_router_client():
     """Get OpenRouter client, initializing if needed with helpful error messages."""
     global router_client
     if router_client is None:
-        api_key = os.environ.get("OPEN_ROUTER_KEY")
-        if not api_key:
-            raise ValueError(
-                "OPEN_ROUTER_KEY environment variable is not set.\n"
-                "Please set it with: export OPEN_ROUTER_KEY='your-key-here'\n"
-                "Get your key from: https://openrouter.ai/keys"
-            )
-        router_client = OpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=api_key
-        )
+        router_client = OpenAI(**_router_client_kwargs(),
+                               http_client=build_http_client('openrouter'))
     return router_client
 
 
+def get_async_router_client():
+    """Get the asyncio OpenRouter client used by the async engine."""
+    global async_router_client
+    if async_router_client is None:
+        async_router_client = AsyncOpenAI(**_router_client_kwargs(),
+                                          http_client=build_http_client('openrouter-async', is_async=True))
+    return async_router_client
+
+
+def _router_client_kwargs() -> dict:
+    api_key = os.environ.get("OPEN_ROUTER_KEY")
+    if not api_key:
+        raise ValueError(
+            "OPEN_ROUTER_KEY environment variable is not set.\n"
+            "Please set it with: export OPEN_ROUTER_KEY='your-key-here'\n"
+            "Get your key from: https://openrouter.ai/keys"
+        )
+    # chat_with_model does its own retries, paced by the rate limiter
+    return {"base_url": "https://openrouter.ai/api/v1", "api_key": api_key, "max_retries": 0}
+
+
 def get_openai_client():
     """Get OpenAI client, initializing if needed with helpful error messages."""
     global openai_client
@@ -38,15 +81,141 @@ def get_openai_client():
                 "Please set it with: export OPENAI_API_KEY='your-key-here'\n"
                 "Get your key from: https://platform.openai.com/api-keys"
             )
-        openai_client = OpenAI(api_key=api_key)
+        openai_client = OpenAI(api_key=api_key, http_client=build_http_client('openai'))
     return openai_client
 
-@retry(tries=3, delay=1, backoff=2)
-def chat_with_model(prompt: str, model: str, max_tokens: int = 4000, temperature: float = 0) -> str:
+def chat_with_model(prompt: str | list[str], model: str, max_tokens: int = 4000, temperature: float = 0,
+                    call_kind: str = 'generate', timeout: float = CHAT_TIMEOUT,
+                    idle_timeout: float = CHAT_IDLE_TIMEOUT) -> str:
+    """Send one user prompt; a list of segments (stable prefix first) enables prompt caching.
+
+    The call is recorded in telemetry.py under `call_kind`. With a `timeout` (total
+    seconds) or `idle_timeout` (seconds without output), or STREAM_COMPLETIONS=1, the
+    completion is streamed and StreamTimeout is raised past a deadline; see streaming.py.
+    This loop is the only retry path: 429s are retried as the rate limiter allows, other
+    errors up to ERROR_ATTEMPTS times with backoff, and timeouts not at all.
+    """
+    params = _chat_params(prompt, model, max_tokens, temperature)
+    streamed = _use_streaming(params, timeout, idle_timeout)
+    provider = provider_for_model(model)
+    start = time.monotonic()
+    queue_wait = 0.0
+    delay = 1
+    failures = 0
+    for attempt in range(RATE_LIMIT_RETRIES):
+        try:
+            wait_start = time.monotonic()
+            with rate_limiter.slot(provider) as slot:
+                queue_wait += time.monotonic() - wait_start
+                sent = time.monotonic()
+                with timed_request(sent, timeout, idle_timeout):
+                    raw_response = get_router_client().chat.completions.with_raw_response.create(**params)
+                slot.observe(raw_response.headers)
+                if streamed:
+                    completion = collect_stream(raw_response.parse(), timeout, idle_timeout, sent)
+                else:
+                    completion = raw_response.parse()
+            return _finish_chat(completion, provider, model, call_kind, start, queue_wait)
+        except StreamTimeout:
+            record_call(call_kind, model, time.monotonic() - start, queue_wait, failed=True)
+            raise
+        except Exception as e:
+            if is_rate_limit_error(e) and attempt < RATE_LIMIT_RETRIES - 1:
+                continue
+            failures += 1
+            if failures == ERROR_ATTEMPTS or attempt == RATE_LIMIT_RETRIES - 1:
+                record_call(call_kind, model, time.monotonic() - start, queue_wait, failed=True)
+                raise
+            time.sleep(delay)
+            delay *= 2
+
+
+async def achat_with_model(prompt: str | list[str], model: str, max_tokens: int = 4000, temperature: float = 0,
+                           call_kind: str = 'generate', timeout: float = CHAT_TIMEOUT,
+                           idle_timeout: float = CHAT_IDLE_TIMEOUT) -> str:
+    """Async counterpart of chat_with_model, paced by the same per-provider rate limiter."""
+    params = _chat_params(prompt, model, max_tokens, temperature)
+    streamed = _use_streaming(params, timeout, idle_timeout)
+    provider = provider_for_model(model)
+    start = time.monotonic()
+    queue_wait = 0.0
+    delay = 1
+    failures = 0
+    for attempt in range(RATE_LIMIT_RETRIES):
+        try:
+            wait_start = time.monotonic()
+            async with rate_limiter.aslot(provider) as slot:
+                queue_wait += time.monotonic() - wait_start
+                sent = time.monotonic()
+                with timed_request(sent, timeout, idle_timeout):
+                    raw_response = await get_async_router_client().chat.completions.with_raw_response.create(
+                        **params)
+                slot.observe(raw_response.headers)
+                if streamed:
+                    completion = await acollect_stream(raw_response.parse(), timeout, idle_timeout, sent)
+                else:
+                    completion = raw_response.parse()
+            return _finish_chat(completion, provider, model, call_kind, start, queue_wait)
+        except StreamTimeout:
+            record_call(call_kind, model, time.monotonic() - start, queue_wait, failed=True)
+            raise
+        except Exception as e:
+            if is_rate_limit_error(e) and attempt < RATE_LIMIT_RETRIES - 1:
+                continue
+            failures += 1
+            if failures == ERROR_ATTEMPTS or attempt == RATE_LIMIT_RETRIES - 1:
+                record_call(call_kind, model, time.monotonic() - start, queue_wait, failed=True)
+                raise
+            await asyncio.sleep(delay)
+            delay *= 2
+
+
+def _use_streaming(params: dict, timeout: float, idle_timeout: float) -> bool:
+    """Add the streaming parameters to `params` if the call is to be streamed."""
+    if not (STREAM_COMPLETIONS or timeout is not None or idle_timeout is not None):
+        return False
+    params["stream"] = True
+    params["stream_options"] = STREAM_OPTIONS
+    if timeout is not None or idle_timeout is not None:
+        params["timeout"] = request_timeout(idle_timeout, timeout)
+    return True
+
+
+def _finish_chat(completion, provider: str, model: str, call_kind: str, start: float, queue_wait: float) -> str:
+    prompt_cache_stats.record(provider, completion.usage)
+    record_call(call_kind, model, time.monotonic() - start, queue_wait, *usage_tokens(completion.usage))
+    if isinstance(completion, StreamedCompletion):
+        return completion.content
+    return completion.choices[0].message.content
+
+
+def provider_for_model(model: str) -> str:
+    """Provider prefix of an OpenRouter model name, e.g. 'anthropic' for 'anthropic/claude-3-opus'."""
+    return model.split('/')[0] if '/' in model else 'openai'
+
+
+def get_rate_limiter() -> AdaptiveRateLimiter:
+    """Shared per-provider limiter used by every chat call; `stats()` reports limits and queue depth."""
+    return rate_limiter
+
+
+def configure_rate_limiter(max_per_provider: int) -> None:
+    """Replace the shared rate limiter with one capped at `max_per_provider` concurrent requests."""
+    global rate_limiter
+    rate_limiter = AdaptiveRateLimiter(max_limit=max_per_provider)
+
+
+def reset_async_client() -> None:
+    """Drop the async client so the next event loop gets a fresh connection pool."""
+    global async_router_client
+    async_router_client = None
+
+
+def _chat_params(prompt: str | list[str], model: str, max_tokens: int, temperature: float) -> dict:
     # Default parameters for API call
     params = {
         "model": model,
-        "messages": [{"role": "user", "content": prompt}],
+        "messages": [{"role": "user", "content": message_content(prompt, provider_for_model(model))}],
         "temperature": temperature,
         "max_tokens": max_tokens
     }
@@ -62,15 +231,151 @@ def chat_with_model(prompt: str, model: str, max_tokens: int = 4000, temperature
             if reasoning_effort in ["low", "medium", "high"]:
                 params["model"] = base_model
                 params["reasoning"] = {"effort": reasoning_effort}
-    
-    response = get_router_client().chat.completions.create(**params)
-    return response.choices[0].message.content
+
+    return params
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Get the persistent embedding cache, opening it on first use.
+
+    The location and size bound can be overridden with the EMBEDDING_CACHE_PATH
+    and EMBEDDING_CACHE_MAX_ENTRIES environment variables.
+    """
+    global embedding_cache
+    with _embedding_cache_lock:
+        if embedding_cache is None:
+            embedding_cache = EmbeddingCache(
+                path=os.environ.get("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH),
+                max_entries=int(os.environ.get(
+                    "EMBEDDING_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+                dtype=EMBEDDING_DTYPE
+            )
+    return embedding_cache
+
+
+def get_embedding_batcher(dimensions: int = None) -> EmbeddingBatcher:
+    """Get the shared embedding batcher for `dimensions`, starting it on first use.
+
+    Batch size and the max time a text waits for a batch to fill can be set with
+    the EMBEDDING_BATCH_SIZE and EMBEDDING_BATCH_MAX_WAIT_MS environment variables.
+    """
+    with _embedding_batcher_lock:
+        if dimensions not in embedding_batchers:
+            embedding_batchers[dimensions] = EmbeddingBatcher(
+                partial(_embed_batch_uncached, dimensions=dimensions),
+                max_batch_size=int(os.environ.get(
+                    "EMBEDDING_BATCH_SIZE", DEFAULT_MAX_BATCH_SIZE)),
+                max_wait=float(os.environ.get(
+                    "EMBEDDING_BATCH_MAX_WAIT_MS", DEFAULT_MAX_WAIT * 1000)) / 1000
+            )
+        return embedding_batchers[dimensions]
+
+
+def get_embedding_backend():
+    """Get the embedding backend, creating it on first use from EMBEDDING_BACKEND (default "openai").
+
+    See embedding_backends.py for the available backends.
+    """
+    global embedding_backend
+    with _embedding_backend_lock:
+        if embedding_backend is None:
+            embedding_backend = create_backend(
+                os.environ.get("EMBEDDING_BACKEND", "openai"), get_openai_client)
+    return embedding_backend
+
+
+def configure_embedding_backend(spec: str) -> None:
+    """Switch to the backend described by `spec`, e.g. "hashing" or "sentence-transformers:all-MiniLM-L6-v2"."""
+    global embedding_backend
+    with _embedding_backend_lock:
+        embedding_backend = create_backend(spec, get_openai_client)
+    with _embedding_batcher_lock:
+        embedding_batchers.clear()
+
+
+def check_embedding_dimensions(dimensions: int = None) -> None:
+    """Raise ValueError if the current backend cannot produce `dimensions`-sized embeddings."""
+    backend = get_embedding_backend()
+    if dimensions is not None and not backend.supports_dimensions:
+        raise ValueError(f"The {backend.name} embedding backend does not support shortened embeddings")
+
+
+def embedding_cache_model(dimensions: int = None) -> str:
+    """Cache key for embeddings of the given backend and size; vectors of different kinds never mix."""
+    name = get_embedding_backend().name
+    return name if dimensions is None else f"{name}@{dimensions}"
+
+
+def embed(text: str, dimensions: int = None) -> np.ndarray:
+    """Embedding of `text`, shortened to `dimensions` (Matryoshka truncation) if given."""
+    cache = get_embedding_cache()
+    embedding = _cached_embedding(cache, text, dimensions)
+    if embedding is None:
+        start = time.monotonic()
+        future = get_embedding_batcher(dimensions).submit(text)
+        try:
+            embedding = future.result()
+        except Exception:
+            _record_embedding_call(text, start, future, failed=True)
+            raise
+        _record_embedding_call(text, start, future)
+        cache.put(embedding_cache_model(dimensions), text, embedding)
+    return embedding
+
+
+async def aembed(text: str, dimensions: int = None) -> np.ndarray:
+    cache = get_embedding_cache()
+    embedding = _cached_embedding(cache, text, dimensions)
+    if embedding is None:
+        start = time.monotonic()
+        future = get_embedding_batcher(dimensions).submit(text)
+        try:
+            embedding = await asyncio.wrap_future(future)
+        except Exception:
+            _record_embedding_call(text, start, future, failed=True)
+            raise
+        _record_embedding_call(text, start, future)
+        cache.put(embedding_cache_model(dimensions), text, embedding)
+    return embedding
+
+
+def embed_many(texts: list[str], dimensions: int = None) -> list[np.ndarray]:
+    """Embed many texts at once for offline work, bypassing the shared batcher.
+
+    Cache misses are de-duplicated and sent in batches of EMBEDDING_BATCH_SIZE.
+    """
+    cache = get_embedding_cache()
+    embeddings = {}
+    for text in texts:
+        if text not in embeddings:
+            embeddings[text] = _cached_embedding(cache, text, dimensions)
+    missing = [text for text, embedding in embeddings.items() if embedding is None]
+    batch_size = int(os.environ.get("EMBEDDING_BATCH_SIZE", DEFAULT_MAX_BATCH_SIZE))
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start:start + batch_size]
+        batch_embeddings = _embed_batch_uncached(batch, dimensions)
+        embeddings.update(zip(batch, batch_embeddings))
+        cache.put_many(embedding_cache_model(dimensions), zip(batch, batch_embeddings))
+    return [embeddings[text] for text in texts]
+
+
+def _record_embedding_call(text: str, start: float, future, failed: bool = False) -> None:
+    """Telemetry for one cache miss; the batch request is shared, so tokens are this text's share."""
+    queue_wait = getattr(future, 'sent_at', start) - start
+    record_call('embedding', get_embedding_backend().name, time.monotonic() - start, queue_wait,
+                prompt_tokens=0 if failed else count_tokens(text), failed=failed)
+
+
+def _cached_embedding(cache: EmbeddingCache, text: str, dimensions: int = None):
+    embedding = cache.get(embedding_cache_model(dimensions), text)
+    if embedding is None and dimensions is not None and get_embedding_backend().matryoshka:
+        # A cached full-size Matryoshka vector truncates to the same result the API would return
+        full = cache.get(embedding_cache_model(), text)
+        if full is not None:
+            embedding = truncate_embedding(full, dimensions)
+    return embedding
 
 
-@lru_cache(maxsize=10000)
 @retry(tries=3, delay=1, backoff=2)
-def embed(text: str) -> list[float]:
-    model_name = "text-embedding-3-large"
-    response = get_openai_client().embeddings.create(
-        model=model_name, input=[text])
-    return response.data[0].embedding
+def _embed_batch_uncached(texts: list[str], dimensions: int = None) -> list[np.ndarray]:
+    return get_embedding_backend().embed_batch(texts, dimensions)
@@ -0,0 +1,335 @@
+import threading
+
+import numpy as np
+
+
+from quantization import EMBEDDING_DTYPES, quantize, dequantize
+
+
+NOVELTY_BACKENDS = ('exact', 'ivf', 'verify')
+# Rows dequantized per block when scoring compact storage, bounding the float32 scratch memory
+_SCORE_BLOCK_ROWS = 4096
+
+
+class NoveltyMatrix:
+    """Growing matrix of unit-normalized answer embeddings for a single question chain.
+
+    Rows are normalized once on insertion, so the max cosine similarity of a new
+    answer against every previous one is a single matrix-vector product. Rows are
+    stored as `dtype` ('float32', 'float16' or 'int8'; see quantization.py for the
+    memory/accuracy trade-off) and scored in float32 a block at a time.
+    """
+
+    def __init__(self, dim: int = None, initial_capacity: int = 64, dtype: str = 'float32'):
+        if dtype not in EMBEDDING_DTYPES:
+            raise ValueError(f"Unknown embedding dtype: {dtype}")
+        self.dtype = dtype
+        self._initial_capacity = initial_capacity
+        self._rows = None
+        self._scales = np.empty(initial_capacity, dtype=np.float32)
+        self._size = 0
+        if dim is not None:
+            self._rows = np.empty((initial_capacity, dim), dtype=np.dtype(dtype))
+
+    @classmethod
+    def from_embeddings(cls, embeddings, dtype: str = 'float32') -> 'NoveltyMatrix':
+        """Rebuild the matrix from stored embeddings, e.g. when resuming a chain."""
+        matrix = cls(dtype=dtype)
+        for embedding in embeddings:
+            matrix.add(embedding)
+        return matrix
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, embedding) -> None:
+        values, scale = quantize(normalize(embedding), self.dtype)
+        if self._rows is None:
+            self._rows = np.empty((self._initial_capacity, values.shape[0]), dtype=values.dtype)
+        elif self._size == self._rows.shape[0]:
+            grown = np.empty((self._rows.shape[0] * 2, self._rows.shape[1]), dtype=self._rows.dtype)
+            grown[:self._size] = self._rows[:self._size]
+            self._rows = grown
+            self._scales = np.resize(self._scales, grown.shape[0])
+        self._rows[self._size] = values
+        self._scales[self._size] = scale
+        self._size += 1
+
+    def similarities(self, embedding) -> np.ndarray:
+        """Cosine similarity of `embedding` against every stored row."""
+        if not self._size:
+            return np.empty(0, dtype=np.float32)
+        query = normalize(embedding)
+        if self.dtype == 'float32':
+            return self._rows[:self._size] @ query
+        return np.concatenate([
+            self._score(np.arange(start, min(start + _SCORE_BLOCK_ROWS, self._size)), query)
+            for start in range(0, self._size, _SCORE_BLOCK_ROWS)
+        ])
+
+    def row_similarities(self, rows: np.ndarray, embedding) -> np.ndarray:
+        """Cosine similarity of `embedding` against the given row indices."""
+        return self._score(rows, normalize(embedding))
+
+    def novelty(self, embedding) -> float:
+        """1 - max cosine similarity against the stored rows (1.0 when empty)."""
+        return self.score(embedding)[0]
+
+    def score(self, embedding) -> tuple[float, np.ndarray]:
+        """Novelty of `embedding` and its similarity against every stored row."""
+        similarities = self.similarities(embedding)
+        return (float(1 - similarities.max()) if len(similarities) else 1.0), similarities
+
+    def vectors(self) -> np.ndarray:
+        """float32 copy (a view for float32 storage) of the stored unit-normalized rows."""
+        if not self._size:
+            return np.empty((0, 0), dtype=np.float32)
+        if self.dtype == 'float32':
+            return self._rows[:self._size]
+        return dequantize(self._rows[:self._size], self._scales[:self._size, None])
+
+    def nbytes(self) -> int:
+        """Bytes held by the stored rows and their scales, including spare capacity."""
+        return (self._rows.nbytes if self._rows is not None else 0) + self._scales.nbytes
+
+    def _score(self, rows: np.ndarray, query: np.ndarray) -> np.ndarray:
+        if self.dtype == 'float32':
+            return self._rows[rows] @ query
+        similarities = self._rows[rows].astype(np.float32) @ query
+        return similarities * self._scales[rows] if self.dtype == 'int8' else similarities
+
+
+class IVFNoveltyIndex:
+    """Inverted-file approximate index over a chain's answer embeddings.
+
+    Rows are clustered with spherical k-means into about sqrt(n) lists; a query
+    only scores the rows in the `nprobe` lists whose centroids are nearest, and
+    those candidates are re-checked with exact cosine against the stored rows.
+    Below `min_train_size` rows every query is exact, and the clustering is
+    retrained whenever the chain has doubled in size since the last training.
+
+    Because it can only miss neighbors, the approximate novelty is never lower
+    than the exact one: the index may let a chain run past the answer where an
+    exact check would have stopped it, but never stops one early.
+    """
+
+    def __init__(self, nprobe: int = 8, min_train_size: int = 1024, kmeans_iterations: int = 10,
+                 dtype: str = 'float32'):
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.kmeans_iterations = kmeans_iterations
+        self._matrix = NoveltyMatrix(dtype=dtype)
+        self._centroids = None
+        self._lists = []
+        self._trained_size = 0
+
+    @classmethod
+    def from_embeddings(cls, embeddings, **kwargs) -> 'IVFNoveltyIndex':
+        index = cls(**kwargs)
+        for embedding in embeddings:
+            index._matrix.add(embedding)
+        index._maybe_train()
+        return index
+
+    def __len__(self) -> int:
+        return len(self._matrix)
+
+    def add(self, embedding) -> None:
+        self._matrix.add(embedding)
+        if self._centroids is not None and len(self._matrix) < 2 * self._trained_size:
+            row = len(self._matrix) - 1
+            self._lists[int(np.argmax(self._centroids @ normalize(embedding)))].append(row)
+        else:
+            self._maybe_train()
+
+    def similarities(self, embedding) -> np.ndarray:
+        """Exact cosine similarity against every stored row."""
+        return self._matrix.similarities(embedding)
+
+    def nbytes(self) -> int:
+        """Bytes held by the rows, the centroids and the inverted lists (as int64)."""
+        centroids = self._centroids.nbytes if self._centroids is not None else 0
+        return self._matrix.nbytes() + centroids + 8 * sum(len(rows) for rows in self._lists)
+
+    def novelty(self, embedding) -> float:
+        return self.score(embedding)[0]
+
+    def score(self, embedding) -> tuple[float, np.ndarray]:
+        """Approximate novelty, with the full similarity vector only if it was computed (else None)."""
+        if not len(self._matrix):
+            return 1.0, np.empty(0, dtype=np.float32)
+        _, similarities = self._candidates(embedding)
+        # Before training the candidates are every row, in order
+        return float(1 - similarities.max()), (similarities if self._centroids is None else None)
+
+    def _candidates(self, embedding) -> tuple[np.ndarray, np.ndarray]:
+        """Rows in the probed lists and their exact cosine similarities."""
+        if self._centroids is None:
+            return np.arange(len(self._matrix)), self._matrix.similarities(embedding)
+
+        query = normalize(embedding)
+        nprobe = min(self.nprobe, len(self._centroids))
+        probed = np.argpartition(-(self._centroids @ query), nprobe - 1)[:nprobe]
+        rows = np.concatenate([np.asarray(self._lists[i], dtype=np.int64) for i in probed])
+        if not len(rows):
+            return np.arange(len(self._matrix)), self._matrix.similarities(embedding)
+        return rows, self._matrix.row_similarities(rows, query)
+
+    def _maybe_train(self) -> None:
+        size = len(self._matrix)
+        if size < self.min_train_size:
+            return
+
+        vectors = self._matrix.vectors()
+        num_lists = max(1, int(np.sqrt(size)))
+        rng = np.random.default_rng(0)
+        centroids = vectors[rng.choice(size, num_lists, replace=False)].copy()
+        for _ in range(self.kmeans_iterations):
+            assignments = np.argmax(vectors @ centroids.T, axis=1)
+            for i in range(num_lists):
+                members = vectors[assignments == i]
+                if len(members):
+                    centroids[i] = normalize(members.sum(axis=0))
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+
+        self._centroids = centroids
+        self._lists = [np.flatnonzero(assignments == i).tolist() for i in range(num_lists)]
+        self._trained_size = size
+
+
+class VerifiedNoveltyIndex:
+    """Runs the exact and IVF backends side by side and scores with the exact one.
+
+    Every query also checks whether the IVF novelty would have made the same
+    termination decision (novelty below `threshold`) and records the outcome in
+    `verification_stats`.
+    """
+
+    def __init__(self, threshold: float = None, dtype: str = 'float32', **ivf_kwargs):
+        self.threshold = threshold
+        self._exact = NoveltyMatrix(dtype=dtype)
+        self._ivf = IVFNoveltyIndex(dtype=dtype, **ivf_kwargs)
+
+    @classmethod
+    def from_embeddings(cls, embeddings, threshold: float = None, dtype: str = 'float32',
+                        **ivf_kwargs) -> 'VerifiedNoveltyIndex':
+        index = cls(threshold, dtype, **ivf_kwargs)
+        for embedding in embeddings:
+            index._exact.add(embedding)
+            index._ivf._matrix.add(embedding)
+        index._ivf._maybe_train()
+        return index
+
+    def __len__(self) -> int:
+        return len(self._exact)
+
+    def add(self, embedding) -> None:
+        self._exact.add(embedding)
+        self._ivf.add(embedding)
+
+    def similarities(self, embedding) -> np.ndarray:
+        return self._exact.similarities(embedding)
+
+    def nbytes(self) -> int:
+        return self._exact.nbytes() + self._ivf.nbytes()
+
+    def novelty(self, embedding) -> float:
+        return self.score(embedding)[0]
+
+    def score(self, embedding) -> tuple[float, np.ndarray]:
+        exact, similarities = self._exact.score(embedding)
+        approximate = self._ivf.novelty(embedding)
+        if self.threshold is None:
+            matched = abs(exact - approximate) < 1e-6
+        else:
+            matched = (exact < self.threshold) == (approximate < self.threshold)
+        verification_stats.record(matched, approximate - exact)
+        return exact, similarities
+
+
+class VerificationStats:
+    """How often the IVF backend agreed with exact novelty on the termination decision."""
+
+    def __init__(self):
+        self.queries = 0
+        self.mismatches = 0
+        self.max_error = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, matched: bool, error: float) -> None:
+        with self._lock:
+            self.queries += 1
+            self.mismatches += not matched
+            self.max_error = max(self.max_error, abs(error))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'queries': self.queries,
+                'mismatches': self.mismatches,
+                'max_error': self.max_error,
+            }
+
+
+verification_stats = VerificationStats()
+
+
+class IndexMemoryStats:
+    """Memory held by each chain's novelty index when the chain finished."""
+
+    def __init__(self):
+        self.chains = 0
+        self.total_bytes = 0
+        self.max_bytes = 0
+        self._lock = threading.Lock()
+
+    def record(self, nbytes: int) -> None:
+        with self._lock:
+            self.chains += 1
+            self.total_bytes += nbytes
+            self.max_bytes = max(self.max_bytes, nbytes)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'chains': self.chains,
+                'mean_bytes': self.total_bytes / self.chains if self.chains else 0.0,
+                'max_bytes': self.max_bytes,
+            }
+
+
+index_memory_stats = IndexMemoryStats()
+
+
+def build_novelty_index(embeddings, backend: str = 'exact', threshold: float = None,
+                        dtype: str = 'float32'):
+    """Novelty index of the given `backend` (see NOVELTY_BACKENDS) over `embeddings`.
+
+    `threshold` is the embedding novelty below which a chain stops; only the
+    'verify' backend uses it. Rows are stored as `dtype` (see EMBEDDING_DTYPES).
+    """
+    if backend == 'exact':
+        return NoveltyMatrix.from_embeddings(embeddings, dtype)
+    if backend == 'ivf':
+        return IVFNoveltyIndex.from_embeddings(embeddings, dtype=dtype)
+    if backend == 'verify':
+        return VerifiedNoveltyIndex.from_embeddings(embeddings, threshold, dtype)
+    raise ValueError(f"Unknown novelty backend: {backend}")
+
+
+def truncate_embedding(embedding, dimensions: int = None) -> np.ndarray:
+    """First `dimensions` components of a Matryoshka embedding, re-normalized.
+
+    text-embedding-3 models are trained so that this matches what the API returns
+    when asked for `dimensions` directly.
+    """
+    vector = np.asarray(embedding, dtype=np.float32)
+    if dimensions is None or dimensions >= vector.shape[-1]:
+        return vector
+    return normalize(vector[:dimensions])
+
+
+def normalize(embedding) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
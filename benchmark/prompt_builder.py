@@ -0,0 +1,212 @@
+"""Answer-generation prompts built incrementally, one per chain.
+
+The prompt for answer k is a fixed prefix (question and instructions) followed by
+all k-1 previous answers. Rebuilding it from the answer list on every call renders
+and joins every previous answer again, so a chain of n answers renders O(n^2)
+fragments. `AnswerPromptBuilder` renders each answer into the chain's buffer once,
+when it first appears, and keeps a running token count alongside, so a call only
+pays for copying the finished prompt out of the buffer.
+"""
+import collections
+import io
+import math
+import threading
+
+from token_count import count_tokens
+
+_COT_INSTRUCTIONS = (
+    "Let's approach this methodically:\n\n"
+    "1. First, carefully review any previous answers to avoid repetition:\n"
+    "- Analyze the core concepts and themes already covered\n"
+    "- Identify unexplored angles and perspectives\n\n"
+    "2. Brainstorm fresh approaches:\n"
+    "- Generate multiple unique possibilities\n"
+    "- Consider unconventional but valid perspectives\n"
+    "- Look for interesting connections or insights\n\n"
+    "3. Develop your chosen idea:\n"
+    "- Reason through the logic step-by-step\n"
+    "- Validate your reasoning\n\n"
+    "Show your complete thinking process in <thoughts></thoughts> XML tags.\n"
+    "When ready, provide your final response in <answer></answer> XML tags.\n"
+)
+_PREVIOUS_ANSWERS_HEADER = (
+    "IMPORTANT: Provide an answer you *HAVE NOT* given previously.\n"
+    "Your previous answers are inside of <previous_answers></previous_answers> XML tags.\n"
+    "<previous_answers>\n"
+)
+_PREVIOUS_ANSWERS_FOOTER = "\n</previous_answers>"
+_ANSWER_SEPARATOR = "\n\n"
+_HEADER_TOKENS = count_tokens(_PREVIOUS_ANSWERS_HEADER + _PREVIOUS_ANSWERS_FOOTER)
+_SEPARATOR_TOKENS = count_tokens(_ANSWER_SEPARATOR)
+# A compressed prompt is cut back to this fraction of its token budget
+_COMPRESS_TARGET = 0.75
+
+
+def answer_prompt_prefix(question: str, cot: bool) -> str:
+    """Everything in the answer prompt before the previous answers."""
+    prefix = (
+        "Answer the following question:.\n"
+        "<question>" + question + "</question>\n"
+        "Provide your answer in <answer></answer> XML tags.\n"
+    )
+    if cot:
+        prefix += _COT_INSTRUCTIONS
+    return prefix + "Your response should be one direct answer. Only provide one answer. DO NOT list multiple answers. Please try to be concise.\n"
+
+
+def render_previous_answer(answer_id: int, answer: str) -> str:
+    return f"<previous_answer id='{answer_id}'>\n{answer}\n</previous_answer>"
+
+
+class AnswerPromptBuilder:
+    """Answer prompts for one chain, extended as the chain's answer list grows.
+
+    `build` takes the chain's answers so far; answers already rendered are only
+    counted, so the list must keep its earlier entries (it may only grow). A list
+    shorter than what was rendered starts the buffer over.
+
+    With a `token_budget`, a prompt that outgrows it is compressed: the oldest
+    previous answers are dropped until it is back under `_COMPRESS_TARGET` of the
+    budget. The slack means the buffer is only rebuilt now and then, and the
+    cached prompt prefix stays stable between rebuilds.
+    """
+
+    def __init__(self, question: str, cot: bool = False, token_budget: int = None):
+        self._prefix = answer_prompt_prefix(question, cot)
+        self._prefix_tokens = count_tokens(self._prefix)
+        self.token_budget = token_budget
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self._fragments = collections.deque()  # (rendered previous answer, tokens) in the prompt
+        self._rendered = 0
+        self.omitted = 0  # oldest previous answers left out of the prompt
+        self._rebuild()
+
+    def _rebuild(self) -> None:
+        self._buffer = io.StringIO()
+        self._buffer.write(self._prefix + _PREVIOUS_ANSWERS_HEADER)
+        self._answers_tokens = _HEADER_TOKENS
+        self._newest_start = self._buffer.tell()
+        for i, (fragment, tokens) in enumerate(self._fragments):
+            self._write(fragment, tokens, first=i == 0)
+
+    def _write(self, fragment: str, tokens: int, first: bool) -> None:
+        self._newest_start = self._buffer.tell()
+        if not first:
+            self._buffer.write(_ANSWER_SEPARATOR)
+            tokens += _SEPARATOR_TOKENS
+        self._buffer.write(fragment)
+        self._answers_tokens += tokens
+
+    def build(self, previous_answers: list) -> tuple[str, int]:
+        """The prompt for the next answer after `previous_answers`, and its size in tokens."""
+        with self._lock:
+            if not previous_answers:
+                return self._prefix, self._prefix_tokens
+            self._extend(previous_answers)
+            return (self._buffer.getvalue() + _PREVIOUS_ANSWERS_FOOTER,
+                    self._prefix_tokens + self._answers_tokens)
+
+    def segments(self, previous_answers: list) -> tuple[list[str], int]:
+        """Like `build`, with the prompt split for prompt caching (see prompt_cache.py).
+
+        The segments are everything before the newest previous answer (what the
+        chain's last call ended its cached prefix with), the newest answer, and the
+        closing tag.
+        """
+        with self._lock:
+            if not previous_answers:
+                return [self._prefix], self._prefix_tokens
+            self._extend(previous_answers)
+            rendered = self._buffer.getvalue()
+            return ([rendered[:self._newest_start], rendered[self._newest_start:], _PREVIOUS_ANSWERS_FOOTER],
+                    self._prefix_tokens + self._answers_tokens)
+
+    def prompt_tokens(self, previous_answers: list) -> int:
+        """Size in tokens of the prompt `build` would return."""
+        with self._lock:
+            if not previous_answers:
+                return self._prefix_tokens
+            self._extend(previous_answers)
+            return self._prefix_tokens + self._answers_tokens
+
+    def _extend(self, previous_answers: list) -> None:
+        if len(previous_answers) < self._rendered:
+            self._reset()
+        for i in range(self._rendered, len(previous_answers)):
+            fragment = render_previous_answer(i + 1, previous_answers[i])
+            tokens = count_tokens(fragment)
+            self._write(fragment, tokens, first=not self._fragments)
+            self._fragments.append((fragment, tokens))
+        self._rendered = len(previous_answers)
+
+        if self.token_budget is not None and self._prefix_tokens + self._answers_tokens > self.token_budget:
+            self._compress()
+
+    def _compress(self) -> None:
+        target = int(self.token_budget * _COMPRESS_TARGET)
+        total = self._prefix_tokens + self._answers_tokens
+        dropped = 0
+        # Always keep the newest answer, even if it alone is over budget
+        while len(self._fragments) > 1 and total > target:
+            _, tokens = self._fragments.popleft()
+            total -= tokens + _SEPARATOR_TOKENS
+            dropped += 1
+        self.omitted += dropped
+        self._rebuild()
+        prompt_stats.record_compression(dropped)
+
+
+class PromptStats:
+    """Answer-generation latency grouped by prompt size.
+
+    Calls are bucketed by prompt tokens in powers of two, so the per-bucket latency
+    shows where growing context starts to dominate generation time.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.total_tokens = 0
+        self.max_tokens = 0
+        self.compressions = 0
+        self.omitted_answers = 0
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def record(self, prompt_tokens: int, latency: float) -> None:
+        bucket = 2 ** int(math.log2(prompt_tokens)) if prompt_tokens > 0 else 0
+        with self._lock:
+            self.calls += 1
+            self.total_tokens += prompt_tokens
+            self.max_tokens = max(self.max_tokens, prompt_tokens)
+            calls, tokens, seconds = self._buckets.get(bucket, (0, 0, 0.0))
+            self._buckets[bucket] = (calls + 1, tokens + prompt_tokens, seconds + latency)
+
+    def record_compression(self, omitted_answers: int) -> None:
+        with self._lock:
+            self.compressions += 1
+            self.omitted_answers += omitted_answers
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'compressions': self.compressions,
+                'omitted_answers': self.omitted_answers,
+                'mean_tokens': self.total_tokens / self.calls if self.calls else 0.0,
+                'max_tokens': self.max_tokens,
+                'buckets': [
+                    {
+                        'min_tokens': bucket,
+                        'calls': calls,
+                        'mean_tokens': tokens / calls,
+                        'mean_latency': seconds / calls,
+                    }
+                    for bucket, (calls, tokens, seconds) in sorted(self._buckets.items())
+                ],
+            }
+
+
+prompt_stats = PromptStats()
@@ -0,0 +1,69 @@
+"""Provider prompt caching for chat calls.
+
+A prompt may be given as a list of segments whose concatenation is the prompt,
+with the stable part first. Providers that cache prompt prefixes automatically
+(OpenAI and most others behind OpenRouter) get the joined string. Their cache
+already matches the longest previously seen prefix. Providers that need explicit
+breakpoints (Anthropic, or whatever `PROMPT_CACHE_CONTROL_PROVIDERS` lists) get
+one text block per segment, with an ephemeral `cache_control` marker at the end
+of every segment but the last. Cached prompt tokens reported in the response
+usage are counted per provider.
+
+Set `PROMPT_CACHING=0` to always send plain string prompts.
+"""
+import os
+import threading
+
+PROMPT_CACHING = os.environ.get("PROMPT_CACHING", "1") != "0"
+CACHE_CONTROL_PROVIDERS = set(
+    os.environ.get("PROMPT_CACHE_CONTROL_PROVIDERS", "anthropic").split(","))
+# Anthropic honours at most four breakpoints per request
+MAX_CACHE_BREAKPOINTS = 4
+
+
+def message_content(prompt, provider: str):
+    """User message content for `prompt` (a string or a list of segments) sent to `provider`."""
+    if isinstance(prompt, str):
+        return prompt
+    if not PROMPT_CACHING or provider not in CACHE_CONTROL_PROVIDERS:
+        return "".join(prompt)
+
+    segments = [segment for segment in prompt if segment]
+    breakpoints = range(max(0, len(segments) - 1 - MAX_CACHE_BREAKPOINTS), len(segments) - 1)
+    blocks = [{"type": "text", "text": segment} for segment in segments]
+    for i in breakpoints:
+        blocks[i]["cache_control"] = {"type": "ephemeral"}
+    return blocks
+
+
+class PromptCacheStats:
+    """Prompt tokens and the cached share of them, per provider."""
+
+    def __init__(self):
+        self._providers = {}
+        self._lock = threading.Lock()
+
+    def record(self, provider: str, usage) -> None:
+        if usage is None:
+            return
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached_tokens = (getattr(details, 'cached_tokens', None) or 0) if details else 0
+        with self._lock:
+            calls, prompt_tokens, cached = self._providers.get(provider, (0, 0, 0))
+            self._providers[provider] = (calls + 1, prompt_tokens + (usage.prompt_tokens or 0),
+                                         cached + cached_tokens)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                provider: {
+                    'calls': calls,
+                    'prompt_tokens': prompt_tokens,
+                    'cached_tokens': cached,
+                    'cached_fraction': cached / prompt_tokens if prompt_tokens else 0.0,
+                }
+                for provider, (calls, prompt_tokens, cached) in self._providers.items()
+            }
+
+
+prompt_cache_stats = PromptCacheStats()
@@ -1,51 +1,56 @@
 import re
-from models import chat_with_model
+import time
+from models import chat_with_model, achat_with_model
+from prompt_builder import AnswerPromptBuilder, prompt_stats
 
 
-def gen_answer(question: str, previous_answers: list, model_name: str, cot=False) -> str:
-    base_prompt = (
-        "Answer the following question:.\n"
-        "<question>" + question + "</question>\n"
-        "Provide your answer in <answer></answer> XML tags.\n"
-    )
+def gen_answer(question: str, previous_answers: list, model_name: str, cot=False,
+               prompt_builder: AnswerPromptBuilder = None) -> str:
+    """Generate the next answer. Pass the chain's `prompt_builder` to reuse its rendered prompt."""
+    prompt, prompt_tokens = (prompt_builder or AnswerPromptBuilder(question, cot)).segments(previous_answers)
+    start = time.time()
+    response = chat_with_model(prompt, model=model_name, temperature=0.7)
+    prompt_stats.record(prompt_tokens, time.time() - start)
+    return _extract_xml_content(response, "answer")
 
-    if cot:
-        base_prompt += (
-            "Let's approach this methodically:\n\n"
-            "1. First, carefully review any previous answers to avoid repetition:\n"
-            "- Analyze the core concepts and themes already covered\n"
-            "- Identify unexplored angles and perspectives\n\n"
-            "2. Brainstorm fresh approaches:\n"
-            "- Generate multiple unique possibilities\n"
-            "- Consider unconventional but valid perspectives\n"
-            "- Look for interesting connections or insights\n\n"
-            "3. Develop your chosen idea:\n"
-            "- Reason through the logic step-by-step\n"
-            "- Validate your reasoning\n\n"
-            "Show your complete thinking process in <thoughts></thoughts> XML tags.\n"
-            "When ready, provide your final response in <answer></answer> XML tags.\n"
-        )
-
-    base_prompt += "Your response should be one direct answer. Only provide one answer. DO NOT list multiple answers. Please try to be concise.\n"
-
-    if previous_answers:
-
-        previous_answers_str = "\n\n".join(
-            [f"<previous_answer id='{i+1}'>\n{answer}\n</previous_answer>" for i, answer in enumerate(previous_answers)]
-        )
-        base_prompt += (
-            "IMPORTANT: Provide an answer you *HAVE NOT* given previously.\n"
-            "Your previous answers are inside of <previous_answers></previous_answers> XML tags.\n"
-            "<previous_answers>\n" + previous_answers_str + "\n</previous_answers>"
-        )
 
-    response = chat_with_model(
-        base_prompt, model=model_name, temperature=0.7)
+async def agen_answer(question: str, previous_answers: list, model_name: str, cot=False,
+                      prompt_builder: AnswerPromptBuilder = None) -> str:
+    prompt, prompt_tokens = (prompt_builder or AnswerPromptBuilder(question, cot)).segments(previous_answers)
+    start = time.time()
+    response = await achat_with_model(prompt, model=model_name, temperature=0.7)
+    prompt_stats.record(prompt_tokens, time.time() - start)
     return _extract_xml_content(response, "answer")
 
 
 def judge_answer(question: str, answer: str, model_name: str) -> int:
-    prompt = (
+    response = chat_with_model(_judge_answer_prompt(question, answer), model="o1-mini",
+                               call_kind='coherence_judge')
+    return int(_extract_xml_content(response, "coherence_score"))
+
+
+async def ajudge_answer(question: str, answer: str, model_name: str) -> int:
+    response = await achat_with_model(_judge_answer_prompt(question, answer), model="o1-mini",
+                                      call_kind='coherence_judge')
+    return int(_extract_xml_content(response, "coherence_score"))
+
+
+def judge_similarity(question: str, answer1: str, answer2: str, model_name: str) -> float:
+    response = chat_with_model(
+        _judge_similarity_prompt(question, answer1, answer2), model="o1-mini",
+        call_kind='similarity_judge')
+    return int(_extract_xml_content(response, "similarity_score")) / 100
+
+
+async def ajudge_similarity(question: str, answer1: str, answer2: str, model_name: str) -> float:
+    response = await achat_with_model(
+        _judge_similarity_prompt(question, answer1, answer2), model="o1-mini",
+        call_kind='similarity_judge')
+    return int(_extract_xml_content(response, "similarity_score")) / 100
+
+
+def _judge_answer_prompt(question: str, answer: str) -> str:
+    return (
         "Your task is to evaluate the coherence and plausibility of an answer to a given question.\n\n"
         "Question: <question>" + question + "</question>\n"
         "Answer: <answer>" + answer + "</answer>\n\n"
@@ -80,12 +85,10 @@ def judge_answer(question: str, answer: str, model_name: str) -> int:
         "<coherence_score>75</coherence_score>\n\n"
         "Do not include any additional text in your response."
     )
-    response = chat_with_model(prompt, model="o1-mini")
-    return int(_extract_xml_content(response, "coherence_score"))
 
 
-def judge_similarity(question: str, answer1: str, answer2: str, model_name: str) -> float:
-    prompt = (
+def _judge_similarity_prompt(question: str, answer1: str, answer2: str) -> str:
+    return (
         "Your task is to evaluate how semantically similar two answers are to the same question, "
         "focusing on core concepts and meaning rather than exact wording.\n\n"
         "Original Question: <question>" + question + "</question>\n"
@@ -102,8 +105,6 @@ def judge_similarity(question: str, answer1: str, answer2: str, model_name: str)
         "<similarity_score>75</similarity_score>\n\n"
         "Do not include any additional text in your response."
     )
-    response = chat_with_model(prompt, model="o1-mini")
-    return int(_extract_xml_content(response, "similarity_score")) / 100
 
 
 def _extract_xml_content(text: str, tag: str) -> str:
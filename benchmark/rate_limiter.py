@@ -0,0 +1,232 @@
+import asyncio
+import re
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+from email.utils import parsedate_to_datetime
+
+
+DEFAULT_INITIAL_LIMIT = 8
+DEFAULT_MAX_LIMIT = 50
+
+
+class ProviderLimiter:
+    """AIMD concurrency controller for one provider.
+
+    The number of requests allowed in flight grows by roughly one per window of
+    successful requests and is halved on every rate-limit response. A Retry-After
+    (or exhausted x-ratelimit-remaining) header pauses new requests until the
+    provider says it is ready again.
+    """
+
+    def __init__(self, initial_limit: float = DEFAULT_INITIAL_LIMIT, max_limit: int = DEFAULT_MAX_LIMIT,
+                 min_limit: int = 1):
+        self.limit = float(min(initial_limit, max_limit))
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.in_flight = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.paused_until = 0.0
+        self.successes = 0
+        self.rate_limited = 0
+        self._cond = threading.Condition()
+        self._async_waiters = []  # (event loop, future) of aacquire calls waiting for a release
+
+    def acquire(self) -> None:
+        with self._cond:
+            self._enqueue()
+            try:
+                while not self._can_start():
+                    # Only a pause ends without a release, so only then is a timeout needed
+                    paused_for = self.paused_until - time.monotonic()
+                    self._cond.wait(paused_for if paused_for > 0 else None)
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+
+    async def aacquire(self) -> None:
+        """Like `acquire`, but waits on a future that `release` resolves from any thread."""
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            self._enqueue()
+        try:
+            while True:
+                with self._cond:
+                    if self._can_start():
+                        self.in_flight += 1
+                        return
+                    waiter = (loop, loop.create_future())
+                    self._async_waiters.append(waiter)
+                    # Only a pause ends without a release, so only then is a timeout needed
+                    paused_for = self.paused_until - time.monotonic()
+                try:
+                    await asyncio.wait_for(waiter[1], paused_for if paused_for > 0 else None)
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    with self._cond:
+                        if waiter in self._async_waiters:
+                            self._async_waiters.remove(waiter)
+        finally:
+            with self._cond:
+                self.waiting -= 1
+
+    def release(self, outcome: str = 'ok', headers=None) -> None:
+        """Return a slot; `outcome` is 'ok', 'rate_limited' or 'error' (which leaves the limit alone)."""
+        with self._cond:
+            self.in_flight -= 1
+            pause = _pause_from_headers(headers) if headers is not None else None
+            if outcome == 'rate_limited':
+                self.rate_limited += 1
+                self.limit = max(self.min_limit, self.limit / 2)
+                # Back off briefly even when the provider doesn't say for how long
+                pause = pause if pause is not None else 1.0
+            elif outcome == 'ok':
+                self.successes += 1
+                if pause is None:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            if pause is not None:
+                self.paused_until = max(self.paused_until, time.monotonic() + pause)
+            self._cond.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'limit': int(self.limit),
+                'in_flight': self.in_flight,
+                'queue_depth': self.waiting,
+                'max_queue_depth': self.max_waiting,
+                'paused_for': max(0.0, self.paused_until - time.monotonic()),
+                'successes': self.successes,
+                'rate_limited': self.rate_limited,
+            }
+
+    def _enqueue(self) -> None:
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+
+    def _can_start(self) -> bool:
+        return self.in_flight < int(self.limit) and time.monotonic() >= self.paused_until
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class AdaptiveRateLimiter:
+    """One ProviderLimiter per provider prefix (`openai`, `anthropic`, `google`, ...)."""
+
+    def __init__(self, max_limit: int = DEFAULT_MAX_LIMIT, initial_limit: float = DEFAULT_INITIAL_LIMIT):
+        self.max_limit = max_limit
+        self.initial_limit = initial_limit
+        self._providers = {}
+        self._lock = threading.Lock()
+
+    def for_provider(self, provider: str) -> ProviderLimiter:
+        with self._lock:
+            if provider not in self._providers:
+                self._providers[provider] = ProviderLimiter(self.initial_limit, self.max_limit)
+            return self._providers[provider]
+
+    @contextmanager
+    def slot(self, provider: str):
+        """Hold one in-flight request slot; yields a Slot to report response headers on."""
+        limiter = self.for_provider(provider)
+        limiter.acquire()
+        slot = Slot()
+        try:
+            yield slot
+        except Exception as e:
+            limiter.release(_error_outcome(e), headers=_error_headers(e))
+            raise
+        else:
+            limiter.release(headers=slot.headers)
+
+    @asynccontextmanager
+    async def aslot(self, provider: str):
+        limiter = self.for_provider(provider)
+        await limiter.aacquire()
+        slot = Slot()
+        try:
+            yield slot
+        except Exception as e:
+            limiter.release(_error_outcome(e), headers=_error_headers(e))
+            raise
+        else:
+            limiter.release(headers=slot.headers)
+
+    def stats(self) -> dict:
+        with self._lock:
+            providers = dict(self._providers)
+        return {provider: limiter.stats() for provider, limiter in sorted(providers.items())}
+
+
+class Slot:
+    headers = None
+
+    def observe(self, headers) -> None:
+        self.headers = headers
+
+
+def is_rate_limit_error(e: Exception) -> bool:
+    return getattr(e, 'status_code', None) == 429
+
+
+def _error_outcome(e: Exception) -> str:
+    return 'rate_limited' if is_rate_limit_error(e) else 'error'
+
+
+def _error_headers(e: Exception):
+    response = getattr(e, 'response', None)
+    return getattr(response, 'headers', None)
+
+
+def _pause_from_headers(headers) -> float:
+    """Seconds to wait before the next request, or None if the headers don't ask for a pause."""
+    retry_after_ms = headers.get('retry-after-ms')
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get('retry-after')
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+
+    for suffix in ('-requests', ''):
+        remaining = headers.get(f'x-ratelimit-remaining{suffix}')
+        if remaining is not None and remaining.strip() in ('0', '0.0'):
+            reset = _parse_reset(headers.get(f'x-ratelimit-reset{suffix}'))
+            return reset if reset is not None else 1.0
+    return None
+
+
+def _parse_reset(value: str) -> float:
+    """Parse a reset header: epoch seconds/milliseconds, plain seconds, or durations like '1m30s'."""
+    if not value:
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        parts = re.findall(r'(\d+(?:\.\d+)?)(ms|h|m|s)', value)
+        if not parts:
+            return None
+        scale = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+        return sum(float(amount) * scale[unit] for amount, unit in parts)
+    if number > 1e12:
+        return max(0.0, number / 1000 - time.time())
+    if number > 1e9:
+        return max(0.0, number - time.time())
+    return number
@@ -0,0 +1,113 @@
+"""Recompute embedding dissimilarity scores for an existing results file offline.
+
+Every answer's embedding_dissimilarity_score is recomputed against the answers
+before it in its chain, using the chosen embedding backend and size. Everything
+else in the models tree (answer text, coherence and LLM scores, chain lengths)
+is copied unchanged, so the output is in the same schema and works with every
+analysis script. Only the models tree is written.
+
+Chains are streamed from the input with `results_stream.iter_chains`, scored in
+parallel worker processes and written out as they finish, so only a few chains
+per worker are in memory at once. Each worker embeds its chain's answers in
+batches through the shared on-disk embedding cache, so re-running with the same
+backend and size costs no embedding calls. By default the cache is allowed to
+grow to hold every answer in the input; `--cache-entries` sets the bound.
+
+Usage:
+    python benchmark/rescore.py results.json rescored.json --embedding-backend hashing
+    python benchmark/rescore.py results.json rescored.json --embedding-dimensions 256 --workers 8
+"""
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import models
+from embedding_cache import DEFAULT_MAX_ENTRIES
+from novelty import NoveltyMatrix
+from results_journal import write_chains
+from results_stream import iter_answers, iter_chains
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
+except ImportError:
+    pass
+
+
+# Chains queued per worker ahead of the one being written, to keep workers busy
+_CHAINS_PER_WORKER = 4
+
+
+def rescore_chains(chains, embedding_backend: str = None, embedding_dimensions: int = None,
+                   workers: int = None, cache_entries: int = None):
+    """Yield each (model, temperature, question, answers) chain with its scores recomputed, in input order."""
+    workers = workers or os.cpu_count() or 1
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(embedding_backend, cache_entries)) as executor:
+        for chain in chains:
+            pending.append(executor.submit(_rescore_chain, *chain, embedding_dimensions))
+            if len(pending) >= workers * _CHAINS_PER_WORKER:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def default_cache_entries(results_file: str) -> int:
+    """Cache bound large enough to keep every answer in `results_file` next to what is cached already."""
+    answers = sum(1 for _ in iter_answers(results_file))
+    cache = models.get_embedding_cache()
+    cached = cache.stats()['entries']
+    cache.close()
+    models.embedding_cache = None
+    return max(int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)), cached + answers)
+
+
+def _init_worker(embedding_backend: str, cache_entries: int) -> None:
+    # Each process opens its own cache connection; SQLite WAL handles concurrent writers
+    if cache_entries:
+        os.environ["EMBEDDING_CACHE_MAX_ENTRIES"] = str(cache_entries)
+    models.embedding_cache = None
+    if embedding_backend:
+        models.configure_embedding_backend(embedding_backend)
+
+
+def _rescore_chain(model_name: str, temperature: str, question: str, answers: list,
+                   embedding_dimensions: int = None) -> tuple:
+    """Rescore one (model, temperature, question) chain."""
+    answers = sorted(answers, key=lambda answer: answer['answer_num'])
+    embeddings = models.embed_many([answer['answer'] for answer in answers], embedding_dimensions)
+
+    matrix = NoveltyMatrix()
+    rescored_answers = []
+    for answer, embedding in zip(answers, embeddings):
+        rescored_answers.append(dict(answer, embedding_dissimilarity_score=matrix.novelty(embedding)))
+        matrix.add(embedding)
+    return model_name, temperature, question, rescored_answers
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute embedding dissimilarity scores offline.")
+    parser.add_argument('results_file')
+    parser.add_argument('output_file')
+    parser.add_argument('--embedding-backend', default=None,
+                        help="openai (default), sentence-transformers[:MODEL] or hashing[:DIM]")
+    parser.add_argument('--embedding-dimensions', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Worker processes (default: one per CPU)")
+    parser.add_argument('--cache-entries', type=int, default=None,
+                        help="Embedding cache size bound (default: large enough for every answer in the input)")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    if args.embedding_backend:
+        models.configure_embedding_backend(args.embedding_backend)
+    models.check_embedding_dimensions(args.embedding_dimensions)
+    cache_entries = args.cache_entries or default_cache_entries(args.results_file)
+    chains = rescore_chains(iter_chains(args.results_file), args.embedding_backend,
+                            args.embedding_dimensions, args.workers, cache_entries)
+    written = write_chains(chains, args.output_file)
+    print(f"Rescored {written} chains from {args.results_file} into {args.output_file} "
+          f"in {time.time() - start_time:.1f}s")
@@ -0,0 +1,171 @@
+"""Columnar (Parquet) copy of a results file, one row per answer.
+
+Columns:
+    model, temperature, question   dictionary-encoded strings
+    answer_num                     int64
+    coherence_score, embedding_dissimilarity_score,
+    llm_dissimilarity_score, processing_time
+                                   float64, null when the answer has no such score
+    answer                         answer text
+    extra                          JSON object of any other answer fields, or null
+
+Parquet stores each column separately, so loading the score columns never reads
+the answer text. Every answer record survives a round trip through Parquet
+unchanged; top-level keys other than "models" and empty chains are not kept.
+
+Usage:
+    python benchmark/results_columnar.py to-parquet results.json results.parquet
+    python benchmark/results_columnar.py to-json results.parquet results.json
+"""
+import json
+import sys
+
+import numpy as np
+
+from results_journal import write_results
+from results_stream import iter_answers
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+
+KEY_COLUMNS = ('model', 'temperature', 'question')
+SCORE_COLUMNS = ('answer_num', 'coherence_score', 'embedding_dissimilarity_score',
+                 'llm_dissimilarity_score', 'processing_time')
+TEXT_COLUMNS = ('answer', 'extra')
+_ROW_GROUP_SIZE = 50_000
+
+
+def to_parquet(results_path: str, parquet_path: str) -> int:
+    """Convert a results JSON file to Parquet, streaming it; returns the number of answers."""
+    _require_pyarrow()
+    rows = 0
+    writer = pq.ParquetWriter(parquet_path, _schema())
+    try:
+        batch = _empty_batch()
+        for model, temperature, question, answer in iter_answers(results_path):
+            _append_row(batch, model, temperature, question, answer)
+            if len(batch['answer_num']) >= _ROW_GROUP_SIZE:
+                rows += _write_batch(writer, batch)
+                batch = _empty_batch()
+        rows += _write_batch(writer, batch)
+    finally:
+        writer.close()
+    return rows
+
+
+def to_json(parquet_path: str, results_path: str) -> int:
+    """Rebuild the nested results JSON from Parquet; returns the number of answers."""
+    _require_pyarrow()
+    results = {'models': {}}
+    rows = 0
+    for batch in pq.ParquetFile(parquet_path).iter_batches(batch_size=_ROW_GROUP_SIZE):
+        columns = batch.to_pydict()
+        for i in range(batch.num_rows):
+            answer = {'answer_num': columns['answer_num'][i], 'answer': columns['answer'][i]}
+            for name in SCORE_COLUMNS[1:]:
+                if columns[name][i] is not None:
+                    answer[name] = columns[name][i]
+            if answer.get('coherence_score', 0.5).is_integer():
+                # The judge scores coherence as an integer
+                answer['coherence_score'] = int(answer['coherence_score'])
+            if columns['extra'][i] is not None:
+                answer.update(json.loads(columns['extra'][i]))
+            (results['models'].setdefault(columns['model'][i], {})
+             .setdefault(columns['temperature'][i], {})
+             .setdefault(columns['question'][i], [])
+             .append(answer))
+            rows += 1
+    write_results(results, results_path)
+    return rows
+
+
+def load_frame(parquet_path: str, columns=None, with_text: bool = False):
+    """pandas DataFrame of the key and score columns (plus answer text if `with_text`).
+
+    The key columns come back as pandas categoricals.
+    """
+    _require_pyarrow()
+    return pq.read_table(parquet_path, columns=_columns(columns, with_text)).to_pandas()
+
+
+def load_arrays(parquet_path: str, columns=None, with_text: bool = False) -> dict:
+    """NumPy arrays of the key and score columns, without pandas.
+
+    Each dictionary-encoded key column is returned as integer codes under its own
+    name, with its values listed under `<name>_categories`. Missing scores are NaN.
+    """
+    _require_pyarrow()
+    table = pq.read_table(parquet_path, columns=_columns(columns, with_text))
+    arrays = {}
+    for name in table.column_names:
+        column = table.column(name)
+        if pa.types.is_dictionary(column.type):
+            column = (column.unify_dictionaries().combine_chunks() if column.num_chunks
+                      else pa.array([], type=column.type))
+            arrays[name] = column.indices.to_numpy(zero_copy_only=False).astype(np.int64)
+            arrays[f"{name}_categories"] = column.dictionary.to_pylist()
+        elif name in SCORE_COLUMNS:
+            arrays[name] = column.to_numpy().astype(np.float64 if name != 'answer_num' else np.int64)
+        else:
+            arrays[name] = np.array(column.to_pylist(), dtype=object)
+    return arrays
+
+
+def _columns(columns, with_text: bool) -> list[str]:
+    if columns is not None:
+        return list(columns)
+    return list(KEY_COLUMNS + SCORE_COLUMNS + (TEXT_COLUMNS if with_text else ()))
+
+
+def _schema():
+    key_type = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema(
+        [(name, key_type) for name in KEY_COLUMNS] +
+        [('answer_num', pa.int64())] +
+        [(name, pa.float64()) for name in SCORE_COLUMNS[1:]] +
+        [(name, pa.string()) for name in TEXT_COLUMNS]
+    )
+
+
+def _empty_batch() -> dict:
+    return {name: [] for name in KEY_COLUMNS + SCORE_COLUMNS + TEXT_COLUMNS}
+
+
+def _append_row(batch: dict, model: str, temperature: str, question: str, answer: dict) -> None:
+    answer = dict(answer)
+    batch['model'].append(model)
+    batch['temperature'].append(temperature)
+    batch['question'].append(question)
+    batch['answer_num'].append(answer.pop('answer_num'))
+    batch['answer'].append(answer.pop('answer', None))
+    for name in SCORE_COLUMNS[1:]:
+        batch[name].append(answer.pop(name, None))
+    batch['extra'].append(json.dumps(answer) if answer else None)
+
+
+def _write_batch(writer, batch: dict) -> int:
+    if not batch['answer_num']:
+        return 0
+    writer.write_table(pa.Table.from_pydict(batch, schema=_schema()))
+    return len(batch['answer_num'])
+
+
+def _require_pyarrow() -> None:
+    if not PYARROW_AVAILABLE:
+        raise ImportError(
+            "Columnar results need the pyarrow package.\n"
+            "Install it with: pip install pyarrow")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] not in ('to-parquet', 'to-json'):
+        print("Usage: python benchmark/results_columnar.py (to-parquet|to-json) <source> <destination>")
+        sys.exit(1)
+    convert = to_parquet if sys.argv[1] == 'to-parquet' else to_json
+    rows = convert(sys.argv[2], sys.argv[3])
+    print(f"Converted {rows} answers from {sys.argv[2]} to {sys.argv[3]}")
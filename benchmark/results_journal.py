@@ -0,0 +1,174 @@
+"""Append-only journal of scored answers, folded back into results.json on compaction.
+
+Each line is one answer record:
+    {"model": ..., "temperature": "0.7", "question": ..., "answer": {answer_data}}
+
+Usage:
+    python benchmark/results_journal.py compact results.json
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+
+class ResultsJournal:
+    """Thread-safe appender for a results journal file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def append(self, model_name: str, temperature, question: str, answer_data: dict) -> None:
+        line = json.dumps({
+            'model': model_name,
+            'temperature': str(temperature),
+            'question': question,
+            'answer': answer_data
+        })
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def truncate(self) -> None:
+        """Empty the journal once its records are safely in the results file."""
+        with self._lock:
+            self._file.truncate(0)
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def journal_path(results_file: str) -> str:
+    return os.path.splitext(results_file)[0] + '.journal.jsonl'
+
+
+def replay_journal(results: dict, path: str) -> int:
+    """Fold journal records into `results` in place and return how many were added.
+
+    Records whose answer_num is already present in their chain are skipped, so
+    replaying a journal that was partially compacted is safe. A truncated final
+    line (from a crash mid-write) is ignored.
+    """
+    if not os.path.exists(path):
+        return 0
+
+    added = 0
+    seen = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+            key = (record['model'], record['temperature'], record['question'])
+            answers = (results.setdefault('models', {})
+                       .setdefault(record['model'], {})
+                       .setdefault(record['temperature'], {})
+                       .setdefault(record['question'], []))
+            if key not in seen:
+                seen[key] = {a['answer_num'] for a in answers}
+            answer_data = record['answer']
+            if answer_data['answer_num'] in seen[key]:
+                continue
+            answers.append(answer_data)
+            seen[key].add(answer_data['answer_num'])
+            added += 1
+
+    for model_name, temperature, question in seen:
+        results['models'][model_name][temperature][question].sort(key=lambda a: a['answer_num'])
+    return added
+
+
+def write_results(results: dict, results_file: str) -> None:
+    """Write results to a temp file and atomically move it over `results_file`."""
+    results_dir = os.path.dirname(os.path.abspath(results_file)) or '.'
+
+    with tempfile.NamedTemporaryFile(mode='w', dir=results_dir, delete=False, suffix='.tmp') as f:
+        json.dump(results, f, indent=2)
+        temp_file = f.name
+
+    try:
+        shutil.move(temp_file, results_file)
+    except Exception:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+
+def write_chains(chains, results_file: str) -> int:
+    """Write (model, temperature, question, answers) chains as a results file, one chain at a time.
+
+    Produces the same JSON as `write_results` on the equivalent tree, with the
+    same atomic replace, without holding more than one chain in memory. Chains
+    must arrive grouped by model and by temperature within a model, as
+    `results_stream.iter_chains` yields them. Returns the number of chains written.
+    """
+    results_dir = os.path.dirname(os.path.abspath(results_file)) or '.'
+    written = 0
+    with tempfile.NamedTemporaryFile(mode='w', dir=results_dir, delete=False, suffix='.tmp') as f:
+        temp_file = f.name
+        try:
+            f.write('{\n  "models": {')
+            current_model = current_temperature = None
+            finished = set()
+            for model_name, temperature, question, answers in chains:
+                if (model_name, temperature) != (current_model, current_temperature):
+                    if (model_name, temperature) in finished or model_name in finished:
+                        raise ValueError(f"Chains for {model_name} at {temperature} are not grouped together")
+                    if current_temperature is not None:
+                        finished.add((current_model, current_temperature))
+                        f.write('\n      }')
+                    if model_name != current_model:
+                        if current_model is not None:
+                            finished.add(current_model)
+                            f.write('\n    },')
+                        f.write(f'\n    {json.dumps(model_name)}: {{')
+                    else:
+                        f.write(',')
+                    f.write(f'\n      {json.dumps(temperature)}: {{')
+                    current_model, current_temperature = model_name, temperature
+                else:
+                    f.write(',')
+                body = json.dumps(answers, indent=2).replace('\n', '\n        ')
+                f.write(f'\n        {json.dumps(question)}: {body}')
+                written += 1
+            if current_model is not None:
+                f.write('\n      }\n    }\n  ')
+            f.write('}\n}')
+        except BaseException:
+            f.close()
+            os.remove(temp_file)
+            raise
+
+    shutil.move(temp_file, results_file)
+    return written
+
+
+def compact(results_file: str) -> int:
+    """Fold the journal for `results_file` into it and empty the journal."""
+    results = {}
+    if os.path.exists(results_file):
+        with open(results_file, 'r') as f:
+            results = json.load(f)
+
+    path = journal_path(results_file)
+    added = replay_journal(results, path)
+    write_results(results, results_file)
+    if os.path.exists(path):
+        open(path, 'w').close()
+    return added
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != 'compact':
+        print("Usage: python benchmark/results_journal.py compact <results_file>")
+        sys.exit(1)
+    added = compact(sys.argv[2])
+    print(f"Compacted {added} journal records into {sys.argv[2]}")
@@ -0,0 +1,68 @@
+import threading
+
+
+class ResultsStore:
+    """Thread-safe container for the nested `{"models": {model: {temp: {question: [answers]}}}}` results.
+
+    Each (model, temperature) partition has its own lock, so workers on different
+    models never contend. Answer lists are only ever replaced or appended to under
+    their partition lock, and `snapshot` takes every partition lock before copying,
+    so a checkpoint always sees a consistent view without blocking workers for
+    longer than a shallow copy.
+    """
+
+    def __init__(self, results: dict = None):
+        self._results = results if results is not None else {}
+        self._results.setdefault('models', {})
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def get_answers(self, model_name: str, temperature, question: str) -> list[dict]:
+        """Copy of the stored answers for one chain (empty if none)."""
+        temperature = str(temperature)
+        with self._lock_for(model_name, temperature):
+            return list(self._results['models']
+                        .get(model_name, {})
+                        .get(temperature, {})
+                        .get(question, []))
+
+    def add_answer(self, model_name: str, temperature, question: str, answer_data: dict) -> bool:
+        """Append an answer to its chain unless the chain already reaches that answer_num."""
+        temperature = str(temperature)
+        with self._lock_for(model_name, temperature):
+            answers = self._partition(model_name, temperature).setdefault(question, [])
+            if answers and answers[-1]['answer_num'] >= answer_data['answer_num']:
+                return False
+            answers.append(answer_data)
+            return True
+
+    def snapshot(self) -> dict:
+        """Consistent copy of the whole results tree, safe to serialize while workers run."""
+        # Holding _locks_lock throughout stops workers from creating new partitions mid-copy
+        with self._locks_lock:
+            locks = [self._locks[key] for key in sorted(self._locks)]
+            for lock in locks:
+                lock.acquire()
+            try:
+                snapshot = {key: value for key, value in self._results.items() if key != 'models'}
+                snapshot['models'] = {
+                    model_name: {
+                        temperature: {question: list(answers) for question, answers in questions.items()}
+                        for temperature, questions in temps.items()
+                    }
+                    for model_name, temps in self._results['models'].items()
+                }
+                return snapshot
+            finally:
+                for lock in reversed(locks):
+                    lock.release()
+
+    def _partition(self, model_name: str, temperature: str) -> dict:
+        return self._results['models'].setdefault(model_name, {}).setdefault(temperature, {})
+
+    def _lock_for(self, model_name: str, temperature: str) -> threading.Lock:
+        key = (model_name, temperature)
+        with self._locks_lock:
+            if key not in self._locks:
+                self._locks[key] = threading.Lock()
+            return self._locks[key]
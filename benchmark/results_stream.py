@@ -0,0 +1,117 @@
+"""Stream answer records out of a results file without loading the whole tree.
+
+    for model, temperature, question, answer in iter_answers('results.json'):
+        ...
+
+Uses the incremental `ijson` parser when it is installed, so only one answer
+record is held in memory at a time however large the file grows. Without
+ijson it falls back to `json.load` and yields the same tuples.
+"""
+import json
+from itertools import groupby
+
+try:
+    import ijson
+    IJSON_AVAILABLE = True
+except ImportError:
+    IJSON_AVAILABLE = False
+
+
+# Container nesting above an answer record: root map, "models" map, model map,
+# temperature map, question's answer array
+_ANSWER_DEPTH = 5
+
+
+def iter_answers(path: str):
+    """Yield (model, temperature, question, answer_record) for every answer in file order."""
+    yield from _iter_records(path)
+
+
+def iter_chains(path: str):
+    """Yield (model, temperature, question, answers) for every chain; one chain in memory at a time."""
+    for (model, temperature, question), records in groupby(
+            iter_answers(path), key=lambda record: record[:3]):
+        yield model, temperature, question, [record[3] for record in records]
+
+
+def load_scores(path: str) -> dict:
+    """The results tree with every answer's text dropped, for analyses that only need scores.
+
+    Answer text is nearly all of a results file, so this stays small where
+    `json.load` would not. Models, temperatures and chains with no answers are
+    kept, so the tree matches `json.load`'s apart from the text.
+    """
+    results = {'models': {}}
+    for model, temperature, question, answer in _iter_records(path, containers=True):
+        temps = results['models'].setdefault(model, {})
+        if temperature is None:
+            continue
+        questions = temps.setdefault(temperature, {})
+        if question is None:
+            continue
+        answers = questions.setdefault(question, [])
+        if answer is not None:
+            answer.pop('answer', None)
+            answers.append(answer)
+    return results
+
+
+def _iter_records(path: str, containers: bool = False):
+    # With `containers`, each model, temperature and question is also yielded as it
+    # opens, with the levels below it None, so empty ones are not lost
+    with open(path, 'rb') as f:
+        if IJSON_AVAILABLE:
+            yield from _iter_answers_incremental(f, containers)
+        else:
+            yield from _iter_answers_tree(json.load(f), containers)
+
+
+def _iter_answers_tree(results, containers: bool = False):
+    # Like the incremental parser, yield nothing for files that are not a models tree
+    # (e.g. the list-shaped files of the time experiments)
+    if not isinstance(results, dict) or not isinstance(results.get('models'), dict):
+        return
+    for model, temps in results['models'].items():
+        if containers:
+            yield model, None, None, None
+        for temperature, questions in temps.items():
+            if containers:
+                yield model, temperature, None, None
+            for question, answers in questions.items():
+                if containers:
+                    yield model, temperature, question, None
+                for answer in answers:
+                    yield model, temperature, question, answer
+
+
+def _iter_answers_incremental(f, containers: bool = False):
+    # Keys are tracked from map_key events rather than ijson prefixes, because
+    # model names, temperatures and questions all contain dots
+    keys = []
+    builder = None
+    nesting = 0
+    for event, value in ijson.basic_parse(f, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if event in ('start_map', 'start_array'):
+                nesting += 1
+            elif event in ('end_map', 'end_array'):
+                nesting -= 1
+                if not nesting:
+                    yield keys[1], keys[2], keys[3], builder.value
+                    builder = None
+            continue
+
+        if event == 'start_map' and len(keys) == _ANSWER_DEPTH and keys[0] == 'models':
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+            nesting = 1
+        elif event in ('start_map', 'start_array'):
+            if containers and 2 <= len(keys) < _ANSWER_DEPTH and keys[0] == 'models':
+                # The model, temperature or question whose container this is
+                yield tuple(keys[1:]) + (None,) * (_ANSWER_DEPTH - len(keys))
+            keys.append(None)
+        elif event in ('end_map', 'end_array'):
+            keys.pop()
+        elif event == 'map_key':
+            keys[-1] = value
@@ -0,0 +1,247 @@
+"""Streamed chat completions with deadlines and time-to-first-token.
+
+A non-streamed call shows no sign of life until the whole completion is done,
+and reasoning models have been seen to hang for hours (see
+time_experiment/README.md). A streamed call can be bounded by two deadlines:
+
+- `timeout`: total seconds for the call.
+- `idle_timeout`: seconds allowed without a new chunk, including before the first.
+
+Both deadlines count from when the request was sent, not from when the
+response headers arrived: callers pass that time as `start`, and send the
+request with `request_timeout(idle_timeout, timeout)` inside `timed_request`, so
+that a wait for headers inside `create()` past the limits also raises
+StreamTimeout.
+
+`collect_stream` reads the chunks on a helper thread and waits for each one with
+a timeout, so it works from any thread; SIGALRM only works in the main thread.
+When a deadline passes, the stream is closed from the caller, which ends the
+helper thread's blocked read and frees the connection, and `StreamTimeout` is
+raised. `acollect_stream` waits for each chunk with `asyncio.wait_for` instead.
+Either way only the call is cut off, not the process.
+
+CHAT_TIMEOUT and CHAT_IDLE_TIMEOUT set default deadlines for chat_with_model.
+Setting either turns on streaming, as does STREAM_COMPLETIONS=1.
+"""
+import asyncio
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import httpx
+import openai
+
+from http_pool import DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT
+
+
+def _env_seconds(name: str):
+    value = os.environ.get(name)
+    return float(value) if value else None
+
+
+CHAT_TIMEOUT = _env_seconds("CHAT_TIMEOUT")
+CHAT_IDLE_TIMEOUT = _env_seconds("CHAT_IDLE_TIMEOUT")
+STREAM_COMPLETIONS = (os.environ.get("STREAM_COMPLETIONS", "0") == "1"
+                      or CHAT_TIMEOUT is not None or CHAT_IDLE_TIMEOUT is not None)
+STREAM_OPTIONS = {"include_usage": True}
+
+_END = object()
+
+
+class StreamTimeout(TimeoutError):
+    """A streamed completion passed its total (`reason` 'total') or idle ('idle') deadline."""
+
+    def __init__(self, reason: str, limit: float, elapsed: float, partial: str, time_to_first_token: float = None):
+        self.reason = reason
+        self.limit = limit
+        self.elapsed = elapsed
+        self.partial = partial
+        self.time_to_first_token = time_to_first_token
+        what = "in total" if reason == 'total' else "without output"
+        super().__init__(f"Completion timed out ({limit:g}s {what}) after {elapsed:.1f}s")
+
+
+class StreamedCompletion:
+    """Text, usage and timings of one streamed completion."""
+
+    def __init__(self, start: float):
+        self.start = start
+        self.last_chunk = start
+        self.time_to_first_token = None
+        self.elapsed = 0.0
+        self.usage = None
+        self._parts = []
+
+    @property
+    def content(self) -> str:
+        return "".join(self._parts)
+
+    def add(self, chunk) -> None:
+        now = time.monotonic()
+        self.last_chunk = now
+        if getattr(chunk, 'usage', None) is not None:
+            self.usage = chunk.usage
+        for choice in chunk.choices or ():
+            delta = choice.delta
+            if delta is None:
+                continue
+            if self.time_to_first_token is None and (delta.content or getattr(delta, 'reasoning', None)):
+                self.time_to_first_token = now - self.start
+            if delta.content:
+                self._parts.append(delta.content)
+
+    def wait(self, timeout: float = None, idle_timeout: float = None):
+        """Seconds until the nearest deadline, and which one it is."""
+        now = time.monotonic()
+        deadlines = []
+        if timeout is not None:
+            deadlines.append((self.start + timeout - now, 'total'))
+        if idle_timeout is not None:
+            deadlines.append((self.last_chunk + idle_timeout - now, 'idle'))
+        if not deadlines:
+            return None, None
+        remaining, reason = min(deadlines)
+        return max(0.0, remaining), reason
+
+    def raise_timeout(self, reason: str, timeout: float, idle_timeout: float) -> None:
+        """Record the timeout and raise StreamTimeout for it."""
+        self.elapsed = time.monotonic() - self.start
+        limit = timeout if reason == 'total' else idle_timeout
+        stream_stats.record_timeout(reason)
+        raise StreamTimeout(reason, limit, self.elapsed, self.content, self.time_to_first_token) from None
+
+    def finish(self) -> 'StreamedCompletion':
+        self.elapsed = time.monotonic() - self.start
+        stream_stats.record(self.time_to_first_token, self.elapsed)
+        return self
+
+
+def request_timeout(idle_timeout: float = None, timeout: float = None):
+    """Per-request httpx timeout that no socket operation can outlast the deadlines with, or None.
+
+    Used with a client that does not retry, this bounds the wait for response
+    headers, which `collect_stream` cannot see.
+    """
+    limits = [limit for limit in (idle_timeout, timeout) if limit is not None]
+    if not limits:
+        return None
+    limit = min(limits)
+    return httpx.Timeout(min(DEFAULT_READ_TIMEOUT, limit), connect=min(DEFAULT_CONNECT_TIMEOUT, limit), read=limit)
+
+
+@contextmanager
+def timed_request(start: float, timeout: float = None, idle_timeout: float = None):
+    """Raise StreamTimeout if the request sent at `start` times out before its response headers arrive."""
+    try:
+        yield
+    except openai.APITimeoutError:
+        if timeout is None and idle_timeout is None:
+            raise
+        reason = 'total' if idle_timeout is None or (timeout is not None and timeout <= idle_timeout) else 'idle'
+        StreamedCompletion(start).raise_timeout(reason, timeout, idle_timeout)
+
+
+def collect_stream(stream, timeout: float = None, idle_timeout: float = None,
+                   start: float = None) -> StreamedCompletion:
+    """Read a chat completion stream to the end, raising StreamTimeout past a deadline."""
+    completion = StreamedCompletion(time.monotonic() if start is None else start)
+    if timeout is None and idle_timeout is None:
+        with stream:
+            for chunk in stream:
+                completion.add(chunk)
+        return completion.finish()
+
+    chunks = queue.Queue()
+    abandoned = threading.Event()
+
+    def read():
+        try:
+            for chunk in stream:
+                if abandoned.is_set():
+                    break
+                chunks.put(chunk)
+            chunks.put(_END)
+        except Exception as e:
+            chunks.put(e)
+        finally:
+            stream.close()
+
+    threading.Thread(target=read, name="stream-reader", daemon=True).start()
+    while True:
+        wait, reason = completion.wait(timeout, idle_timeout)
+        try:
+            item = chunks.get(timeout=wait)
+        except queue.Empty:
+            abandoned.set()
+            # Closing here rather than in the reader, which may be stuck in a read until the socket times out
+            stream.close()
+            completion.raise_timeout(reason, timeout, idle_timeout)
+        if item is _END:
+            return completion.finish()
+        if isinstance(item, httpx.TimeoutException):
+            # The socket read timeout is the nearest deadline, so it can beat the wait above
+            stream.close()
+            completion.raise_timeout(completion.wait(timeout, idle_timeout)[1], timeout, idle_timeout)
+        if isinstance(item, Exception):
+            raise item
+        completion.add(item)
+
+
+async def acollect_stream(stream, timeout: float = None, idle_timeout: float = None,
+                          start: float = None) -> StreamedCompletion:
+    """Async counterpart of collect_stream."""
+    completion = StreamedCompletion(time.monotonic() if start is None else start)
+    chunks = stream.__aiter__()
+    try:
+        while True:
+            wait, reason = completion.wait(timeout, idle_timeout)
+            try:
+                chunk = await asyncio.wait_for(chunks.__anext__(), wait)
+            except StopAsyncIteration:
+                return completion.finish()
+            except (asyncio.TimeoutError, httpx.TimeoutException):
+                completion.raise_timeout(reason, timeout, idle_timeout)
+            completion.add(chunk)
+    finally:
+        await stream.close()
+
+
+class StreamStats:
+    """Time to first token and deadline hits of streamed completions."""
+
+    def __init__(self):
+        self.calls = 0
+        self.first_token_calls = 0
+        self.total_ttft = 0.0
+        self.max_ttft = 0.0
+        self.total_time = 0.0
+        self.timeouts = {'total': 0, 'idle': 0}
+        self._lock = threading.Lock()
+
+    def record(self, time_to_first_token: float, elapsed: float) -> None:
+        with self._lock:
+            self.calls += 1
+            self.total_time += elapsed
+            if time_to_first_token is not None:
+                self.first_token_calls += 1
+                self.total_ttft += time_to_first_token
+                self.max_ttft = max(self.max_ttft, time_to_first_token)
+
+    def record_timeout(self, reason: str) -> None:
+        with self._lock:
+            self.timeouts[reason] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'mean_ttft': self.total_ttft / self.first_token_calls if self.first_token_calls else 0.0,
+                'max_ttft': self.max_ttft,
+                'mean_time': self.total_time / self.calls if self.calls else 0.0,
+                'timeouts': dict(self.timeouts),
+            }
+
+
+stream_stats = StreamStats()
@@ -0,0 +1,158 @@
+"""Per-call telemetry: wall time, queue wait, tokens and cost of every API call.
+
+Each chat and embedding call is recorded twice:
+
+- into the `CallTelemetry` of the answer it belongs to, held in a context
+  variable, so concurrent chains stay apart. Work handed to another thread must
+  go through `bind`; asyncio tasks inherit the variable on their own. The
+  per-answer totals are stored in the answer record under 'telemetry'.
+- into the run-wide per-model totals in `telemetry_stats`.
+
+Queue wait is time spent waiting for a rate-limiter slot (for embeddings, for a
+batch to be sent). Tokens come from the response usage. Embedding requests are
+batched across chains, so each text's share is counted locally with
+token_count. Calls that end in an error are recorded too, with no tokens, and
+counted under 'failed'. Cost uses the list prices in `model_list.model_prices`
+(USD per million tokens), with no discount for cached prompt tokens; calls to
+unpriced models have no cost. Prompt and completion tokens are priced exactly
+as reported; providers already count reasoning in the completion tokens, so
+reasoning_tokens is informational only.
+"""
+import contextvars
+import threading
+from functools import partial
+
+from model_list import model_prices
+
+_FIELDS = ('calls', 'failed', 'wall_time', 'queue_wait', 'prompt_tokens', 'completion_tokens',
+           'reasoning_tokens', 'cost')
+
+_prices = {item['model']: item for item in model_prices}
+_current = contextvars.ContextVar('call_telemetry', default=None)
+
+
+def model_price(model: str):
+    """`model_prices` entry for a model name as sent to the API, or None."""
+    for name in (model, model.split(':')[0], f"openai/{model}"):
+        if name in _prices:
+            return _prices[name]
+    return None
+
+
+def call_cost(model: str, prompt_tokens: int, completion_tokens: int):
+    """Cost in USD of one call, or None if the model has no price."""
+    price = model_price(model)
+    if price is None:
+        return None
+    return (prompt_tokens * price['input_price'] + completion_tokens * price['output_price']) / 1e6
+
+
+def usage_tokens(usage) -> tuple[int, int, int]:
+    """(prompt, completion, reasoning) tokens from an OpenAI-style usage object."""
+    if usage is None:
+        return 0, 0, 0
+    details = getattr(usage, 'completion_tokens_details', None)
+    reasoning = (getattr(details, 'reasoning_tokens', None) or 0) if details else 0
+    return usage.prompt_tokens or 0, usage.completion_tokens or 0, reasoning
+
+
+class CallTelemetry:
+    """Totals per call kind for the calls made on behalf of one answer."""
+
+    def __init__(self):
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def add(self, kind: str, call: dict) -> None:
+        with self._lock:
+            _accumulate(self._totals.setdefault(kind, dict.fromkeys(_FIELDS, 0)), call)
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {kind: _rounded(totals) for kind, totals in self._totals.items()}
+
+
+class TelemetryStats:
+    """Run-wide totals per (model, call kind)."""
+
+    def __init__(self):
+        self._totals = {}
+        self._unpriced = {}
+        self._lock = threading.Lock()
+
+    def add(self, model: str, kind: str, call: dict) -> None:
+        with self._lock:
+            _accumulate(self._totals.setdefault((model, kind), dict.fromkeys(_FIELDS, 0)), call)
+            if call['cost'] is None:
+                self._unpriced[(model, kind)] = self._unpriced.get((model, kind), 0) + 1
+
+    def stats(self) -> dict:
+        """{model: {kind: totals}}, with the number of unpriced calls under 'unpriced_calls'."""
+        with self._lock:
+            stats = {}
+            for (model, kind), totals in sorted(self._totals.items()):
+                stats.setdefault(model, {})[kind] = dict(
+                    _rounded(totals), unpriced_calls=self._unpriced.get((model, kind), 0))
+            return stats
+
+
+telemetry_stats = TelemetryStats()
+
+
+def record_call(kind: str, model: str, wall_time: float, queue_wait: float = 0.0,
+                prompt_tokens: int = 0, completion_tokens: int = 0, reasoning_tokens: int = 0,
+                failed: bool = False) -> None:
+    """Record one finished or failed call against the current answer and the run totals."""
+    call = {
+        'calls': 1,
+        'failed': int(failed),
+        'wall_time': wall_time,
+        'queue_wait': queue_wait,
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'reasoning_tokens': reasoning_tokens,
+        'cost': call_cost(model, prompt_tokens, completion_tokens),
+    }
+    telemetry = _current.get()
+    if telemetry is not None:
+        telemetry.add(kind, call)
+    telemetry_stats.add(model, kind, call)
+
+
+def use_telemetry(telemetry: CallTelemetry) -> contextvars.Token:
+    """Make `telemetry` receive this thread's or task's calls; undo with `reset_telemetry`."""
+    return _current.set(telemetry)
+
+
+def reset_telemetry(token: contextvars.Token) -> None:
+    _current.reset(token)
+
+
+def bind(fn, telemetry: CallTelemetry = None):
+    """`fn` bound to a copy of the current context, to run on another thread.
+
+    With `telemetry`, calls made by `fn` are recorded there instead of the current answer.
+    """
+    context = contextvars.copy_context()
+    if telemetry is not None:
+        context.run(_current.set, telemetry)
+    return partial(context.run, fn)
+
+
+async def arun(telemetry: CallTelemetry, coro):
+    """Await `coro` with its calls recorded in `telemetry`; wrap it in a task to keep that local."""
+    _current.set(telemetry)
+    return await coro
+
+
+def _accumulate(totals: dict, call: dict) -> None:
+    for field in _FIELDS:
+        totals[field] += call[field] or 0
+
+
+def _rounded(totals: dict) -> dict:
+    rounded = dict(totals)
+    rounded['wall_time'] = round(totals['wall_time'], 3)
+    rounded['queue_wait'] = round(totals['queue_wait'], 3)
+    rounded['cost'] = round(totals['cost'], 6)
+    return rounded
@@ -0,0 +1,34 @@
+"""Prompt size in tokens.
+
+Counts with tiktoken (listed in requirements.txt), using the
+`TOKEN_ENCODING` encoding (default o200k_base). Without it, falls back to the
+usual estimate of one token per four characters, which can undercount by more
+than the context budget's safety margin.
+"""
+import os
+import threading
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+TOKEN_ENCODING = os.environ.get("TOKEN_ENCODING", "o200k_base")
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def count_tokens(text: str) -> int:
+    if not TIKTOKEN_AVAILABLE:
+        return (len(text) + 3) // 4
+    return len(_get_encoding().encode(text, disallowed_special=()))
+
+
+def _get_encoding():
+    global _encoding
+    with _encoding_lock:
+        if _encoding is None:
+            _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+        return _encoding
@@ -1,5 +1,4 @@
 # %%
-import json
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
@@ -7,6 +6,8 @@ from pathlib import Path
 from typing import Dict, List, Tuple, NamedTuple, Set
 from clusters import question_w_clusters, wordcel_questions, shape_rotator_questions
 from benchmark.question_list import questions
+from benchmark.results_stream import load_scores
+from benchmark.answer_metrics import AnswerTable
 from collections import defaultdict
 from benchmark.model_list import lmsys_scores, release_dates, model_scales, model_prices
 from scipy import stats
@@ -62,43 +63,45 @@ class ModelMetrics(NamedTuple):
     valid_answers: int
 
 def load_results(file_path: str) -> dict:
-    """Load results from JSON file."""
-    with open(file_path, 'r') as f:
-        return json.load(f)
+    """Load the scores from a results file (answer text is not needed for plotting)."""
+    return load_scores(file_path)
+
+_answer_table_cache = (None, None)
+
+def answer_table(results: dict) -> AnswerTable:
+    """Flat per-answer table for `results`, built once and reused by every metric below."""
+    global _answer_table_cache
+    cached_results, table = _answer_table_cache
+    if cached_results is not results:
+        table = AnswerTable.from_results(results)
+        _answer_table_cache = (results, table)
+    return table
+
+def _metrics_by_pair(table: AnswerTable, totals: dict, question_mask=None) -> Dict[str, Dict[str, ModelMetrics]]:
+    """ModelMetrics per model and temperature, summing `totals` over the selected questions."""
+    if question_mask is not None:
+        totals = {name: values[:, question_mask] for name, values in totals.items()}
+    sums = {name: values.sum(axis=1) for name, values in totals.items()}
+
+    metrics = {model: {} for model in table.models}
+    for i, (model, temp) in enumerate(table.pairs):
+        metrics[model][temp] = ModelMetrics(
+            embedding_total=float(sums['embedding'][i]),
+            coherence_total=float(sums['coherence'][i]),
+            valid_answers=int(sums['answers'][i])
+        )
+    return metrics
 
 def calculate_metrics(results: dict,
                      min_embedding_threshold: float = 0.15,
                      min_coherence_threshold: float = 15.0) -> Dict[str, Dict[str, ModelMetrics]]:
-    """Calculate metrics for each model at each temperature setting."""
-    metrics = {}
-    
-    for model_name, temp_data in results['models'].items():
-        metrics[model_name] = {}
-        
-        for temp, questions in temp_data.items():
-            embedding_total = 0
-            coherence_total = 0
-            valid_answers = 0
-            
-            for question, answers in questions.items():
-                # Process answers until a failure is encountered
-                for answer in answers:
-                    if (answer['embedding_dissimilarity_score'] < min_embedding_threshold or 
-                        answer['coherence_score'] < min_coherence_threshold):
-                        break
-                    
-                    embedding_total += answer['embedding_dissimilarity_score']
-                    coherence_total += answer['coherence_score'] / 100  # Divide coherence by 100
-                    valid_answers += 1
-            
-            metrics[model_name][temp] = ModelMetrics(
-                embedding_total=embedding_total,
-                coherence_total=coherence_total,
-                valid_answers=valid_answers
-            )
-    
-    
-    return metrics
+    """Calculate metrics for each model at each temperature setting.
+
+    Each chain counts its answers up to (not including) the first that fails a threshold.
+    """
+    table = answer_table(results)
+    totals = table.totals(min_embedding_threshold, min_coherence_threshold)
+    return _metrics_by_pair(table, totals.until_failure)
 
 def plot_metric(metrics: Dict[str, Dict[str, ModelMetrics]], 
                 metric_name: str,
@@ -262,33 +265,9 @@ def calculate_cluster_metrics(results: dict,
                             min_embedding_threshold: float = 0.15,
                             min_coherence_threshold: float = 15.0) -> Dict[str, Dict[str, ModelMetrics]]:
     """Calculate metrics for each model at each temperature setting for specific cluster questions."""
-    metrics = {}
-    
-    for model_name, temp_data in results['models'].items():
-        metrics[model_name] = {}
-        
-        for temp, questions in temp_data.items():
-            embedding_total = 0
-            coherence_total = 0
-            valid_answers = 0
-            
-            # Only process questions that belong to the cluster
-            for question in cluster_questions:
-                if question in questions:
-                    for answer in questions[question]:
-                        if (answer['embedding_dissimilarity_score'] >= min_embedding_threshold and 
-                            answer['coherence_score'] >= min_coherence_threshold):
-                            embedding_total += answer['embedding_dissimilarity_score']
-                            coherence_total += answer['coherence_score'] / 100
-                            valid_answers += 1
-            
-            metrics[model_name][temp] = ModelMetrics(
-                embedding_total=embedding_total,
-                coherence_total=coherence_total,
-                valid_answers=valid_answers
-            )
-                
-    return metrics
+    table = answer_table(results)
+    totals = table.totals(min_embedding_threshold, min_coherence_threshold)
+    return _metrics_by_pair(table, totals.all_passing, table.question_mask(cluster_questions))
 
 def plot_cluster_metrics(results: dict,
                         questions_data: List[dict],
@@ -365,8 +344,7 @@ def analyze_clusters(results_file: str,
     """Main function to analyze benchmark results by clusters."""
     
     # Load results
-    with open(results_file, 'r') as f:
-        results = json.load(f)
+    results = load_scores(results_file)
     
     # Extract unique clusters
     clusters = set()
@@ -395,6 +373,12 @@ def get_company_from_model(model_name: str) -> str:
     """Extract company name from model name."""
     return model_name.split('/')[0]
 
+def _max_over_temperatures(table: AnswerTable, pair_values: np.ndarray) -> np.ndarray:
+    """Per-model maximum (floored at 0) of values given per (model, temperature) pair, along axis 0."""
+    model_values = np.zeros((len(table.models),) + pair_values.shape[1:])
+    np.maximum.at(model_values, table.pair_models(), pair_values)
+    return model_values
+
 def get_best_models_per_cluster(results: dict,
                               questions_data: List[dict],
                               min_embedding_threshold: float = 0.15,
@@ -411,51 +395,28 @@ def get_best_models_per_cluster(results: dict,
         for cluster in question['clusters']:
             clusters.add(cluster)
             cluster_question_counts[cluster] += 1
-    
-    # Initialize results storage
+
+    table = answer_table(results)
+    totals = table.totals(min_embedding_threshold, min_coherence_threshold).all_passing
+    # Only models with at least one temperature setting compete
+    competing = np.unique(table.pair_models())
+
     best_performers = {cluster: {} for cluster in clusters}
-    
-    # Process each cluster
+    if not len(competing):
+        return best_performers
+
     for cluster in clusters:
-        # Get questions for this cluster
         cluster_questions = {q['question'] for q in questions_data if cluster in q['clusters']}
+        question_mask = table.question_mask(cluster_questions)
         num_questions = cluster_question_counts[cluster]
-        
-        # Initialize metric tracking for this cluster
-        metrics = defaultdict(lambda: defaultdict(float))
-        
-        # Calculate metrics for each model
-        for model_name, temp_data in results['models'].items():
-            for temp, questions in temp_data.items():
-                embedding_total = 0
-                coherence_total = 0
-                valid_answers = 0
-                
-                for question in cluster_questions:
-                    if question in questions:
-                        for answer in questions[question]:
-                            if (answer['embedding_dissimilarity_score'] >= min_embedding_threshold and 
-                                answer['coherence_score'] >= min_coherence_threshold):
-                                embedding_total += answer['embedding_dissimilarity_score']
-                                coherence_total += answer['coherence_score'] / 100
-                                valid_answers += 1
-                
-                # Average scores by number of questions in cluster
-                avg_embedding = embedding_total / num_questions if num_questions > 0 else 0
-                avg_coherence = coherence_total / num_questions if num_questions > 0 else 0
-                avg_answers = valid_answers / num_questions if num_questions > 0 else 0
-                
-                # Update best scores if this temperature setting is better
-                metrics['embedding'][model_name] = max(metrics['embedding'][model_name], avg_embedding)
-                metrics['coherence'][model_name] = max(metrics['coherence'][model_name], avg_coherence)
-                metrics['answers'][model_name] = max(metrics['answers'][model_name], avg_answers)
-        
-        # Find best model for each metric
-        for metric_name, model_scores in metrics.items():
-            if model_scores:
-                best_model = max(model_scores.items(), key=lambda x: x[1])
-                best_performers[cluster][metric_name] = best_model
-    
+
+        for metric_name in ('embedding', 'coherence', 'answers'):
+            # Average scores by number of questions in cluster, then keep each model's best temperature
+            averages = totals[metric_name][:, question_mask].sum(axis=1) / num_questions
+            model_scores = _max_over_temperatures(table, averages)[competing]
+            best = int(np.argmax(model_scores))
+            best_performers[cluster][metric_name] = (table.models[competing[best]], float(model_scores[best]))
+
     return best_performers
 
 def plot_best_performers(best_performers: Dict[str, Dict[str, Tuple[str, float]]],
@@ -522,8 +483,7 @@ def analyze_best_performers(results_file: str,
     """Generate best performer analysis and plots."""
     
     # Load results
-    with open(results_file, 'r') as f:
-        results = json.load(f)
+    results = load_scores(results_file)
     
     # Get best performers
     best_performers = get_best_models_per_cluster(
@@ -560,66 +520,43 @@ def get_best_models_per_question(results: dict,
     Scores are summed across all valid answers for each model-question pair.
     Returns dict[metric][question_num] = (model_name, score)
     """
-    # Initialize storage
     best_scores = {
         'embedding': {},
         'coherence': {},
         'answers': {}
     }
-    
+
     # Create normalized question map
     question_map = {normalize_text(q['question']): q['number'] for q in questions_data}
-    
-    # First, calculate total scores for each model-question pair
-    model_scores = defaultdict(lambda: defaultdict(lambda: defaultdict(float)))
-    
-    for model_name, temp_data in results['models'].items():
-        for temp, questions in temp_data.items():
-            for question, answers in questions.items():
-                normalized_q = normalize_text(question)
-                if normalized_q not in question_map:
-                    print(f"Warning: Could not find matching question for: {question}")
-                    continue
-                    
-                q_num = question_map[normalized_q]
-                
-                # Initialize scores for this model-temp-question combination
-                embedding_total = 0
-                coherence_total = 0
-                valid_count = 0
-                
-                # Sum up scores across all valid answers
-                for answer in answers:
-                    if (answer['embedding_dissimilarity_score'] >= min_embedding_threshold and 
-                        answer['coherence_score'] >= min_coherence_threshold):
-                        embedding_total += answer['embedding_dissimilarity_score']
-                        coherence_total += answer['coherence_score'] / 100
-                        valid_count += 1
-                
-                # Update scores if this temperature setting gives better results
-                current_embedding = model_scores['embedding'][model_name][q_num]
-                current_coherence = model_scores['coherence'][model_name][q_num]
-                current_answers = model_scores['answers'][model_name][q_num]
-                
-                model_scores['embedding'][model_name][q_num] = max(current_embedding, embedding_total)
-                model_scores['coherence'][model_name][q_num] = max(current_coherence, coherence_total)
-                model_scores['answers'][model_name][q_num] = max(current_answers, valid_count)
-    
-    # Now find the best model for each question
+    numbers = list(dict.fromkeys(question_map.values()))
+    number_index = {number: i for i, number in enumerate(numbers)}
+
+    table = answer_table(results)
+    # Column of each results question among the question numbers, -1 if unmatched
+    question_columns = np.array([number_index[question_map[normalize_text(q)]]
+                                 if normalize_text(q) in question_map else -1
+                                 for q in table.questions], dtype=np.int64)
+    for chain in np.flatnonzero(question_columns[table.chain_question] < 0):
+        print(f"Warning: Could not find matching question for: {table.questions[table.chain_question[chain]]}")
+
+    if not table.models:
+        return best_scores
+
+    totals = table.totals(min_embedding_threshold, min_coherence_threshold).all_passing
+    matched = question_columns >= 0
     for metric in ['embedding', 'coherence', 'answers']:
-        for q_num in question_map.values():
-            best_score = -float('inf')
-            best_model = None
-            
-            for model_name in results['models'].keys():
-                score = model_scores[metric][model_name][q_num]
-                if score > best_score:
-                    best_score = score
-                    best_model = model_name
-            
-            if best_model is not None:
-                best_scores[metric][q_num] = (best_model, best_score)
-    
+        # Best temperature per model and question number
+        scores = np.zeros((len(table.pairs), len(numbers)))
+        np.maximum.at(scores.T, question_columns[matched], totals[metric][:, matched].T)
+        scores = _max_over_temperatures(table, scores)
+
+        # Ties go to the model listed first in the results
+        best = np.argmax(scores, axis=0)
+        for q_num, column in number_index.items():
+            score = scores[best[column], column]
+            best_scores[metric][q_num] = (table.models[best[column]],
+                                          int(score) if metric == 'answers' else float(score))
+
     return best_scores
 
 
@@ -806,8 +743,7 @@ def analyze_question_performance(results_file: str,
     """Generate question-level analysis and plots."""
     
     # Load results
-    with open(results_file, 'r') as f:
-        results = json.load(f)
+    results = load_scores(results_file)
     
     # Get best performers for each question
     best_scores = get_best_models_per_question(
@@ -843,33 +779,18 @@ def get_max_scores(results: dict,
         'openai/o3-mini-medium': {'embedding': 0, 'coherence': 0, 'answers': 3401},
         'openai/o3-mini-low': {'embedding': 0, 'coherence': 0, 'answers': 2354}
     }
-    
+
     # Add scores from results
-    for model_name, temp_data in results['models'].items():
-        if model_name not in max_scores:
-            max_scores[model_name] = {'embedding': 0, 'coherence': 0, 'answers': 0}
-            
-        for temp, questions in temp_data.items():
-            embedding_total = 0
-            coherence_total = 0
-            valid_answers = 0
-            
-            for answers in questions.values():
-                for answer in answers:
-                    if (answer['embedding_dissimilarity_score'] >= min_embedding_threshold and 
-                        answer['coherence_score'] >= min_coherence_threshold):
-                        embedding_total += answer['embedding_dissimilarity_score']
-                        coherence_total += answer['coherence_score'] / 100
-                        valid_answers += 1
-            
-            # Update maximum scores
-            max_scores[model_name]['embedding'] = max(max_scores[model_name]['embedding'], 
-                                                    embedding_total)
-            max_scores[model_name]['coherence'] = max(max_scores[model_name]['coherence'], 
-                                                    coherence_total)
-            max_scores[model_name]['answers'] = max(max_scores[model_name]['answers'], 
-                                                  valid_answers)
-    
+    table = answer_table(results)
+    totals = table.totals(min_embedding_threshold, min_coherence_threshold).all_passing
+    model_totals = {name: _max_over_temperatures(table, values.sum(axis=1))
+                    for name, values in totals.items()}
+    for i, model_name in enumerate(table.models):
+        scores = max_scores.setdefault(model_name, {'embedding': 0, 'coherence': 0, 'answers': 0})
+        scores['embedding'] = max(scores['embedding'], float(model_totals['embedding'][i]))
+        scores['coherence'] = max(scores['coherence'], float(model_totals['coherence'][i]))
+        scores['answers'] = max(scores['answers'], int(model_totals['answers'][i]))
+
     return max_scores
 
 def _create_styled_label(ax, x, y, text: str, color: str, offset_x: float = 0.005) -> plt.Text:
@@ -1348,8 +1269,7 @@ def generate_score_tables(results_file: str,
     """Main function to generate score tables."""
     
     # Load results
-    with open(results_file, 'r') as f:
-        results = json.load(f)
+    results = load_scores(results_file)
     
     # Generate tables
     create_comprehensive_table(results, output_dir)
@@ -1361,8 +1281,7 @@ def analyze_model_performance(results_file: str,
                             model_prices: List[dict],
                             lmsys_scores: List[dict],
                             output_dir: str = 'plots') -> None:
-    with open(results_file, 'r') as f:
-        results = json.load(f)
+    results = load_scores(results_file)
 
     print_model_scores(results)
 
@@ -1471,18 +1390,20 @@ def plot_lmsys_correlation(results: dict,
 def plot_exit_reasons(results: dict, output_dir: str = 'plots') -> None:
     _set_paper_style()
 
-    lab_stats = defaultdict(lambda: {'coherence': 0, 'novelty': 0, 'total': 0})
-
-    for model, temp_data in results['models'].items():
-        lab = get_company_from_model(model)
-        for temp, questions in temp_data.items():
-            for answers in questions.values():
-                lab_stats[lab]['total'] += 1
-                coherence_break = any(answer['coherence_score'] < 15 for answer in answers)
-                if coherence_break:
-                    lab_stats[lab]['coherence'] += 1
-                else:
-                    lab_stats[lab]['novelty'] += 1
+    table = answer_table(results)
+    chain_models = table.pair_models()[table.chain_pair]
+    coherence_break = table.chain_min_coherence() < 15
+
+    # Labs in the order their first chain appears
+    lab_index = {}
+    chain_labs = np.array([lab_index.setdefault(get_company_from_model(table.models[m]), len(lab_index))
+                           for m in chain_models], dtype=np.int64)
+    totals = np.bincount(chain_labs, minlength=len(lab_index))
+    coherence_breaks = np.bincount(chain_labs, weights=coherence_break, minlength=len(lab_index))
+    lab_stats = {lab: {'coherence': int(coherence_breaks[i]),
+                       'novelty': int(totals[i] - coherence_breaks[i]),
+                       'total': int(totals[i])}
+                 for lab, i in lab_index.items()}
 
     labs, coherence_pcts, novelty_pcts = [], [], []
 
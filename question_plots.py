@@ -1,4 +1,3 @@
-import json
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
@@ -8,6 +7,7 @@ from scipy import stats
 from scipy.stats import t
 import statsmodels.stats.api as sms
 from typing import Tuple
+from benchmark.results_stream import iter_answers
 
 COMPANY_COLORS = {
     'openai': '#74AA9C',
@@ -30,26 +30,18 @@ def _get_company_from_model(model_name: str) -> str:
     return company
 
 
-def _load_results() -> dict:
-    with open('results.json', 'r') as f:
-        return json.load(f)
-
-
-def _extract_scores(results: dict) -> pd.DataFrame:
+def _extract_scores(results_path: str = 'results.json') -> pd.DataFrame:
     data = []
-    for model, model_data in results['models'].items():
-        for temperature, temp_data in model_data.items():
-            for question, answers in temp_data.items():
-                for answer in answers:
-                    data.append({
-                        'model': model,
-                        'company': _get_company_from_model(model),
-                        'temperature': float(temperature),
-                        'question': question,
-                        'answer_num': answer['answer_num'],
-                        'embedding_score': answer['embedding_dissimilarity_score'],
-                        'coherence_score': answer['coherence_score']
-                    })
+    for model, temperature, question, answer in iter_answers(results_path):
+        data.append({
+            'model': model,
+            'company': _get_company_from_model(model),
+            'temperature': float(temperature),
+            'question': question,
+            'answer_num': answer['answer_num'],
+            'embedding_score': answer['embedding_dissimilarity_score'],
+            'coherence_score': answer['coherence_score']
+        })
     return pd.DataFrame(data)
 
 
@@ -404,8 +396,7 @@ def generate_score_plots():
     output_dir = Path('plots')
     output_dir.mkdir(exist_ok=True)
 
-    results = _load_results()
-    df = _extract_scores(results)
+    df = _extract_scores()
     df_filtered = _remove_answer_count_outliers(df)
 
     # Add question analysis
@@ -0,0 +1,83 @@
+"""Shared fixtures: a small deterministic results tree scored with the hashing embedding backend."""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+# benchmark/ modules import each other by bare name, as when run as scripts
+sys.path.insert(0, os.path.join(ROOT, 'benchmark'))
+sys.path.insert(0, ROOT)
+
+from embedding_backends import HashingEmbeddingBackend  # noqa: E402
+from novelty import NoveltyMatrix  # noqa: E402
+from results_journal import write_results  # noqa: E402
+
+MODELS = ['openai/gpt-4o-mini', 'anthropic/claude-3.5-sonnet', 'meta-llama/llama-3.1-8b.instruct']
+TEMPERATURES = ['0.7', '1.0']
+QUESTIONS = ['What could a city of 2.5 million do with its rooftops?',
+             'Invent a new sport. How is it scored?',
+             'Why might "ç, é and ü" matter to a parser?']
+WORDS = ['gardens', 'solar', 'panels', 'water', 'rain', 'bees', 'parks', 'cafes', 'rooftop', 'green']
+
+
+def make_results(seed: int = 0) -> dict:
+    """Results tree with real novelty scores from the hashing backend and seeded coherence scores.
+
+    Chain lengths vary from empty to six answers, and repeated words (and the odd
+    repeated answer) give a spread of dissimilarity scores.
+    """
+    rng = np.random.default_rng(seed)
+    backend = HashingEmbeddingBackend(64)
+    results = {'models': {}}
+    for model in MODELS:
+        for temperature in TEMPERATURES:
+            for question in QUESTIONS:
+                texts = []
+                for _ in range(rng.integers(0, 7)):
+                    if texts and rng.random() < 0.15:
+                        texts.append(texts[-1])
+                    else:
+                        texts.append(' '.join(rng.choice(WORDS, size=rng.integers(2, 6))))
+                matrix = NoveltyMatrix()
+                answers = []
+                for answer_num, (text, embedding) in enumerate(zip(texts, backend.embed_batch(texts)), 1):
+                    answers.append({
+                        'answer_num': answer_num,
+                        'answer': text,
+                        'coherence_score': int(rng.integers(0, 101)),
+                        'embedding_dissimilarity_score': float(matrix.novelty(embedding)),
+                        'processing_time': float(rng.random()),
+                    })
+                    matrix.add(embedding)
+                (results['models'].setdefault(model, {})
+                 .setdefault(temperature, {})[question]) = answers
+    return results
+
+
+
+def answered(results: dict) -> dict:
+    """`results` without empty chains, or temperatures and models left empty by removing them.
+
+    This is what survives a trip through the journal, the stream reader or Parquet.
+    """
+    tree = {}
+    for model, temps in results['models'].items():
+        for temperature, questions in temps.items():
+            for question, answers in questions.items():
+                if answers:
+                    tree.setdefault(model, {}).setdefault(temperature, {})[question] = answers
+    return {'models': tree}
+
+
+@pytest.fixture
+def results():
+    return make_results()
+
+
+@pytest.fixture
+def results_file(tmp_path, results):
+    path = str(tmp_path / 'results.json')
+    write_results(results, path)
+    return path
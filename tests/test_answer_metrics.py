@@ -0,0 +1,152 @@
+import numpy as np
+import pytest
+
+from answer_metrics import AnswerTable, ThresholdGrid, count_answers
+from conftest import QUESTIONS, answered, make_results
+
+
+def _shuffled_float_scores(results, seed=1):
+    """Copy of `results` with fractional coherence scores and each chain stored out of answer_num order."""
+    rng = np.random.default_rng(seed)
+    shuffled = {'models': {}}
+    for model, temps in results['models'].items():
+        for temperature, questions in temps.items():
+            for question, answers in questions.items():
+                answers = [dict(answer, coherence_score=answer['coherence_score'] + float(rng.random()))
+                           for answer in answers]
+                (shuffled['models'].setdefault(model, {})
+                 .setdefault(temperature, {})[question]) = [answers[i] for i in rng.permutation(len(answers))]
+    return shuffled
+
+
+# Reference implementations: the per-answer loops plot.py used before AnswerTable
+
+def _reference_metrics(results, min_embedding_threshold, min_coherence_threshold):
+    metrics = {}
+    for model_name, temp_data in results['models'].items():
+        metrics[model_name] = {}
+        for temp, questions in temp_data.items():
+            embedding_total = coherence_total = valid_answers = 0
+            for question, answers in questions.items():
+                for answer in answers:
+                    if (answer['embedding_dissimilarity_score'] < min_embedding_threshold or
+                            answer['coherence_score'] < min_coherence_threshold):
+                        break
+                    embedding_total += answer['embedding_dissimilarity_score']
+                    coherence_total += answer['coherence_score'] / 100
+                    valid_answers += 1
+            metrics[model_name][temp] = (embedding_total, coherence_total, valid_answers)
+    return metrics
+
+
+def _reference_cluster_metrics(results, cluster_questions, min_embedding_threshold, min_coherence_threshold):
+    metrics = {}
+    for model_name, temp_data in results['models'].items():
+        metrics[model_name] = {}
+        for temp, questions in temp_data.items():
+            embedding_total = coherence_total = valid_answers = 0
+            for question in cluster_questions:
+                if question in questions:
+                    for answer in questions[question]:
+                        if (answer['embedding_dissimilarity_score'] >= min_embedding_threshold and
+                                answer['coherence_score'] >= min_coherence_threshold):
+                            embedding_total += answer['embedding_dissimilarity_score']
+                            coherence_total += answer['coherence_score'] / 100
+                            valid_answers += 1
+            metrics[model_name][temp] = (embedding_total, coherence_total, valid_answers)
+    return metrics
+
+
+def _table_metrics(table, totals, question_mask=None):
+    if question_mask is not None:
+        totals = {name: values[:, question_mask] for name, values in totals.items()}
+    metrics = {model: {} for model in table.models}
+    for i, (model, temp) in enumerate(table.pairs):
+        metrics[model][temp] = (totals['embedding'][i].sum(), totals['coherence'][i].sum(),
+                                int(totals['answers'][i].sum()))
+    return metrics
+
+
+def _assert_metrics_equal(actual, expected):
+    assert actual.keys() == expected.keys()
+    for model in expected:
+        assert actual[model].keys() == expected[model].keys()
+        for temp, (embedding, coherence, answers) in expected[model].items():
+            assert actual[model][temp][0] == pytest.approx(embedding)
+            assert actual[model][temp][1] == pytest.approx(coherence)
+            assert actual[model][temp][2] == answers
+
+
+THRESHOLDS = [(0.15, 15.0), (0.0, 0.0), (0.5, 50.0), (0.8, 30.0), (2.0, 0.0)]
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_threshold_grid_matches_count_answers(seed):
+    data = make_results(seed)
+    for variant in (data, _shuffled_float_scores(data, seed)):
+        grid = ThresholdGrid(variant)
+        for coherence_threshold in range(101):
+            for dissimilarity_threshold in range(0, 101, 5):
+                assert (grid.counts(coherence_threshold, dissimilarity_threshold) ==
+                        count_answers(variant, coherence_threshold, dissimilarity_threshold))
+
+
+def test_threshold_grid_fractional_thresholds(results):
+    grid = ThresholdGrid(results)
+    for coherence_threshold, dissimilarity_threshold in [(79.5, 80.2), (0.1, 99.9), (99.5, 0.5), (100, 100)]:
+        assert (grid.counts(coherence_threshold, dissimilarity_threshold) ==
+                count_answers(results, coherence_threshold, dissimilarity_threshold))
+
+
+def test_threshold_grid_empty():
+    assert ThresholdGrid({}).counts(80, 80) == {}
+    assert ThresholdGrid({'models': {'m': {}}}).counts(80, 80) == count_answers({'models': {'m': {}}}) == {'m': 0}
+
+
+@pytest.mark.parametrize('thresholds', THRESHOLDS)
+def test_until_failure_matches_reference(results, thresholds):
+    table = AnswerTable.from_results(results)
+    _assert_metrics_equal(_table_metrics(table, table.totals(*thresholds).until_failure),
+                          _reference_metrics(results, *thresholds))
+
+
+@pytest.mark.parametrize('thresholds', THRESHOLDS)
+@pytest.mark.parametrize('cluster', [QUESTIONS[:1], QUESTIONS[1:], ['A question nobody asked']])
+def test_all_passing_matches_reference(results, thresholds, cluster):
+    table = AnswerTable.from_results(results)
+    _assert_metrics_equal(
+        _table_metrics(table, table.totals(*thresholds).all_passing, table.question_mask(cluster)),
+        _reference_cluster_metrics(results, cluster, *thresholds))
+
+
+def test_models_without_answers_are_kept():
+    results = {'models': {'a': {}, 'b': {'0.7': {'q': []}}, 'c': {'1.0': {'q': [
+        {'answer_num': 1, 'coherence_score': 90, 'embedding_dissimilarity_score': 0.9}]}}}}
+    table = AnswerTable.from_results(results)
+    assert table.models == ['a', 'b', 'c']
+    _assert_metrics_equal(_table_metrics(table, table.totals().until_failure), _reference_metrics(results, 0.15, 15.0))
+
+
+def test_chain_min_coherence(results):
+    table = AnswerTable.from_results(results)
+    expected = [min((a['coherence_score'] for a in answers), default=np.inf)
+                for temps in results['models'].values() for questions in temps.values()
+                for answers in questions.values()]
+    assert table.chain_min_coherence().tolist() == expected
+
+
+def test_answer_table_from_parquet_matches_results(results, results_file, tmp_path):
+    pytest.importorskip('pyarrow')
+    from results_columnar import to_parquet
+
+    parquet_file = str(tmp_path / 'results.parquet')
+    to_parquet(results_file, parquet_file)
+    from_results = AnswerTable.from_results(answered(results))
+    from_parquet = AnswerTable.from_parquet(parquet_file)
+
+    assert from_parquet.pairs == from_results.pairs
+    assert from_parquet.questions == from_results.questions
+    assert from_parquet.chain_starts.tolist() == from_results.chain_starts.tolist()
+    for rule in ('all_passing', 'until_failure'):
+        for name, values in getattr(from_results.totals(), rule).items():
+            np.testing.assert_allclose(getattr(from_parquet.totals(), rule)[name], values)
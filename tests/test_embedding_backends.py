@@ -0,0 +1,148 @@
+import hashlib
+import re
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import embedding_backends
+import models
+from embedding_backends import (DEFAULT_HASHING_DIM, DEFAULT_OPENAI_MODEL, DEFAULT_SENTENCE_TRANSFORMER,
+                                HashingEmbeddingBackend, OpenAIEmbeddingBackend, SentenceTransformerBackend,
+                                create_backend)
+from embedding_cache import EmbeddingCache
+
+TEXTS = ['Rooftop gardens and solar panels.', 'rooftop GARDENS and solar panels', 'Bees, parks and cafes.', '']
+
+
+def _reference_hashing(text, dim):
+    """Signed feature hashing of unigrams and bigrams, written out longhand."""
+    tokens = re.findall(r"\w+", text.lower())
+    features = tokens + [tokens[i] + ' ' + tokens[i + 1] for i in range(len(tokens) - 1)]
+    vector = np.zeros(dim)
+    for feature in features:
+        digest = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+        vector[digest % dim] += 1 if digest >> 63 else -1
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class FakeSentenceTransformer:
+    loads = 0
+
+    def __init__(self, model, device):
+        FakeSentenceTransformer.loads += 1
+        self.model = model
+
+    def encode(self, texts, **kwargs):
+        assert kwargs['normalize_embeddings']
+        return np.ones((len(texts), 3), dtype=np.float64) / np.sqrt(3)
+
+
+@pytest.fixture
+def sentence_transformers(monkeypatch):
+    FakeSentenceTransformer.loads = 0
+    monkeypatch.setattr(embedding_backends, 'SENTENCE_TRANSFORMERS_AVAILABLE', True)
+    monkeypatch.setattr(embedding_backends, 'SentenceTransformer', FakeSentenceTransformer, raising=False)
+
+
+@pytest.mark.parametrize('spec, cls, name', [
+    ('openai', OpenAIEmbeddingBackend, DEFAULT_OPENAI_MODEL),
+    ('openai:text-embedding-3-small', OpenAIEmbeddingBackend, 'text-embedding-3-small'),
+    ('hashing', HashingEmbeddingBackend, f'hashing-{DEFAULT_HASHING_DIM}'),
+    ('hashing:64', HashingEmbeddingBackend, 'hashing-64'),
+])
+def test_create_backend_parses_spec(spec, cls, name):
+    backend = create_backend(spec, get_openai_client=lambda: None)
+    assert isinstance(backend, cls)
+    assert backend.name == name
+
+
+def test_create_backend_sentence_transformers(sentence_transformers):
+    assert create_backend('sentence-transformers').name == f'sentence-transformers/{DEFAULT_SENTENCE_TRANSFORMER}'
+    assert create_backend('sentence-transformers:all-mpnet-base-v2').model == 'all-mpnet-base-v2'
+
+
+@pytest.mark.parametrize('spec', ['', 'cohere', 'hashing:wide', 'Hashing'])
+def test_create_backend_rejects_unknown_specs(spec):
+    with pytest.raises(ValueError):
+        create_backend(spec)
+
+
+def test_sentence_transformers_backend_needs_the_package(monkeypatch):
+    monkeypatch.setattr(embedding_backends, 'SENTENCE_TRANSFORMERS_AVAILABLE', False)
+    with pytest.raises(ImportError):
+        SentenceTransformerBackend()
+
+
+def test_sentence_transformers_backend_rejects_dimensions(sentence_transformers):
+    backend = SentenceTransformerBackend()
+    assert not backend.supports_dimensions and not backend.matryoshka
+    with pytest.raises(ValueError):
+        backend.embed_batch(TEXTS, dimensions=2)
+    vectors = backend.embed_batch(TEXTS) + backend.embed_batch(TEXTS[:1])
+    assert all(v.dtype == np.float32 and v.shape == (3,) for v in vectors)
+    assert FakeSentenceTransformer.loads == 1
+
+
+@pytest.mark.parametrize('dim, dimensions, size', [(1024, None, 1024), (64, None, 64), (64, 16, 16), (64, 256, 64)])
+def test_hashing_backend_matches_reference(dim, dimensions, size):
+    vectors = HashingEmbeddingBackend(dim).embed_batch(TEXTS, dimensions)
+    assert len(vectors) == len(TEXTS)
+    for text, vector in zip(TEXTS, vectors):
+        assert vector.dtype == np.float32 and vector.shape == (size,)
+        np.testing.assert_allclose(vector, _reference_hashing(text, size), rtol=1e-6, atol=1e-7)
+
+
+def test_hashing_backend_is_normalized_and_deterministic():
+    backend = HashingEmbeddingBackend(256)
+    first, same_words, other, empty = backend.embed_batch(TEXTS)
+    for vector in (first, same_words, other):
+        assert np.linalg.norm(vector) == pytest.approx(1.0, abs=1e-6)
+    assert not empty.any()
+    # Case and punctuation are ignored, so these texts share every feature
+    np.testing.assert_array_equal(first, same_words)
+    np.testing.assert_array_equal(first, HashingEmbeddingBackend(256).embed_batch(TEXTS[:1])[0])
+    assert float(first @ other) < 0.5
+    assert not HashingEmbeddingBackend.matryoshka and HashingEmbeddingBackend.supports_dimensions
+
+
+def test_openai_backend_orders_by_index_and_passes_dimensions():
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        data = [SimpleNamespace(index=i, embedding=[float(i), 1.0]) for i in range(len(kwargs['input']))]
+        return SimpleNamespace(data=data[::-1])
+
+    client = SimpleNamespace(embeddings=SimpleNamespace(create=create))
+    backend = OpenAIEmbeddingBackend(lambda: client)
+    vectors = backend.embed_batch(['a', 'b', 'c'], dimensions=2)
+    assert [v.tolist() for v in vectors] == [[0.0, 1.0], [1.0, 1.0], [2.0, 1.0]]
+    assert all(v.dtype == np.float32 for v in vectors)
+    assert calls == [{'model': DEFAULT_OPENAI_MODEL, 'input': ['a', 'b', 'c'], 'dimensions': 2}]
+    backend.embed_batch(['a'])
+    assert 'dimensions' not in calls[-1]
+    assert backend.matryoshka and not OpenAIEmbeddingBackend(lambda: client, 'text-embedding-ada-002').matryoshka
+
+
+@pytest.fixture
+def hashing_models(monkeypatch, tmp_path):
+    monkeypatch.setattr(models, 'embedding_cache', EmbeddingCache(path=str(tmp_path / 'cache.sqlite3')))
+    previous = models.get_embedding_backend()
+    models.configure_embedding_backend('hashing:64')
+    yield models
+    models.embedding_cache.close()
+    monkeypatch.setattr(models, 'embedding_backend', previous)
+
+
+def test_embed_many_uses_configured_backend_and_cache(hashing_models):
+    texts = TEXTS[:3] + TEXTS[:1]
+    vectors = hashing_models.embed_many(texts)
+    for text, vector in zip(texts, vectors):
+        np.testing.assert_allclose(vector, _reference_hashing(text, 64), rtol=1e-6, atol=1e-7)
+    assert hashing_models.embedding_cache_model() == 'hashing-64'
+    assert hashing_models.embedding_cache.get('hashing-64', TEXTS[2]) is not None
+    short = hashing_models.embed_many(TEXTS[:1], dimensions=16)[0]
+    assert short.shape == (16,)
+    hashing_models.check_embedding_dimensions(16)
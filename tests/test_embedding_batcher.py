@@ -0,0 +1,56 @@
+import threading
+
+import numpy as np
+import pytest
+
+from embedding_batcher import EmbeddingBatcher
+
+
+def _embed_lengths(texts):
+    return [np.full(2, float(len(text))) for text in texts]
+
+
+def test_batches_identical_texts_into_one_slot():
+    seen = []
+
+    def embed_batch(texts):
+        seen.append(list(texts))
+        return _embed_lengths(texts)
+
+    batcher = EmbeddingBatcher(embed_batch, max_wait=0.05)
+    futures = [batcher.submit(text) for text in ['ab', 'abc', 'ab']]
+    assert [future.result(timeout=1)[0] for future in futures] == [2.0, 3.0, 2.0]
+    assert seen == [['ab', 'abc']]
+    assert batcher.stats()['items'] == 3
+
+
+def test_cancelled_future_is_skipped():
+    release = threading.Event()
+    seen = []
+
+    def embed_batch(texts):
+        release.wait(1)
+        seen.append(list(texts))
+        return _embed_lengths(texts)
+
+    batcher = EmbeddingBatcher(embed_batch, max_wait=0)
+    blocker = batcher.submit('first')
+    cancelled = batcher.submit('cancelled')
+    assert cancelled.cancel()
+    release.set()
+
+    assert blocker.result(timeout=1)[0] == 5.0
+    assert batcher.submit('next').result(timeout=1)[0] == 4.0
+    assert ['cancelled'] not in seen
+    assert batcher._worker.is_alive()
+
+
+def test_wrong_vector_count_fails_the_batch():
+    def embed_batch(texts):
+        return _embed_lengths(texts)[:-1] if 'short' in texts else _embed_lengths(texts)
+
+    batcher = EmbeddingBatcher(embed_batch, max_wait=0)
+    with pytest.raises(ValueError, match="returned 0 vectors for 1 texts"):
+        batcher.submit('short').result(timeout=1)
+    assert batcher.submit('next').result(timeout=1)[0] == 4.0
+    assert batcher._worker.is_alive()
@@ -0,0 +1,161 @@
+import asyncio
+import threading
+import time
+from email.utils import formatdate
+
+import pytest
+
+from rate_limiter import AdaptiveRateLimiter, ProviderLimiter, _pause_from_headers
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+    def __init__(self, headers=None):
+        super().__init__("rate limited")
+        self.response = type('Response', (), {'headers': headers or {}})()
+
+
+def _release(limiter, outcome='ok', headers=None):
+    """Take and return one slot; returns the monotonic time bounds around the release."""
+    limiter.acquire()
+    before = time.monotonic()
+    limiter.release(outcome, headers)
+    return before, time.monotonic()
+
+
+def _release_without_waiting(limiter, outcome, headers):
+    """Return a slot taken while paused, as a request already in flight would."""
+    limiter.in_flight += 1
+    limiter.release(outcome, headers)
+
+
+def test_rate_limited_halves_limit_down_to_minimum():
+    limiter = ProviderLimiter(initial_limit=8, max_limit=50)
+    limits = []
+    for _ in range(5):
+        limiter.paused_until = 0.0
+        _release(limiter, 'rate_limited')
+        limits.append(limiter.limit)
+    assert limits == [4, 2, 1, 1, 1]
+    assert limiter.stats()['rate_limited'] == 5
+
+
+def test_success_grows_limit_additively():
+    limiter = ProviderLimiter(initial_limit=4, max_limit=5)
+    expected = 4.0
+    for _ in range(10):
+        _release(limiter)
+        expected = min(5, expected + 1 / expected)
+        assert limiter.limit == pytest.approx(expected)
+    assert limiter.limit == 5
+
+
+def test_error_leaves_limit_alone():
+    limiter = ProviderLimiter(initial_limit=8)
+    _release(limiter, 'error')
+    assert limiter.limit == 8 and limiter.paused_until == 0.0
+
+
+def test_rate_limited_without_retry_after_pauses_one_second():
+    limiter = ProviderLimiter()
+    before, after = _release(limiter, 'rate_limited', {})
+    assert before + 1.0 <= limiter.paused_until <= after + 1.0
+
+
+@pytest.mark.parametrize('headers, pause', [
+    ({'retry-after': '7'}, 7.0),
+    ({'retry-after': '2.5'}, 2.5),
+    ({'retry-after-ms': '1500', 'retry-after': '9'}, 1.5),
+    ({'x-ratelimit-remaining-requests': '0', 'x-ratelimit-reset-requests': '1m30s'}, 90.0),
+    ({'x-ratelimit-remaining': '0', 'x-ratelimit-reset': '250ms'}, 0.25),
+    ({'x-ratelimit-remaining': '0'}, 1.0),
+])
+def test_retry_after_sets_pause(headers, pause):
+    limiter = ProviderLimiter(initial_limit=8)
+    before, after = _release(limiter, 'rate_limited', headers)
+    assert limiter.limit == 4
+    assert before + pause <= limiter.paused_until <= after + pause
+
+
+def test_retry_after_on_success_pauses_without_growing():
+    limiter = ProviderLimiter(initial_limit=8)
+    before, after = _release(limiter, 'ok', {'retry-after': '3'})
+    assert limiter.limit == 8
+    assert before + 3 <= limiter.paused_until <= after + 3
+
+
+def test_pause_never_shortens():
+    limiter = ProviderLimiter()
+    _release(limiter, 'rate_limited', {'retry-after': '30'})
+    paused_until = limiter.paused_until
+    _release_without_waiting(limiter, 'rate_limited', {'retry-after': '1'})
+    assert limiter.paused_until == paused_until
+
+
+
+def test_pause_from_headers_parses_dates_and_ignores_junk():
+    assert 25 < _pause_from_headers({'retry-after': formatdate(time.time() + 30, usegmt=True)}) <= 31
+    assert _pause_from_headers({'retry-after': 'soon'}) is None
+    assert _pause_from_headers({'x-ratelimit-remaining': '12', 'x-ratelimit-reset': '5'}) is None
+    assert _pause_from_headers({}) is None
+
+
+def test_slot_reports_429_with_retry_after():
+    rate_limiter = AdaptiveRateLimiter(initial_limit=8)
+    before = time.monotonic()
+    with pytest.raises(RateLimitError):
+        with rate_limiter.slot('anthropic'):
+            raise RateLimitError({'retry-after': '4'})
+    stats = rate_limiter.stats()['anthropic']
+    assert stats['limit'] == 4 and stats['rate_limited'] == 1 and stats['in_flight'] == 0
+    assert rate_limiter.for_provider('anthropic').paused_until >= before + 4
+    # Other providers are unaffected
+    assert rate_limiter.for_provider('openai').limit == 8
+
+
+def test_slot_reads_headers_observed_on_success():
+    rate_limiter = AdaptiveRateLimiter(initial_limit=8)
+    with rate_limiter.slot('openai') as slot:
+        slot.observe({'x-ratelimit-remaining-requests': '0', 'x-ratelimit-reset-requests': '2s'})
+    limiter = rate_limiter.for_provider('openai')
+    assert limiter.limit == 8 and limiter.successes == 1
+    assert limiter.paused_until > time.monotonic() + 1.5
+
+
+def test_acquire_waits_out_the_pause():
+    limiter = ProviderLimiter()
+    _release(limiter, 'rate_limited', {'retry-after-ms': '200'})
+    paused_until = limiter.paused_until
+    limiter.acquire()
+    assert time.monotonic() >= paused_until
+    limiter.release()
+
+
+def test_acquire_blocks_at_limit_until_release():
+    limiter = ProviderLimiter(initial_limit=1)
+    limiter.acquire()
+    acquired = threading.Event()
+    thread = threading.Thread(target=lambda: (limiter.acquire(), acquired.set()))
+    thread.start()
+    assert not acquired.wait(0.1)
+    assert limiter.stats()['queue_depth'] == 1
+    limiter.release()
+    assert acquired.wait(1.0)
+    thread.join()
+    assert limiter.stats()['in_flight'] == 1 and limiter.stats()['max_queue_depth'] == 1
+
+
+def test_aacquire_wakes_on_release_from_another_thread():
+    limiter = ProviderLimiter(initial_limit=1)
+
+    async def main():
+        await limiter.aacquire()
+        waiter = asyncio.create_task(limiter.aacquire())
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        threading.Timer(0.05, limiter.release).start()
+        await asyncio.wait_for(waiter, 1.0)
+
+    asyncio.run(main())
+    assert limiter.in_flight == 1 and limiter.waiting == 0
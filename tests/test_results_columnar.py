@@ -0,0 +1,68 @@
+import json
+
+import numpy as np
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from conftest import answered  # noqa: E402
+from results_columnar import load_arrays, load_frame, to_json, to_parquet  # noqa: E402
+
+
+@pytest.fixture
+def parquet_file(tmp_path, results_file):
+    path = str(tmp_path / 'results.parquet')
+    to_parquet(results_file, path)
+    return path
+
+
+def test_round_trip_keeps_every_answer(results, tmp_path):
+    # Extra fields of any shape ride along in the 'extra' column, and missing scores stay missing
+    chain = next(chain for temps in results['models'].values()
+                 for questions in temps.values() for chain in questions.values() if chain)
+    chain[0].update(stop_reason='coherence', telemetry={'generate': {'calls': 2, 'cost': None}},
+                    llm_dissimilarity_score=0.25)
+    chain[-1].pop('processing_time')
+    results_file = str(tmp_path / 'results.json')
+    with open(results_file, 'w') as f:
+        json.dump(results, f)
+    parquet_file = str(tmp_path / 'results.parquet')
+    to_parquet(results_file, parquet_file)
+
+    json_file = str(tmp_path / 'round_trip.json')
+    rows = to_json(parquet_file, json_file)
+
+    with open(json_file) as f:
+        round_trip = json.load(f)
+    assert round_trip == answered(results)
+    assert rows == sum(len(chain) for temps in results['models'].values()
+                       for questions in temps.values() for chain in questions.values())
+
+
+def test_coherence_stays_an_integer(results_file, parquet_file, tmp_path):
+    json_file = str(tmp_path / 'round_trip.json')
+    to_json(parquet_file, json_file)
+    with open(json_file) as f:
+        scores = [answer['coherence_score'] for temps in json.load(f)['models'].values()
+                  for questions in temps.values() for chain in questions.values() for answer in chain]
+    assert scores and all(type(score) is int for score in scores)
+
+
+def test_load_arrays_matches_answers(results, parquet_file):
+    arrays = load_arrays(parquet_file)
+    answers = [(model, temperature, question, answer)
+               for model, temps in results['models'].items()
+               for temperature, questions in temps.items()
+               for question, chain in questions.items() for answer in chain]
+    assert [arrays['model_categories'][i] for i in arrays['model']] == [a[0] for a in answers]
+    assert [arrays['question_categories'][i] for i in arrays['question']] == [a[2] for a in answers]
+    assert arrays['answer_num'].tolist() == [a[3]['answer_num'] for a in answers]
+    assert arrays['embedding_dissimilarity_score'].tolist() == [a[3]['embedding_dissimilarity_score'] for a in answers]
+    assert np.isnan(arrays['llm_dissimilarity_score']).all()
+    assert 'answer' not in arrays
+
+
+def test_load_frame_reads_text_only_when_asked(parquet_file):
+    assert 'answer' not in load_frame(parquet_file).columns
+    assert 'answer' in load_frame(parquet_file, with_text=True).columns
+
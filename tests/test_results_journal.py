@@ -0,0 +1,115 @@
+import copy
+import json
+
+from conftest import answered
+from results_journal import ResultsJournal, compact, journal_path, replay_journal, write_chains, write_results
+from results_stream import iter_chains
+
+
+def _journal_all(results, path):
+    journal = ResultsJournal(path)
+    for model, temps in results['models'].items():
+        for temperature, questions in temps.items():
+            for question, answers in questions.items():
+                for answer in answers:
+                    journal.append(model, temperature, question, answer)
+    journal.close()
+
+
+def _count(results):
+    return sum(len(answers) for temps in results['models'].values()
+               for questions in temps.values() for answers in questions.values())
+
+
+def test_replay_rebuilds_results(results, tmp_path):
+    path = str(tmp_path / 'results.journal.jsonl')
+    _journal_all(results, path)
+
+    replayed = {}
+    added = replay_journal(replayed, path)
+
+    assert added == _count(results)
+    assert replayed == answered(results)
+
+
+def test_replay_skips_answers_already_present_and_sorts(results, tmp_path):
+    path = str(tmp_path / 'results.journal.jsonl')
+    model, temperature, question = 'openai/gpt-4o-mini', '0.7', 'Invent a new sport. How is it scored?'
+    existing = {'models': {model: {temperature: {question: [{'answer_num': 2, 'answer': 'kept'}]}}}}
+    journal = ResultsJournal(path)
+    for answer_num in (3, 2, 1):
+        journal.append(model, temperature, question, {'answer_num': answer_num, 'answer': f'new {answer_num}'})
+    journal.append(model, temperature, question, {'answer_num': 3, 'answer': 'duplicate'})
+    journal.close()
+
+    assert replay_journal(existing, path) == 2
+    assert existing['models'][model][temperature][question] == [
+        {'answer_num': 1, 'answer': 'new 1'}, {'answer_num': 2, 'answer': 'kept'}, {'answer_num': 3, 'answer': 'new 3'}]
+    # Replaying the same journal again adds nothing
+    assert replay_journal(existing, path) == 0
+
+
+def test_replay_ignores_truncated_last_line(tmp_path):
+    path = str(tmp_path / 'results.journal.jsonl')
+    journal = ResultsJournal(path)
+    journal.append('m', 0.7, 'q', {'answer_num': 1, 'answer': 'a'})
+    journal.close()
+    with open(path, 'a') as f:
+        f.write('{"model": "m", "temperature": "0.7", "question": "q", "answer": {"answer_n')
+
+    results = {}
+    assert replay_journal(results, path) == 1
+    assert results == {'models': {'m': {'0.7': {'q': [{'answer_num': 1, 'answer': 'a'}]}}}}
+
+
+def test_replay_missing_journal(tmp_path):
+    results = {'models': {}}
+    assert replay_journal(results, str(tmp_path / 'missing.jsonl')) == 0
+    assert results == {'models': {}}
+
+
+def test_compact_folds_journal_into_results_file(results, tmp_path):
+    results_file = str(tmp_path / 'results.json')
+    # The results file holds the first answer of every chain, the journal all of them
+    first_answers = copy.deepcopy(results)
+    for temps in first_answers['models'].values():
+        for questions in temps.values():
+            for question, answers in questions.items():
+                questions[question] = answers[:1]
+    write_results(first_answers, results_file)
+    _journal_all(results, journal_path(results_file))
+
+    added = compact(results_file)
+
+    with open(results_file) as f:
+        compacted = json.load(f)
+    assert compacted == results
+    assert added == _count(results) - _count(first_answers)
+    with open(journal_path(results_file)) as f:
+        assert f.read() == ''
+    assert compact(results_file) == 0
+
+
+def test_truncate_empties_journal(tmp_path):
+    path = str(tmp_path / 'results.journal.jsonl')
+    journal = ResultsJournal(path)
+    journal.append('m', '0.7', 'q', {'answer_num': 1})
+    journal.truncate()
+    journal.append('m', '0.7', 'q', {'answer_num': 2})
+    journal.close()
+
+    results = {}
+    assert replay_journal(results, path) == 1
+    assert results['models']['m']['0.7']['q'] == [{'answer_num': 2}]
+
+
+def test_write_chains_matches_write_results(results, results_file, tmp_path):
+    chains_file = str(tmp_path / 'chains.json')
+    written = write_chains(iter_chains(results_file), chains_file)
+
+    expected_file = str(tmp_path / 'expected.json')
+    write_results(answered(results), expected_file)
+    with open(chains_file) as f, open(expected_file) as g:
+        assert f.read() == g.read()
+    assert written == sum(len(questions) for temps in answered(results)['models'].values()
+                          for questions in temps.values())
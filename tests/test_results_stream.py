@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+import results_stream
+from results_journal import write_results
+from results_stream import iter_answers, iter_chains, load_scores
+
+
+def _tree_answers(path):
+    with open(path) as f:
+        return list(results_stream._iter_answers_tree(json.load(f)))
+
+
+@pytest.fixture(params=[True, False], ids=['ijson', 'json.load'])
+def reader(request, monkeypatch):
+    if request.param and not results_stream.IJSON_AVAILABLE:
+        pytest.skip("ijson is not installed")
+    monkeypatch.setattr(results_stream, 'IJSON_AVAILABLE', request.param)
+
+
+def test_iter_answers_matches_json_load(reader, results, results_file):
+    answers = list(iter_answers(results_file))
+    assert answers == _tree_answers(results_file)
+    assert len(answers) == sum(len(answers) for temps in results['models'].values()
+                               for questions in temps.values() for answers in questions.values())
+
+
+def test_keys_with_dots_and_nested_fields(reader, tmp_path):
+    path = str(tmp_path / 'results.json')
+    results = {'models': {'meta-llama/llama-3.1-8b.instruct': {'0.7': {
+        'What does 2.5 mean? Say "why".': [
+            {'answer_num': 1, 'answer': 'ünïcode', 'coherence_score': 80,
+             'embedding_dissimilarity_score': 0.1 + 0.2, 'telemetry': {'generate': {'calls': 1, 'cost': None}},
+             'tags': ['a', {'b': [1.5, None, True]}]}]}}},
+        'metadata': {'models': ['not', 'answers']}}
+    with open(path, 'w') as f:
+        json.dump(results, f)
+
+    assert list(iter_answers(path)) == _tree_answers(path) == [
+        ('meta-llama/llama-3.1-8b.instruct', '0.7', 'What does 2.5 mean? Say "why".',
+         results['models']['meta-llama/llama-3.1-8b.instruct']['0.7']['What does 2.5 mean? Say "why".'][0])]
+
+
+@pytest.mark.parametrize('content', [[{'answer': 'x'}], {}, {'results': []}, {'models': []}],
+                         ids=['list', 'empty', 'other-key', 'models-list'])
+def test_files_without_a_models_tree_yield_nothing(reader, tmp_path, content):
+    path = str(tmp_path / 'results.json')
+    with open(path, 'w') as f:
+        json.dump(content, f)
+    assert list(iter_answers(path)) == []
+
+
+def test_iter_chains_groups_each_chain(reader, results, results_file):
+    chains = list(iter_chains(results_file))
+    expected = [(model, temperature, question, answers)
+                for model, temps in results['models'].items()
+                for temperature, questions in temps.items()
+                for question, answers in questions.items() if answers]
+    assert chains == expected
+
+
+def test_load_scores_drops_text(reader, results, results_file):
+    # Models and temperatures with no answers at all are kept too, as json.load keeps them
+    results['models']['empty-model'] = {}
+    results['models']['empty-temps'] = {'0.7': {}}
+    write_results(results, results_file)
+
+    with open(results_file) as f:
+        expected = json.load(f)
+    for temps in expected['models'].values():
+        for questions in temps.values():
+            for answers in questions.values():
+                for answer in answers:
+                    del answer['answer']
+    assert load_scores(results_file) == expected
@@ -1,4 +1,5 @@
-import json
+from benchmark.results_stream import load_scores
+from benchmark.answer_metrics import ThresholdGrid
 import matplotlib.pyplot as plt
 from matplotlib.widgets import Slider
 
@@ -12,45 +13,16 @@ COMPANY_COLORS = {
     'mistralai': '#F54E42'    # Mistral red
 }
 
-def count_answers(data, coherence_threshold=80, dissimilarity_threshold=80):
-    """
-    For each model and each question, count answers sequentially until an answer
-    fails either the coherence or dissimilarity threshold.
-    
-    Parameters:
-      - coherence_threshold: minimum coherence_score required.
-      - dissimilarity_threshold: minimum (embedding_dissimilarity_score*100) required.
-    
-    Returns:
-      A dict mapping model names to total valid answer counts.
-    """
-    counts = {}
-    for model, threshold_groups in data.get('models', {}).items():
-        total_count = 0
-        for group_key, questions in threshold_groups.items():
-            for question, answers in questions.items():
-                # Ensure answers are processed in order
-                answers_sorted = sorted(answers, key=lambda a: a.get('answer_num', 0))
-                for ans in answers_sorted:
-                    if (ans.get('coherence_score', 0) < coherence_threshold or 
-                        ans.get('embedding_dissimilarity_score', 0) * 100 < dissimilarity_threshold):
-                        # Stop counting further answers for this question.
-                        break
-                    total_count += 1
-        counts[model] = total_count
-    return counts
-
 # Load JSON data from file (adjust the file name/path as needed)
-with open('results/results.json', 'r') as f:
-    data = json.load(f)
+data = load_scores('results/results.json')
+threshold_grid = ThresholdGrid(data)
 
 # Initial threshold values for both metrics.
 init_coherence_threshold = 80
 init_dissimilarity_threshold = 80
 
 # Calculate initial counts and sort models (highest count at the top)
-model_counts = count_answers(data, coherence_threshold=init_coherence_threshold, 
-                             dissimilarity_threshold=init_dissimilarity_threshold)
+model_counts = threshold_grid.counts(init_coherence_threshold, init_dissimilarity_threshold)
 sorted_models = sorted(model_counts.items(), key=lambda x: x[1], reverse=True)
 models = [m for m, _ in sorted_models]
 counts = [cnt for _, cnt in sorted_models]
@@ -81,9 +53,8 @@ def update(val):
     coherence_val = coherence_slider.val
     dissimilarity_val = dissimilarity_slider.val
     
-    # Recalculate answer counts based on current thresholds.
-    model_counts = count_answers(data, coherence_threshold=coherence_val, 
-                                 dissimilarity_threshold=dissimilarity_val)
+    # Look up answer counts for the current thresholds in the precomputed grid.
+    model_counts = threshold_grid.counts(coherence_val, dissimilarity_val)
     sorted_models = sorted(model_counts.items(), key=lambda x: x[1], reverse=True)
     models_new = [m for m, cnt in sorted_models]
     counts_new = [cnt for m, cnt in sorted_models]
@@ -7,6 +7,11 @@ import json
 import statistics
 from collections import defaultdict
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmark'))
+from results_stream import iter_answers
+from token_count import count_tokens
 
 def estimate_tokens(text):
     """Estimate tokens using ~4 characters per token rule"""
@@ -14,6 +19,18 @@ def estimate_tokens(text):
         return 0
     return len(text) / 4
 
+def answer_tokens(result, answer_text, answer_len):
+    """Tokens in an answer's text, counted when the text is available, else estimated from its length.
+
+    The benchmark's recorded generate completion_tokens are not used: they include
+    reasoning tokens and every call made for the answer, not just the answer text.
+    """
+    if 'answer_tokens' in result:
+        return result['answer_tokens']
+    if answer_text:
+        return count_tokens(answer_text)
+    return estimate_tokens("x" * answer_len)
+
 def analyze_results_file(filepath):
     """Analyze a single results file for token usage patterns"""
     if not os.path.exists(filepath):
@@ -23,8 +40,24 @@ def analyze_results_file(filepath):
     print(f"\nAnalyzing: {filepath}")
     
     try:
-        with open(filepath, 'r') as f:
-            data = json.load(f)
+        # The benchmark's models format is streamed, keeping only answer lengths and token counts
+        results = [
+            {
+                'model': model,
+                'temperature': temp,
+                'question': question,
+                'answer_num': answer_data.get('answer_num', 1),
+                'answer_length': len(answer_data.get('answer', '')),
+                'processing_time': answer_data.get('processing_time', 0),
+                'coherence_score': answer_data.get('coherence_score', 0),
+                'answer_tokens': count_tokens(answer_data.get('answer', ''))
+            }
+            for model, temp, question, answer_data in iter_answers(filepath)
+        ]
+        data = None
+        if not results:
+            with open(filepath, 'r') as f:
+                data = json.load(f)
     except Exception as e:
         print(f"Error loading {filepath}: {e}")
         return None
@@ -36,36 +69,21 @@ def analyze_results_file(filepath):
     scenario_data = []
     
     # Handle different file formats
-    if 'results' in data:
+    if data is None:
+        pass
+    elif 'results' in data:
         results = data['results']
     elif isinstance(data, list):
         results = data
     elif 'models' in data:
-        # Handle the models format from cot.json and similar files
+        # A models-format file with no answers
         results = []
-        for model, temp_data in data['models'].items():
-            for temp, questions in temp_data.items():
-                for question, answers in questions.items():
-                    for answer_data in answers:
-                        # Convert to uniform format
-                        result = {
-                            'model': model,
-                            'temperature': temp,
-                            'question': question,
-                            'answer': answer_data.get('answer', ''),
-                            'answer_num': answer_data.get('answer_num', 1),
-                            'answer_length': len(answer_data.get('answer', '')),
-                            'processing_time': answer_data.get('processing_time', 0),
-                            'coherence_score': answer_data.get('coherence_score', 0)
-                        }
-                        results.append(result)
     else:
         # Try to find results in nested structure
         results = []
         for key, value in data.items():
             if isinstance(value, list):
                 results.extend(value)
-    
     if not results:
         print("No results found in expected format")
         return None
@@ -89,9 +107,10 @@ def analyze_results_file(filepath):
         elif 'answer_length' in result:
             answer_len = result['answer_length']
         
+        tokens = answer_tokens(result, answer_text, answer_len)
         if answer_len > 0:
             answer_lengths.append(answer_len)
-            token_estimates.append(estimate_tokens(answer_text or "x" * answer_len))
+            token_estimates.append(tokens)
         
         # Track processing time
         if 'processing_time' in result:
@@ -101,7 +120,7 @@ def analyze_results_file(filepath):
         scenario_key = f"{result.get('model', 'unknown')}_{result.get('question', 'unknown')}"
         scenario_answers[scenario_key].append({
             'length': answer_len,
-            'tokens': estimate_tokens(answer_text or "x" * answer_len),
+            'tokens': tokens,
             'answer_num': result.get('answer_num', 1),
             'timeout': result.get('timed_out', False)
         })
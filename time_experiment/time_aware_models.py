@@ -4,17 +4,20 @@
 
 from openai import OpenAI
 import os
+import sys
 import time
-import signal
 from functools import lru_cache
 from retry import retry
-from contextlib import contextmanager
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmark'))
+from streaming import STREAM_OPTIONS, StreamTimeout, collect_stream, request_timeout, timed_request
 
-#client for OpenRouter for chat completions
+
+#client for OpenRouter for chat completions; no sdk retries so the time limits also bound the wait for headers
 router_client = OpenAI(
     base_url="https://openrouter.ai/api/v1",
-    api_key=os.environ.get("OPEN_ROUTER_KEY")
+    api_key=os.environ.get("OPEN_ROUTER_KEY"),
+    max_retries=0
 )
 
 #client for oai for embeddings
@@ -22,59 +25,51 @@ openai_client = OpenAI(
     api_key=os.environ.get("OPENAI_API_KEY")
 )
 
-class TimeoutError(Exception):
-    pass
-
-#using unix sigalrm to interrupt the long api calls; so time expires the timeouterror gets raised and then breaks the api request
-@contextmanager
-def time_limit(seconds):
-    def signal_handler(signum, frame):
-        raise TimeoutError(f"Request timed out after {seconds} seconds")
-    
-    old_handler = signal.signal(signal.SIGALRM, signal_handler)
-    signal.alarm(seconds)
-    try:
-        yield
-    finally:
-        signal.alarm(0)
-        signal.signal(signal.SIGALRM, old_handler)
-
+#streaming the response so the time limits work from any thread (sigalrm only works in the main thread);
+#timeout_seconds bounds the whole call, idle_timeout_seconds the wait for each chunk
 @retry(tries=3, delay=1, backoff=2) #retrying function calls for if api calls fails, just didnt want manual retry logic
-def chat_with_model_timed(prompt: str, model: str, max_tokens: int = 4000, temperature: float = 0, timeout_seconds: int = None) -> dict:
+def chat_with_model_timed(prompt: str, model: str, max_tokens: int = 4000, temperature: float = 0, timeout_seconds: int = None,
+                          idle_timeout_seconds: int = None) -> dict:
     """making the api call, with limits, returning dict of response, processing time, timeout stuff etc"""
     start_time = time.time()
     
     params = {
         "model": model,
         "messages": [{"role": "user", "content": prompt}],
-        "temperature": temperature
+        "temperature": temperature,
+        "stream": True,
+        "stream_options": STREAM_OPTIONS
     }
+    if timeout_seconds or idle_timeout_seconds:
+        params["timeout"] = request_timeout(idle_timeout_seconds, timeout_seconds)
     
     try:
-        if timeout_seconds:
-            with time_limit(timeout_seconds):
-                response = router_client.chat.completions.create(**params)
-        else:
-            response = router_client.chat.completions.create(**params)
+        sent = time.monotonic()
+        with timed_request(sent, timeout_seconds, idle_timeout_seconds):
+            stream = router_client.chat.completions.create(**params)
+        completion = collect_stream(stream, timeout=timeout_seconds, idle_timeout=idle_timeout_seconds, start=sent)
         
         end_time = time.time()
         processing_time = end_time - start_time
         
         return {
-            'content': response.choices[0].message.content,
+            'content': completion.content,
             'processing_time': processing_time,
+            'time_to_first_token': completion.time_to_first_token,
             'timed_out': False,
             'timeout_limit': timeout_seconds
         }
         
-    except TimeoutError as e:
+    except StreamTimeout as e:
         end_time = time.time()
         processing_time = end_time - start_time
         
         return {
-            'content': f"[TIMEOUT] Response exceeded {timeout_seconds} second limit",
+            'content': f"[TIMEOUT] Response exceeded {e.limit:g} second {'limit' if e.reason == 'total' else 'idle limit'}",
             'processing_time': processing_time,
+            'time_to_first_token': e.time_to_first_token,
             'timed_out': True,
+            'timeout_reason': e.reason,
             'timeout_limit': timeout_seconds
         }
 